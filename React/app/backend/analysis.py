@@ -0,0 +1,243 @@
+import os
+import logging
+from pathlib import Path
+import torch
+from ultralytics.engine.results import Results
+from model_registry import registry as model_registry
+from inference import get_engine, load_image, decode_image, result_to_detections
+from tiling import predict_tiled
+from cascade import predict_cascade, CASCADE_MODES
+from video import predict_video
+from result_cache import result_cache, file_sha256, weights_sha256
+from detections import store_detections
+from events import record_analysis_event
+from rollups import record_analysis as record_rollups
+from runtimes import backend_id
+from metrics import timed_stage
+from similarity import get_index, phash, to_signed
+from db_models import ImageHash
+from settings import (
+    MODEL_PATH, OUTPUT_FOLDER, VIDEO_EXTENSIONS, INFERENCE_MODE, RESULT_CACHE_ENABLED, PHASH_ENABLED, PHASH_REUSE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_video(file_path: str) -> bool:
+    return Path(file_path).suffix.lower().lstrip('.') in VIDEO_EXTENSIONS
+
+
+def output_path_for(file_path: str, output_dir: str = OUTPUT_FOLDER) -> Path:
+    input_path = Path(file_path)
+    suffix = '.mp4' if is_video(file_path) else input_path.suffix
+    output_path = Path(output_dir) / f"{input_path.stem}_pred{suffix}"
+    # The previous output may be a hard link into the result cache; never write through it
+    if output_path.exists():
+        output_path.unlink()
+    return output_path
+
+
+def predict_and_save(file_path: str, model_path: str = MODEL_PATH, output_dir: str = OUTPUT_FOLDER,
+                     mode: str = INFERENCE_MODE) -> str:
+    output_path, _ = analyze_path(file_path, model_path, output_dir, mode)
+    return output_path
+
+
+def analyze_path(file_path: str, model_path: str = MODEL_PATH, output_dir: str = OUTPUT_FOLDER,
+                 mode: str = INFERENCE_MODE, data: bytes = None, db=None, image=None) -> tuple:
+    """Analyzes the image or video at ``file_path``.
+
+    With ``data``, an image is decoded from those bytes instead of being read
+    back from ``file_path``, which then only names the output and may not
+    exist yet; ``image`` skips the decode for callers that already have it.
+    With ``db``, an image close enough to an earlier analysis by perceptual
+    hash reuses that analysis instead of running the model.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if is_video(file_path):
+        return analyze_video(file_path, model_path, output_dir)
+
+    # Per-stage seconds, kept in the analysis metadata so slow jobs can be diagnosed later
+    timings = {}
+    try:
+        with timed_stage('model', timings):
+            model = model_registry.get(model_path)
+    except Exception as e:
+        logger.error(f"Failed to load model from {model_path}: {e}")
+        raise RuntimeError(f"Failed to load model from {model_path}: {e}")
+
+    try:
+        with timed_stage('decode', timings):
+            if image is None:
+                image = load_image(file_path) if data is None else decode_image(data)
+    except Exception as e:
+        logger.error(f"Prediction failed for file {file_path}: {e}")
+        raise RuntimeError(f"Prediction failed for file {file_path}: {e}")
+
+    image_hash = None
+    if db is not None and PHASH_ENABLED:
+        with timed_stage('phash', timings):
+            image_hash = phash(image)
+        reused = reuse_similar(db, image, image_hash, file_path, model_path, output_dir, mode, timings)
+        if reused:
+            return reused
+
+    try:
+        logger.info(f"Running {mode} prediction on {file_path}")
+        if mode in CASCADE_MODES:
+            # Times its own screen and inference stages
+            results = [predict_cascade(model_path, image, tiled=mode == 'tiled-cascade', path=file_path,
+                                       timings=timings)]
+        else:
+            with timed_stage('inference', timings):
+                if mode == 'tiled':
+                    results = [predict_tiled(model, image, path=file_path)]
+                else:
+                    # Single images go through the engine so concurrent callers share a batch
+                    results = [get_engine(model_path).predict(image)]
+    except Exception as e:
+        logger.error(f"Prediction failed for file {file_path}: {e}")
+        raise RuntimeError(f"Prediction failed for file {file_path}: {e}")
+
+    output_path = output_path_for(file_path, output_dir)
+
+    try:
+        logger.info(f"Saving prediction result to {output_path}")
+        with timed_stage('save', timings):
+            results[0].save(output_path)
+    except Exception as e:
+        logger.error(f"Failed to save prediction result to {output_path}: {e}")
+        raise RuntimeError(f"Failed to save prediction result to {output_path}: {e}")
+
+    metadata = {
+        'type': 'image',
+        'mode': mode,
+        'detections': result_to_detections(results[0]),
+        'timings': timings,
+    }
+    if hasattr(results[0], 'cascade'):
+        metadata['cascade'] = results[0].cascade
+    if image_hash is not None:
+        metadata['phash'] = format(image_hash, '016x')
+    return str(output_path), metadata
+
+
+def similarity_key(model_path: str = MODEL_PATH, mode: str = INFERENCE_MODE) -> str:
+    # Only results from the same weights, mode and runtime are interchangeable
+    return f"{weights_sha256(model_path)[:12]}:{mode}:{backend_id()}"
+
+
+def reuse_similar(db, image, image_hash: int, file_path: str, model_path: str, output_dir: Path, mode: str,
+                  timings: dict):
+    """Returns ``(output_path, metadata)`` built from a near-duplicate's detections, or None.
+
+    The earlier boxes are drawn onto this image, so the output shows the
+    frame that was uploaded. With ``PHASH_REUSE=empty`` only neighbours
+    without detections are reused; frames near a defect still run the model.
+    """
+    with timed_stage('similarity_lookup', timings):
+        neighbour, distance = get_index(similarity_key(model_path, mode)).find(db, image_hash)
+    if neighbour is None:
+        return None
+    detections = (neighbour.analysis_metadata or {}).get('detections') or []
+    if detections and PHASH_REUSE != 'all':
+        return None
+
+    logger.info(f"Reusing analysis {neighbour.id} for {file_path} (phash distance {distance})")
+    output_path = output_path_for(file_path, output_dir)
+    boxes = torch.tensor([d['bbox'] + [d['confidence'], d['class_id']] for d in detections],
+                         dtype=torch.float32).reshape(-1, 6)
+    try:
+        with timed_stage('save', timings):
+            names = model_registry.get(model_path).names
+            Results(orig_img=image, path=file_path, names=names, boxes=boxes).save(str(output_path))
+    except Exception as e:
+        logger.error(f"Failed to save prediction result to {output_path}: {e}")
+        raise RuntimeError(f"Failed to save prediction result to {output_path}: {e}")
+
+    return str(output_path), {
+        'type': 'image',
+        'mode': mode,
+        'detections': detections,
+        'timings': timings,
+        'phash': format(image_hash, '016x'),
+        'similar_to': neighbour.id,
+        'phash_distance': distance,
+    }
+
+
+def analyze_video(file_path: str, model_path: str = MODEL_PATH, output_dir: str = OUTPUT_FOLDER) -> tuple:
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    output_path = output_path_for(file_path, output_dir)
+    timings = {}
+    try:
+        with timed_stage('video', timings):
+            output_path, metadata = predict_video(file_path, model_path, output_path)
+        return output_path, dict(metadata, timings=timings)
+    except Exception as e:
+        logger.error(f"Video analysis failed for file {file_path}: {e}")
+        raise RuntimeError(f"Video analysis failed for file {file_path}: {e}")
+
+
+def cached_result(file_path: str, model_path: str = MODEL_PATH, output_dir: str = OUTPUT_FOLDER,
+                  mode: str = INFERENCE_MODE, content_hash: str = None):
+    if not RESULT_CACHE_ENABLED or not os.path.exists(model_path):
+        return None, None
+    # Exported and quantized runtimes give slightly different boxes, so each gets its own entries
+    timings = {}
+    with timed_stage('cache_lookup', timings):
+        key = result_cache.key(content_hash or file_sha256(file_path), model_path, f"{mode}:{backend_id()}")
+        entry = result_cache.get(key)
+        if entry is None:
+            return key, None
+        output_path = result_cache.materialize(entry, str(output_path_for(file_path, output_dir)))
+    logger.info(f"Result cache hit for {file_path}")
+    # The stored timings belong to the analysis that filled the cache, not to this one
+    return key, (output_path, dict(entry['metadata'], cache_hit=True, timings=timings))
+
+
+def analyze_with_cache(file_path: str, model_path: str = MODEL_PATH, output_dir: str = OUTPUT_FOLDER,
+                       mode: str = INFERENCE_MODE, content_hash: str = None, data: bytes = None,
+                       db=None, image=None) -> tuple:
+    key, cached = cached_result(file_path, model_path, output_dir, mode, content_hash)
+    if cached:
+        return cached
+
+    output_path, metadata = analyze_path(file_path, model_path, output_dir, mode, data, db, image)
+    if key:
+        try:
+            result_cache.put(key, output_path, metadata)
+        except OSError as e:
+            logger.warning(f"Failed to store result for {file_path} in cache: {e}")
+    return output_path, dict(metadata, cache_hit=False)
+
+
+def run_analysis(db, analysis) -> None:
+    upload = analysis.upload
+    file_path = upload.original_path
+    if not os.path.exists(file_path):
+        raise RuntimeError(f"File not found at path: {file_path}")
+
+    output_path, metadata = analyze_with_cache(file_path, content_hash=upload.content_hash, db=db)
+    complete_analysis(db, analysis, output_path, metadata)
+
+
+def complete_analysis(db, analysis, output_path: str, metadata: dict, model_path: str = MODEL_PATH) -> None:
+    timings = dict(metadata.get('timings') or {})
+    metadata = dict(metadata, model_version=weights_sha256(model_path)[:12], backend=backend_id())
+    analysis.result_path = os.path.relpath(output_path, start=OUTPUT_FOLDER)
+    analysis.status = 'completed'
+    with timed_stage('db_write', timings):
+        if analysis.id is None:
+            db.flush()
+        store_detections(db, analysis, analysis.upload.user_id, metadata)
+        record_rollups(db, analysis, analysis.upload.user_id, metadata)
+        # Index images the model actually ran on; reused results would let matches drift frame to frame
+        if metadata.get('phash') and not metadata.get('similar_to') and not metadata.get('cache_hit'):
+            db.add(ImageHash(analysis_id=analysis.id, phash=to_signed(int(metadata['phash'], 16)),
+                             model_key=similarity_key(model_path, metadata.get('mode', INFERENCE_MODE))))
+    # Assigned last so the stored metadata includes the detection insert; the commit itself is timed by the caller
+    analysis.analysis_metadata = dict(metadata, timings=timings)
+    record_analysis_event(db, analysis)
@@ -1,13 +1,39 @@
 import os
+import time
+import uuid
+import queue
+import threading
 from flask_cors import CORS
-from werkzeug.utils import secure_filename
-from pathlib import Path
-from ultralytics import YOLO
-from database import init_db, get_db
-from db_models import User, Upload, Analysis, Subscription
+from werkzeug.utils import safe_join, secure_filename
+from database import init_db, get_db, open_session, pool_stats
+from model_registry import registry as model_registry
+from inference import engine_stats
+from process_stats import read_published_stats
+from result_cache import result_cache
+from analysis import cached_result, complete_analysis, analyze_with_cache, is_video
+from detections import query_detections, detection_to_dict
+from rollups import summarize as summarize_defects, PERIODS as SUMMARY_PERIODS
+from uploads import query_uploads, upload_to_dict, parse_fields, decode_cursor, DEFAULT_PAGE_SIZE
+from jobs import enqueue_analysis, enqueue_ingest, job_to_dict, supervise_workers, ACTIVE_STATUSES
+from bulk_ingest import archive_type, resolve_folder, ingest_job_to_dict
+from upload_sessions import upload_sessions, originals, save_stream, UploadSessionError
+from storage import blob_store
+from similarity import similarity_stats
+from events import broadcaster, record_upload_created, record_analysis_event, replay_events, format_sse
+from metrics import (
+    registry as metrics_registry, merge_snapshots, render_prometheus, set_engine_gauges, set_pool_gauges,
+    REQUEST_SECONDS, JOBS
+)
+from derivatives import derivatives, parse_quality, DerivativeError, MIMETYPES as DERIVATIVE_MIMETYPES
+from settings import (
+    UPLOAD_FOLDER, OUTPUT_FOLDER, ALLOWED_EXTENSIONS, MODEL_PATH, INGEST_FOLDER, IMAGE_CACHE_MAX_AGE,
+    EVENT_HEARTBEAT_SECONDS, EVENT_STREAM_MAX_SECONDS
+)
+from db_models import User, Upload, Analysis, IngestJob, Subscription
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy import func
 from datetime import datetime, timedelta
-from flask import Flask, jsonify, request, send_from_directory, url_for
+from flask import Flask, g, jsonify, request, send_file, send_from_directory, url_for
 
 
 app = Flask(__name__)
@@ -15,59 +41,61 @@ app = Flask(__name__)
 
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
 
-UPLOAD_FOLDER = 'uploads'
-OUTPUT_FOLDER = 'output'
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mov', 'avi'}
-MODEL_PATH = os.path.join(os.path.dirname(__file__), 'best.pt')
-
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['OUTPUT_FOLDER'] = OUTPUT_FOLDER
 
-for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER]:
+for folder in [UPLOAD_FOLDER, OUTPUT_FOLDER, INGEST_FOLDER]:
     if not os.path.exists(folder):
         os.makedirs(folder)
 
 # Initialize the database
 init_db()
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-def predict_and_save(file_path: str, model_path: str = MODEL_PATH, output_dir: str = OUTPUT_FOLDER) -> str:
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    
+# Load and warm up the model once per worker process
+if os.path.exists(MODEL_PATH):
     try:
-        app.logger.info(f"Loading model from {model_path}")
-        model = YOLO(model_path)
+        model_registry.get(MODEL_PATH)
     except Exception as e:
-        app.logger.error(f"Failed to load model from {model_path}: {e}")
-        raise RuntimeError(f"Failed to load model from {model_path}: {e}")
-    
-    try:
-        app.logger.info(f"Running prediction on {file_path}")
-        results = model(file_path)
-    except Exception as e:
-        app.logger.error(f"Prediction failed for file {file_path}: {e}")
-        raise RuntimeError(f"Prediction failed for file {file_path}: {e}")
-    
-    input_path = Path(file_path)
-    output_path = output_dir / f"{input_path.stem}_pred{input_path.suffix}"
-    
-    try:
-        app.logger.info(f"Saving prediction result to {output_path}")
-        results[0].save(output_path)
-    except Exception as e:
-        app.logger.error(f"Failed to save prediction result to {output_path}: {e}")
-        raise RuntimeError(f"Failed to save prediction result to {output_path}: {e}")
-    
-    return str(output_path)
+        app.logger.error(f"Model warm-up at startup failed: {e}")
+
+def get_request_db(read_only=False):
+    # One session per request (and per kind), closed in teardown
+    key = 'read_db' if read_only else 'db'
+    if key not in g:
+        setattr(g, key, open_session(read_only=read_only))
+    return getattr(g, key)
+
+@app.teardown_appcontext
+def close_request_db(exception=None):
+    for key in ('db', 'read_db'):
+        db = g.pop(key, None)
+        if db is not None:
+            if exception is not None:
+                db.rollback()
+            db.close()
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_latency(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        # The URL rule, not the path, so /api/analysis/1 and /api/analysis/2 share a series
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - start, method=request.method, route=route,
+                                status=response.status_code)
+    return response
+
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 
 @app.route('/api/register', methods=['POST'])
 def register():
     data = request.json
-    db = next(get_db())
+    db = get_request_db()
     try:
         new_user = User(
             username=data['username'],
@@ -80,14 +108,12 @@ def register():
     except IntegrityError:
         db.rollback()
         return jsonify({"error": "Username or email already exists"}), 400
-    finally:
-        db.close()
 
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.json
     app.logger.info(f"Login attempt for username: {data.get('username')}")
-    db = next(get_db())
+    db = get_request_db()
     try:
         user = db.query(User).filter(User.username == data['username']).first()
         if user and user.password_hash == data['hashedPassword']:  # In a real app, verify the hashed password
@@ -106,8 +132,6 @@ def login():
     except Exception as e:
         app.logger.error(f"Login error: {str(e)}")
         return jsonify({"error": "An unexpected error occurred"}), 500
-    finally:
-        db.close()
 
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
@@ -122,19 +146,20 @@ def upload_file():
         return jsonify({"error": "No selected file"}), 400
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(file_path)
-        
-        db = next(get_db())
+        db = get_request_db()
         try:
+            # Stored once by content; a file that is already stored is not written again
+            file_path, file_size, content_hash = blob_store.store_stream(db, file.stream, filename)
             new_upload = Upload(
                 user_id=user_id,
                 filename=filename,
                 original_path=file_path,
                 file_type=file.content_type,
-                file_size=os.path.getsize(file_path)
+                file_size=file_size,
+                content_hash=content_hash
             )
             db.add(new_upload)
+            record_upload_created(db, new_upload)
             db.commit()
             db.refresh(new_upload)
             
@@ -146,13 +171,201 @@ def upload_file():
         except Exception as e:
             db.rollback()
             return jsonify({"error": str(e)}), 500
-        finally:
-            db.close()
     return jsonify({"error": "File type not allowed"}), 400
 
+@app.route('/api/analyze', methods=['POST'])
+def upload_and_analyze():
+    # Upload and analyze in one request: the image is decoded from the request body in memory and
+    # the original is written to disk in the background instead of being saved and read back
+    user_id = request.form.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+    if not allowed_file(file.filename):
+        return jsonify({"error": "File type not allowed"}), 400
+    filename = secure_filename(file.filename)
+    if is_video(filename):
+        return jsonify({"error": "Videos must be uploaded with /api/upload and analyzed with /api/analyze/<id>"}), 400
+
+    data = file.read()
+    db = get_request_db()
+    try:
+        file_path, content_hash = blob_store.store_bytes(db, data, filename, writer=originals.persist)
+        upload = Upload(
+            user_id=user_id,
+            filename=filename,
+            original_path=file_path,
+            file_type=file.content_type,
+            file_size=len(data),
+            content_hash=content_hash
+        )
+        analysis = Analysis(upload=upload, status='running')
+        db.add(analysis)
+        record_upload_created(db, upload)
+        try:
+            output_path, metadata = analyze_with_cache(file_path, content_hash=content_hash, data=data, db=db)
+        except RuntimeError as e:
+            app.logger.error(f"Analysis failed for uploaded file {filename}: {e}")
+            analysis.status = 'failed'
+            analysis.analysis_metadata = {'error': str(e)}
+            record_analysis_event(db, analysis)
+            db.commit()
+            return jsonify({"error": str(e), "upload_id": upload.id, "job_id": analysis.id}), 422
+        complete_analysis(db, analysis, output_path, metadata)
+        db.commit()
+
+        return jsonify({
+            "message": "File analyzed successfully",
+            "filename": filename,
+            "upload_id": upload.id,
+            "job_id": analysis.id,
+            "status": analysis.status,
+            "prediction": analysis.result_path,
+            "detections": metadata.get('detections'),
+            "cache_hit": metadata.get('cache_hit', False)
+        }), 200
+    except Exception as e:
+        db.rollback()
+        app.logger.error(f"Unexpected error in upload_and_analyze: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/uploads/chunked', methods=['POST'])
+def create_chunked_upload():
+    data = request.json or {}
+    if not data.get('user_id'):
+        return jsonify({"error": "User ID is required"}), 400
+    filename = secure_filename(data.get('filename') or '')
+    if not filename or not allowed_file(filename):
+        return jsonify({"error": "File type not allowed"}), 400
+    try:
+        file_size = int(data.get('file_size'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "file_size is required"}), 400
+    if file_size <= 0:
+        return jsonify({"error": "file_size must be positive"}), 400
+
+    session = upload_sessions.create(int(data['user_id']), filename, file_size, data.get('content_type'))
+    return jsonify(session), 201
+
+@app.route('/api/uploads/chunked/<token>', methods=['GET'])
+def get_chunked_upload(token):
+    try:
+        return jsonify(upload_sessions.status(token))
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route('/api/uploads/chunked/<token>', methods=['PUT'])
+def put_upload_chunk(token):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({"error": "offset is required"}), 400
+    try:
+        status = upload_sessions.write_chunk(
+            token,
+            offset,
+            request.stream,
+            request.content_length,
+            request.headers.get('X-Chunk-SHA256')
+        )
+        return jsonify(status)
+    except UploadSessionError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route('/api/uploads/chunked/<token>/complete', methods=['POST'])
+def complete_chunked_upload(token):
+    data = request.get_json(silent=True) or {}
+    db = get_request_db()
+    try:
+        completed = upload_sessions.complete(
+            token,
+            data.get('sha256'),
+            # Linked, not moved: the session keeps its file until the Upload row is committed
+            store=lambda path, filename, content_hash: blob_store.store_file(
+                db, path, filename, content_hash, keep_source=True)[0]
+        )
+    except UploadSessionError as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), e.status
+
+    try:
+        new_upload = Upload(
+            user_id=completed['user_id'],
+            filename=completed['filename'],
+            original_path=completed['path'],
+            file_type=completed['content_type'],
+            file_size=completed['file_size'],
+            content_hash=completed['content_hash']
+        )
+        db.add(new_upload)
+        record_upload_created(db, new_upload)
+        db.commit()
+        db.refresh(new_upload)
+        upload_sessions.finish(token)
+        
+        return jsonify({
+            "message": "File uploaded successfully",
+            "filename": new_upload.filename,
+            "upload_id": new_upload.id,
+            "content_hash": new_upload.content_hash
+        }), 201
+    except Exception as e:
+        db.rollback()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest():
+    data = request.form if request.files else (request.get_json(silent=True) or {})
+    user_id = data.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    # Before the archive is staged, so a bad request leaves nothing on disk
+    try:
+        user_id = int(user_id)
+    except ValueError:
+        return jsonify({"error": "User ID must be a number"}), 400
+
+    if 'archive' in request.files:
+        archive = request.files['archive']
+        source_type = archive_type(archive.filename or '')
+        if not source_type:
+            return jsonify({"error": "Archive must be a zip or tar file"}), 400
+        source_path = os.path.join(INGEST_FOLDER, f"{uuid.uuid4().hex}_{secure_filename(archive.filename)}")
+        save_stream(archive.stream, source_path)
+    elif data.get('folder'):
+        try:
+            source_type, source_path = 'folder', resolve_folder(data['folder'])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        return jsonify({"error": "Provide an archive file or a folder"}), 400
+
+    db = get_request_db()
+    try:
+        job = enqueue_ingest(db, user_id, source_type, source_path)
+        return jsonify(dict(
+            ingest_job_to_dict(job),
+            status_url=url_for('get_ingest_job', ingest_id=job.id)
+        )), 202
+    except Exception as e:
+        db.rollback()
+        if source_type != 'folder' and os.path.exists(source_path):
+            # No job will ever pick the staged archive up
+            os.remove(source_path)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/ingest/<int:ingest_id>', methods=['GET'])
+def get_ingest_job(ingest_id):
+    db = get_request_db()
+    job = db.query(IngestJob).get(ingest_id)
+    if not job:
+        return jsonify({"error": "Ingest job not found"}), 404
+    return jsonify(ingest_job_to_dict(job))
+
 @app.route('/api/analyze/<int:upload_id>', methods=['POST'])
 def analyze_file(upload_id):
-    db = next(get_db())
+    db = get_request_db()
     try:
         upload = db.query(Upload).get(upload_id)
         if not upload:
@@ -160,39 +373,53 @@ def analyze_file(upload_id):
             return jsonify({"error": "Upload not found"}), 404
         
         file_path = upload.original_path
+        originals.wait(file_path)
         if not os.path.exists(file_path):
             app.logger.error(f"File not found at path: {file_path}")
             return jsonify({"error": "File not found"}), 404
         
-        try:
-            output_path = predict_and_save(file_path)
-            app.logger.info(f"Analysis completed for file: {file_path}")
-        except Exception as e:
-            app.logger.error(f"Error during prediction: {str(e)}")
-            return jsonify({"error": f"Analysis failed: {str(e)}"}), 500
-        
-        relative_output_path = os.path.relpath(output_path, start=app.config['OUTPUT_FOLDER'])
+        # Same file and same weights as an earlier analysis: reuse it without queueing
+        _, cached = cached_result(file_path, content_hash=upload.content_hash)
+        if cached:
+            output_path, metadata = cached
+            new_analysis = Analysis(upload=upload, status='running')
+            db.add(new_analysis)
+            complete_analysis(db, new_analysis, output_path, metadata)
+            db.commit()
+            db.refresh(new_analysis)
+            
+            return jsonify({
+                "message": "File analyzed successfully",
+                "filename": upload.filename,
+                "job_id": new_analysis.id,
+                "status": new_analysis.status,
+                "prediction": new_analysis.result_path,
+                "detections": metadata.get('detections'),
+                "cache_hit": True
+            }), 200
         
-        new_analysis = Analysis(
-            upload_id=upload_id,
-            status='completed',
-            result_path=relative_output_path
-        )
-        db.add(new_analysis)
-        db.commit()
-        db.refresh(new_analysis)
+        analysis = enqueue_analysis(db, upload)
+        app.logger.info(f"Analysis job {analysis.id} {analysis.status} for file: {file_path}")
         
         return jsonify({
-            "message": "File analyzed successfully", 
+            "message": "Analysis queued",
             "filename": upload.filename,
-            "prediction": relative_output_path
-        }), 200
+            "job_id": analysis.id,
+            "status": analysis.status,
+            "status_url": url_for('get_analysis_job', job_id=analysis.id)
+        }), 202
     except Exception as e:
         db.rollback()
         app.logger.error(f"Unexpected error in analyze_file: {str(e)}")
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
+
+@app.route('/api/analysis/<int:job_id>', methods=['GET'])
+def get_analysis_job(job_id):
+    db = get_request_db()
+    analysis = db.query(Analysis).get(job_id)
+    if not analysis:
+        return jsonify({"error": "Analysis job not found"}), 404
+    return jsonify(job_to_dict(analysis))
 
 @app.route('/api/uploads', methods=['GET'])
 def get_uploads():
@@ -200,29 +427,133 @@ def get_uploads():
     if not user_id:
         return jsonify({"error": "User ID is required"}), 400
 
-    db = next(get_db())
     try:
-        uploads = db.query(Upload).filter(Upload.user_id == user_id).all()
-        uploads_data = [{
-            "id": upload.id,
-            "filename": upload.filename,
-            "upload_date": upload.upload_date.isoformat(),
-            "file_type": upload.file_type,
-            "file_size": upload.file_size,
-            "analyses": [{
-                "id": analysis.id,
-                "status": analysis.status,
-                "result_path": analysis.result_path
-            } for analysis in upload.analyses]
-        } for upload in uploads]
-        return jsonify(uploads_data)
-    finally:
-        db.close()
+        fields = parse_fields(request.args.get('fields'))
+        cursor = request.args.get('cursor')
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        return jsonify({"error": f"Invalid request: {str(e)}"}), 400
+
+    db = get_request_db(read_only=True)
+    uploads, next_cursor = query_uploads(
+        db,
+        user_id,
+        cursor=cursor,
+        limit=request.args.get('limit', default=DEFAULT_PAGE_SIZE, type=int),
+        fields=fields
+    )
+    return jsonify({
+        "uploads": [upload_to_dict(upload, fields) for upload in uploads],
+        "next_cursor": next_cursor
+    })
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    # Server-sent events for one user's dashboard: upload.created and analysis.<status> deltas
+    user_id = request.args.get('user_id', type=int)
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        last_event_id = request.args.get('last_event_id', type=int)
+
+    # Subscribe before replaying so nothing falls between the two; the client applies events idempotently
+    subscription = broadcaster.subscribe(user_id)
+    backlog, complete = [], True
+    if last_event_id is not None:
+        try:
+            backlog, complete = replay_events(get_request_db(), user_id, last_event_id)
+        except Exception:
+            broadcaster.unsubscribe(subscription)
+            raise
+
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if not complete:
+                # Missed more than can be replayed: tell the client to reload its list
+                yield "event: reset\ndata: {}\n\n"
+            for event in backlog:
+                yield format_sse(event)
+            deadline = time.monotonic() + EVENT_STREAM_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    event = subscription.get(timeout=EVENT_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    break
+                yield format_sse(event)
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    response = app.response_class(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/detections', methods=['GET'])
+def get_detections():
+    user_id = request.args.get('user_id')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    try:
+        filters = {
+            "user_id": int(user_id),
+            "class_name": request.args.get('class_name'),
+            "min_confidence": request.args.get('min_confidence', type=float),
+            "max_confidence": request.args.get('max_confidence', type=float),
+            "start_date": parse_date(request.args.get('start_date')),
+            "end_date": parse_date(request.args.get('end_date')),
+            "model_version": request.args.get('model_version'),
+            "cursor": request.args.get('cursor', type=int),
+            "limit": request.args.get('limit', default=100, type=int)
+        }
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
+
+    db = get_request_db(read_only=True)
+    detections, next_cursor = query_detections(db, **filters)
+    return jsonify({
+        "detections": [detection_to_dict(d) for d in detections],
+        "next_cursor": next_cursor
+    })
+
+def parse_date(value):
+    return datetime.fromisoformat(value) if value else None
+
+@app.route('/api/defects/summary', methods=['GET'])
+def get_defect_summary():
+    # Served from the rollup tables; without user_id it covers the whole fleet
+    period = request.args.get('period', 'week')
+    if period not in SUMMARY_PERIODS:
+        return jsonify({"error": f"period must be one of: {', '.join(SUMMARY_PERIODS)}"}), 400
+    try:
+        start_date = parse_date(request.args.get('start_date'))
+        end_date = parse_date(request.args.get('end_date'))
+        # int() rather than type=int, which turns a bad value into None and so into fleet totals
+        user_id = request.args.get('user_id')
+        summary = summarize_defects(
+            get_request_db(read_only=True),
+            user_id=int(user_id) if user_id else None,
+            start_date=start_date.date() if start_date else None,
+            end_date=end_date.date() if end_date else None,
+            class_name=request.args.get('class_name'),
+            min_confidence=request.args.get('min_confidence', type=float),
+            period=period
+        )
+    except ValueError as e:
+        return jsonify({"error": f"Invalid filter: {str(e)}"}), 400
+    return jsonify(summary)
 
 @app.route('/api/subscribe', methods=['POST'])
 def subscribe():
     data = request.json
-    db = next(get_db())
+    db = get_request_db()
     try:
         user = db.query(User).get(data['user_id'])
         if not user:
@@ -251,34 +582,29 @@ def subscribe():
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
 
 @app.route('/api/subscription/<int:user_id>', methods=['GET'])
 def get_subscription(user_id):
-    db = next(get_db())
-    try:
-        subscription = db.query(Subscription).filter(
-            Subscription.user_id == user_id,
-            Subscription.status == 'active'
-        ).first()
+    db = get_request_db(read_only=True)
+    subscription = db.query(Subscription).filter(
+        Subscription.user_id == user_id,
+        Subscription.status == 'active'
+    ).first()
         
-        if subscription:
-            return jsonify({
-                "subscription_id": subscription.id,
-                "plan_type": subscription.plan_type,
-                "start_date": subscription.start_date.isoformat(),
-                "end_date": subscription.end_date.isoformat(),
-                "status": subscription.status
-            })
-        else:
-            return jsonify({"message": "No active subscription found"}), 404
-    finally:
-        db.close()
+    if subscription:
+        return jsonify({
+            "subscription_id": subscription.id,
+            "plan_type": subscription.plan_type,
+            "start_date": subscription.start_date.isoformat(),
+            "end_date": subscription.end_date.isoformat(),
+            "status": subscription.status
+        })
+    else:
+        return jsonify({"message": "No active subscription found"}), 404
 
 @app.route('/api/cancel_subscription/<int:subscription_id>', methods=['POST'])
 def cancel_subscription(subscription_id):
-    db = next(get_db())
+    db = get_request_db()
     try:
         subscription = db.query(Subscription).get(subscription_id)
         if not subscription:
@@ -291,12 +617,63 @@ def cancel_subscription(subscription_id):
     except Exception as e:
         db.rollback()
         return jsonify({"error": str(e)}), 500
-    finally:
-        db.close()
+
+@app.route('/api/models', methods=['GET'])
+def get_models():
+    return jsonify(model_registry.stats())
+
+@app.route('/api/inference/stats', methods=['GET'])
+def get_inference_stats():
+    return jsonify({
+        "local": {
+            "engines": engine_stats(),
+            "result_cache": result_cache.stats(),
+            "derivatives": derivatives.stats(),
+            "originals": originals.stats(),
+            "similarity": similarity_stats(),
+            "events": broadcaster.stats()
+        },
+        "workers": [{k: v for k, v in stats.items() if k != 'metrics'} for stats in read_published_stats()]
+    })
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format: this process's metrics merged with what the analysis workers published
+    db = get_request_db(read_only=True)
+    for kind, model in (('analysis', Analysis), ('ingest', IngestJob)):
+        counts = dict(db.query(model.status, func.count(model.id)).filter(
+            model.status.in_(ACTIVE_STATUSES)).group_by(model.status).all())
+        for status in ACTIVE_STATUSES:
+            JOBS.set(counts.get(status, 0), kind=kind, status=status)
+    set_pool_gauges(pool_stats())
+    set_engine_gauges(engine_stats())
+
+    snapshots = [metrics_registry.snapshot()]
+    snapshots += [stats['metrics'] for stats in read_published_stats() if 'metrics' in stats]
+    body = render_prometheus(merge_snapshots(snapshots))
+    return app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/db/pool', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify(pool_stats())
+
+def resolve_upload(filename):
+    # Uploads live in the content-addressed store; find the file through the uploads table.
+    # Filenames repeat across users, so plain names need ?upload_id= or ?user_id= to resolve.
+    return blob_store.resolve(
+        get_request_db(read_only=True),
+        filename,
+        upload_id=request.args.get('upload_id', type=int),
+        user_id=request.args.get('user_id', type=int)
+    )
 
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    path = resolve_upload(filename)
+    if path is None:
+        return jsonify({"error": "Upload not found"}), 404
+    originals.wait(path)
+    return send_from_directory(os.path.dirname(path), os.path.basename(path))
 
 @app.route('/output/<filename>')
 def output_file(filename):
@@ -319,34 +696,53 @@ def init_db():
         db.close()
 
 
-@app.route('/api/image/upload/<filename>')
-def get_upload_image(filename):
+def send_image(folder, filename):
+    # Originals go out as-is (conditional requests and Range handled by send_file);
+    # ?size= and/or ?format= serve a cached, re-encoded derivative instead
+    size = request.args.get('size')
+    fmt = request.args.get('format')
     try:
-        return send_from_directory(
-            app.config['UPLOAD_FOLDER'], 
-            filename,
-            as_attachment=False,
-            mimetype='image/*'
-        )
+        if size is None and fmt is None:
+            response = send_from_directory(folder, filename, max_age=IMAGE_CACHE_MAX_AGE)
+        else:
+            if fmt in (None, 'auto'):
+                fmt = 'webp' if request.accept_mimetypes['image/webp'] else 'jpeg'
+            source = safe_join(os.path.join(app.root_path, folder), filename)
+            if source is None:
+                return jsonify({"error": "Invalid filename"}), 404
+            path = derivatives.get(source, size or 'medium', fmt, parse_quality(request.args.get('quality')))
+            response = send_file(path, mimetype=DERIVATIVE_MIMETYPES[fmt], max_age=IMAGE_CACHE_MAX_AGE,
+                                 conditional=True)
+            response.vary.add('Accept')
+    except DerivativeError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         return jsonify({"error": f"Error loading image: {str(e)}"}), 404
+    # Uploads belong to one user; keep them out of shared caches
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
+
+@app.route('/api/image/upload/<filename>')
+def get_upload_image(filename):
+    path = resolve_upload(filename)
+    if path is None:
+        return jsonify({"error": "Upload not found"}), 404
+    # Originals from /api/analyze may still be on their way to disk, possibly from another web process
+    originals.wait(path)
+    return send_image(os.path.dirname(path), os.path.basename(path))
 
 @app.route('/api/image/output/<filename>')
 def get_output_image(filename):
-    try:
-        return send_from_directory(
-            app.config['OUTPUT_FOLDER'], 
-            filename,
-            as_attachment=False,
-            mimetype='image/*'
-        )
-    except Exception as e:
-        return jsonify({"error": f"Error loading image: {str(e)}"}), 404
+    return send_image(app.config['OUTPUT_FOLDER'], filename)
 
 # Call this function when your app starts
 init_db()
 
 if __name__ == '__main__':
+    # Development server: run the worker pool alongside it (in the reloader's child only, so once)
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        threading.Thread(target=supervise_workers, name='worker-supervisor', daemon=True).start()
     app.run(debug=True)
 
 
@@ -0,0 +1,122 @@
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+import cv2
+import numpy as np
+from inference import percentile
+from runtimes import BACKENDS, backend_id, load_model
+from settings import MODEL_PATH, INFERENCE_IMGSZ, INFERENCE_THREADS
+from benchmarks.tiling import SAMPLE_IMAGES, IMAGE_SUFFIXES, iou
+
+
+def compare(reference, result, iou_threshold: float) -> dict:
+    """Greedy same-class IoU matching of ``result`` against the PyTorch ``reference``."""
+    expected = reference.boxes.data.cpu().numpy()
+    actual = result.boxes.data.cpu().numpy()
+    used = np.zeros(len(actual), dtype=bool)
+    matched, confidence_diffs = 0, []
+    for box in expected:
+        candidates = (actual[:, 5] == box[5]) & ~used if len(actual) else np.zeros(0, dtype=bool)
+        if not candidates.any():
+            continue
+        overlaps = np.where(candidates, iou(box[:4], actual[:, :4]), 0)
+        best = int(overlaps.argmax())
+        if overlaps[best] >= iou_threshold:
+            used[best] = True
+            matched += 1
+            confidence_diffs.append(abs(float(actual[best, 4]) - float(box[4])))
+    return {'expected': len(expected), 'found': len(actual), 'matched': matched, 'confidence_diffs': confidence_diffs}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inference backends for latency and agreement with PyTorch")
+    parser.add_argument("--images", default=str(SAMPLE_IMAGES), help="Directory of images to run")
+    parser.add_argument("--model", default=MODEL_PATH, help="Path to the YOLO model file")
+    parser.add_argument("--backends", default=','.join(BACKENDS), help="Comma-separated backends to compare")
+    parser.add_argument("--int8", action="store_true", help="Also run INT8-quantized variants of exported backends")
+    parser.add_argument("--calibration", help="Calibration image directory for --int8 (defaults to --images)")
+    parser.add_argument("--threads", type=int, default=INFERENCE_THREADS, help="Runtime thread count, 0 for default")
+    parser.add_argument("--imgsz", type=int, default=INFERENCE_IMGSZ)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per image")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a detection to agree with PyTorch")
+    parser.add_argument("--min-agreement", type=float, default=0.9,
+                        help="Exit non-zero if any backend recovers fewer of PyTorch's detections than this")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    images = [(p.name, image) for p in paths if (image := cv2.imread(str(p))) is not None]
+
+    variants = [(backend, False) for backend in args.backends.split(',')]
+    if 'pytorch' not in args.backends.split(','):
+        variants.insert(0, ('pytorch', False))
+    if args.int8:
+        variants += [(backend, True) for backend, _ in variants if backend != 'pytorch']
+
+    reference = {}
+    summary = {}
+    failed = False
+    for backend, int8 in variants:
+        name = backend_id(backend, int8)
+        start = time.perf_counter()
+        try:
+            model = load_model(args.model, backend=backend, threads=args.threads, int8=int8, imgsz=args.imgsz,
+                               calibration_dir=args.calibration or args.images)
+        except Exception as e:
+            summary[name] = {'error': str(e)}
+            failed = True
+            continue
+        load_time = time.perf_counter() - start
+
+        latencies, expected, matched, diffs = [], 0, 0, []
+        for image_name, image in images:
+            model(image, imgsz=args.imgsz, verbose=False)  # warm-up, untimed
+            for _ in range(args.repeat):
+                t = time.perf_counter()
+                result = model(image, imgsz=args.imgsz, verbose=False)[0]
+                latencies.append(time.perf_counter() - t)
+            if backend == 'pytorch':
+                reference[image_name] = result
+                continue
+            agreement = compare(reference[image_name], result, args.iou)
+            expected += agreement['expected']
+            matched += agreement['matched']
+            diffs += agreement['confidence_diffs']
+
+        latencies.sort()
+        entry = {
+            'load_time': load_time,
+            'latency_mean': float(np.mean(latencies)) if latencies else 0.0,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+        }
+        if backend != 'pytorch':
+            entry['agreement_recall'] = matched / expected if expected else None
+            entry['confidence_mean_abs_diff'] = float(np.mean(diffs)) if diffs else None
+            if expected and matched / expected < args.min_agreement:
+                failed = True
+        summary[name] = entry
+
+    report = {
+        'model': os.path.abspath(args.model),
+        'images': len(images),
+        'imgsz': args.imgsz,
+        'threads': args.threads,
+        'repeat': args.repeat,
+        'min_agreement': args.min_agreement,
+        'summary': summary,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+    if failed:
+        exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+import cv2
+import numpy as np
+from inference import get_engine, percentile
+from model_registry import registry as model_registry
+from tiling import predict_tiled
+from cascade import Screener, predict_cascade
+from settings import MODEL_PATH, SCREEN_MODEL_PATH, SCREEN_IMGSZ
+from benchmarks.tiling import SAMPLE_IMAGES, IMAGE_SUFFIXES, load_labels, count_matches
+from benchmarks.backends import compare
+
+
+def run_timed(run, image, repeat: int) -> tuple:
+    run(image)  # warm-up, untimed
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run(image)
+        latencies.append(time.perf_counter() - start)
+    return result, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the screening cascade against running best.pt on everything")
+    parser.add_argument("--images", default=str(SAMPLE_IMAGES), help="Directory of images to run")
+    parser.add_argument("--labels", help="Directory of YOLO-format .txt labels for recall")
+    parser.add_argument("--model", default=MODEL_PATH, help="Path to the full YOLO model file")
+    parser.add_argument("--screen-model", default=SCREEN_MODEL_PATH,
+                        help="Screening model; defaults to the full model at --screen-imgsz")
+    parser.add_argument("--screen-imgsz", type=int, default=SCREEN_IMGSZ)
+    parser.add_argument("--thresholds", default="0.05,0.1,0.25", help="Comma-separated screening thresholds")
+    parser.add_argument("--tiled", action="store_true", help="Compare tiled against tiled-cascade")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a detection to count as a match")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    args = parser.parse_args()
+
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    images = [(p, image) for p in paths if (image := cv2.imread(str(p))) is not None]
+    thresholds = [float(t) for t in args.thresholds.split(',')]
+
+    if args.tiled:
+        full = lambda image: predict_tiled(model_registry.get(args.model), image)
+    else:
+        # Same engine path the cascade escalates through, so both sides pay the same batching wait
+        full = lambda image: get_engine(args.model).predict(image)
+
+    variants = {'full': {'run': full}}
+    for threshold in thresholds:
+        screener = Screener(args.screen_model, args.screen_imgsz, threshold)
+        variants[f"cascade@{threshold}"] = {
+            'run': lambda image, screener=screener: predict_cascade(args.model, image, tiled=args.tiled,
+                                                                    screener=screener),
+            'threshold': threshold,
+        }
+    for variant in variants.values():
+        variant.update(latencies=[], matched=0, detections=0, escalated=0, agreement_expected=0,
+                       agreement_matched=0, missed_images=0)
+
+    labelled = 0
+    labelled_images = 0
+    for path, image in images:
+        height, width = image.shape[:2]
+        labels = load_labels(Path(args.labels) / f"{path.stem}.txt", width, height) if args.labels else np.zeros((0, 5))
+        labelled += len(labels)
+        labelled_images += bool(len(labels))
+
+        reference = None
+        for name, variant in variants.items():
+            result, latencies = run_timed(variant['run'], image, args.repeat)
+            variant['latencies'].extend(latencies)
+            variant['detections'] += len(result.boxes)
+            variant['matched'] += count_matches(result, labels, args.iou)
+            if name == 'full':
+                reference = result
+                continue
+            escalated = result.cascade['decided_by'] == 'full'
+            variant['escalated'] += escalated
+            # A labelled defect image the screener let through without running best.pt
+            variant['missed_images'] += bool(len(labels)) and not escalated
+            agreement = compare(reference, result, args.iou)
+            variant['agreement_expected'] += agreement['expected']
+            variant['agreement_matched'] += agreement['matched']
+
+    summary = {}
+    baseline = variants['full']
+    baseline_throughput = len(baseline['latencies']) / sum(baseline['latencies']) if baseline['latencies'] else 0.0
+    baseline_recall = baseline['matched'] / labelled if labelled else None
+    for name, variant in variants.items():
+        latencies = sorted(variant['latencies'])
+        throughput = len(latencies) / sum(latencies) if latencies else 0.0
+        recall = variant['matched'] / labelled if labelled else None
+        entry = {
+            'images_per_second': throughput,
+            'latency_p50': percentile(latencies, 50),
+            'latency_p95': percentile(latencies, 95),
+            'detections': variant['detections'],
+            'recall': recall,
+        }
+        if name != 'full':
+            entry.update({
+                'threshold': variant['threshold'],
+                'escalation_rate': variant['escalated'] / len(images) if images else 0.0,
+                'throughput_gain': throughput / baseline_throughput if baseline_throughput else None,
+                'recall_loss': baseline_recall - recall if labelled else None,
+                'missed_labelled_images': variant['missed_images'],
+                # Share of best.pt's own detections the cascade still reports, for unlabelled sets
+                'full_model_agreement': (variant['agreement_matched'] / variant['agreement_expected']
+                                         if variant['agreement_expected'] else None),
+            })
+        summary[name] = entry
+
+    report = {
+        'model': os.path.abspath(args.model),
+        'screen_model': os.path.abspath(args.screen_model) if args.screen_model else None,
+        'screen_imgsz': args.screen_imgsz,
+        'tiled': args.tiled,
+        'images': len(images),
+        'labelled_images': labelled_images,
+        'labelled_objects': labelled,
+        'repeat': args.repeat,
+        'summary': summary,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
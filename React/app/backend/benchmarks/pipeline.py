@@ -0,0 +1,353 @@
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import logging
+import platform
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import urllib.request
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# The app's modules read their configuration from the environment at import time, so
+# they are imported only after main() has pointed it at the scratch directory
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+SAMPLE_IMAGES = BACKEND_DIR.parents[2] / 'Streamlit' / 'detected_images'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+SYNTHETIC_SIZES = [(1920, 1080), (4000, 3000)]
+SUITES = ('stages', 'batch', 'imgsz', 'threads', 'cold', 'http')
+
+
+def distribution(values: list) -> dict:
+    # Seconds; nearest-rank percentiles so two reports can be diffed key by key
+    from inference import percentile
+    values = sorted(values)
+    return {
+        'n': len(values),
+        'mean': float(np.mean(values)) if values else 0.0,
+        'min': values[0] if values else 0.0,
+        'p50': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'p99': percentile(values, 99),
+        'max': values[-1] if values else 0.0,
+    }
+
+
+def synthetic_image(width: int, height: int, seed: int) -> np.ndarray:
+    # Smoothed noise with a few hard edges: compresses and runs like a photo, reproducible per seed
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, height // 16), max(1, width // 16), 3), dtype=np.uint8)
+    image = cv2.resize(small, (width, height), interpolation=cv2.INTER_CUBIC)
+    for _ in range(20):
+        x1, y1 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        x2, y2 = int(rng.integers(0, width)), int(rng.integers(0, height))
+        cv2.line(image, (x1, y1), (x2, y2), tuple(int(c) for c in rng.integers(0, 256, 3)), 8)
+    return image
+
+
+def prepare_images(workdir: Path, sample_dir: str, seed: int) -> list:
+    image_dir = workdir / 'images'
+    image_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    if sample_dir and os.path.isdir(sample_dir):
+        for path in sorted(Path(sample_dir).iterdir()):
+            if path.suffix.lower() in IMAGE_SUFFIXES:
+                shutil.copyfile(path, image_dir / path.name)
+                paths.append(image_dir / path.name)
+    for i, (width, height) in enumerate(SYNTHETIC_SIZES):
+        path = image_dir / f"synthetic_{width}x{height}.jpg"
+        cv2.imwrite(str(path), synthetic_image(width, height, seed + i), [cv2.IMWRITE_JPEG_QUALITY, 90])
+        paths.append(path)
+    return paths
+
+
+def timed(fn, *args, **kwargs) -> tuple:
+    start = time.perf_counter()
+    value = fn(*args, **kwargs)
+    return value, time.perf_counter() - start
+
+
+def bench_stages(model, paths: list, args, workdir: Path) -> dict:
+    """Decode, preprocess, forward, NMS, render, save and DB write for each image, warm model."""
+    from inference import load_image
+    from database import SessionLocal
+    from analysis import complete_analysis
+    from db_models import Upload, Analysis, User
+
+    output_dir = workdir / 'stage_output'
+    output_dir.mkdir(exist_ok=True)
+    db = SessionLocal()
+    user = db.query(User).first() or User(username='bench', email='bench@example.com', password_hash='x')
+    db.add(user)
+    db.commit()
+
+    per_image = {}
+    overall = {}
+    for path in paths:
+        stages = {name: [] for name in ('decode', 'preprocess', 'forward', 'nms', 'render', 'save', 'db_write')}
+        model(load_image(str(path)), imgsz=args.imgsz, verbose=False)  # warm-up, untimed
+        for _ in range(args.repeat):
+            image, decode = timed(load_image, str(path))
+            result = model(image, imgsz=args.imgsz, verbose=False)[0]
+            annotated, render = timed(result.plot)
+            output_path = output_dir / path.name
+            _, save = timed(cv2.imwrite, str(output_path), annotated)
+
+            def write():
+                upload = Upload(user_id=user.id, filename=path.name, original_path=str(path), file_type='image/jpeg',
+                                file_size=path.stat().st_size)
+                analysis = Analysis(upload=upload, status='running')
+                db.add_all([upload, analysis])
+                detections = [{
+                    'class_id': int(box[5]), 'class_name': result.names[int(box[5])],
+                    'confidence': float(box[4]), 'bbox': [float(v) for v in box[:4]],
+                } for box in result.boxes.data.tolist()]
+                complete_analysis(db, analysis, str(output_path),
+                                  {'type': 'image', 'mode': 'whole', 'detections': detections}, model_path=args.model)
+                db.commit()
+            _, db_write = timed(write)
+
+            stages['decode'].append(decode)
+            stages['preprocess'].append(result.speed['preprocess'] / 1000)
+            stages['forward'].append(result.speed['inference'] / 1000)
+            stages['nms'].append(result.speed['postprocess'] / 1000)
+            stages['render'].append(render)
+            stages['save'].append(save)
+            stages['db_write'].append(db_write)
+
+        height, width = image.shape[:2]
+        per_image[path.name] = {'width': width, 'height': height,
+                                'stages': {name: distribution(v) for name, v in stages.items()}}
+        for name, values in stages.items():
+            overall.setdefault(name, []).extend(values)
+    db.close()
+    return {'overall': {name: distribution(v) for name, v in overall.items()}, 'per_image': per_image}
+
+
+def bench_batch(model, paths: list, args) -> dict:
+    from inference import load_image
+    image = load_image(str(paths[0]))
+    report = {}
+    for batch_size in args.batch_sizes:
+        batch = [image] * batch_size
+        model(batch, imgsz=args.imgsz, verbose=False)
+        latencies = [timed(model, batch, imgsz=args.imgsz, verbose=False)[1] for _ in range(args.repeat)]
+        report[str(batch_size)] = dict(distribution(latencies),
+                                       images_per_second=batch_size * args.repeat / sum(latencies))
+    return report
+
+
+def bench_imgsz(model, paths: list, args) -> dict:
+    from inference import load_image
+    image = load_image(str(paths[-1]))  # the largest synthetic image
+    report = {}
+    for imgsz in args.imgsz_values:
+        model(image, imgsz=imgsz, verbose=False)
+        report[str(imgsz)] = distribution([
+            timed(model, image, imgsz=imgsz, verbose=False)[1] for _ in range(args.repeat)
+        ])
+    return report
+
+
+def bench_threads(paths: list, args) -> dict:
+    import torch
+    from inference import load_image
+    from runtimes import load_model
+    image = load_image(str(paths[0]))
+    report = {}
+    original = torch.get_num_threads()
+    for threads in args.thread_counts:
+        # For pytorch this sets torch's intra-op threads; exported runtimes get their own session
+        model = load_model(args.model, backend=args.backend, threads=threads)
+        model(image, imgsz=args.imgsz, verbose=False)
+        report[str(threads)] = distribution([
+            timed(model, image, imgsz=args.imgsz, verbose=False)[1] for _ in range(args.repeat)
+        ])
+    torch.set_num_threads(original)
+    return report
+
+
+def _cold_start(model_path: str, backend: str, image_path: str, imgsz: int, queue) -> None:
+    # Runs in a fresh interpreter: import, load and first prediction all count
+    start = time.perf_counter()
+    from runtimes import load_model
+    from inference import load_image
+    imported = time.perf_counter()
+    model = load_model(model_path, backend=backend)
+    loaded = time.perf_counter()
+    image = load_image(image_path)
+    model(image, imgsz=imgsz, verbose=False)
+    first = time.perf_counter()
+    model(image, imgsz=imgsz, verbose=False)
+    second = time.perf_counter()
+    queue.put({'import': imported - start, 'load': loaded - imported,
+               'first_predict': first - loaded, 'second_predict': second - first})
+
+
+def bench_cold(paths: list, args) -> dict:
+    context = multiprocessing.get_context('spawn')
+    runs = []
+    for _ in range(args.cold_runs):
+        queue = context.Queue()
+        process = context.Process(target=_cold_start, args=(args.model, args.backend, str(paths[0]), args.imgsz, queue))
+        process.start()
+        runs.append(queue.get(timeout=600))
+        process.join()
+    return {stage: distribution([run[stage] for run in runs]) for stage in runs[0]}
+
+
+def bench_http(paths: list, args) -> dict:
+    """Upload, queue and poll analyses through a real HTTP server backed by the app."""
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)  # one access-log line per poll otherwise
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    payloads = [(path.suffix, path.read_bytes()) for path in paths]
+
+    def request(method, url, body=None, headers=None):
+        req = urllib.request.Request(base + url, data=body, method=method, headers=headers or {})
+        with urllib.request.urlopen(req, timeout=300) as response:
+            return json.loads(response.read())
+
+    def one(i):
+        suffix, data = payloads[i % len(payloads)]
+        boundary = uuid.uuid4().hex
+        filename = f"bench_{uuid.uuid4().hex}{suffix}"
+        body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"user_id\"\r\n\r\n1\r\n"
+                f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{filename}\"\r\n"
+                f"Content-Type: image/jpeg\r\n\r\n").encode() + data + f"\r\n--{boundary}--\r\n".encode()
+        start = time.perf_counter()
+        upload = request('POST', '/api/upload', body, {'Content-Type': f"multipart/form-data; boundary={boundary}"})
+        uploaded = time.perf_counter()
+        job = request('POST', f"/api/analyze/{upload['upload_id']}")
+        queued = time.perf_counter()
+        while job['status'] not in ('completed', 'failed'):
+            time.sleep(args.poll_interval)
+            job = request('GET', f"/api/analysis/{job['job_id']}")
+        done = time.perf_counter()
+        return {'upload': uploaded - start, 'analyze_request': queued - uploaded,
+                'end_to_end': done - start, 'failed': job['status'] == 'failed'}
+
+    report = {}
+    try:
+        one(0)  # starts the worker pool and loads the model, untimed
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(one, range(args.http_requests)))
+            elapsed = time.perf_counter() - start
+            report[str(concurrency)] = {
+                'requests': len(results),
+                'failed': sum(r['failed'] for r in results),
+                'requests_per_second': len(results) / elapsed,
+                **{stage: distribution([r[stage] for r in results])
+                   for stage in ('upload', 'analyze_request', 'end_to_end')},
+            }
+    finally:
+        server.shutdown()
+    return report
+
+
+def environment() -> dict:
+    import torch
+    import ultralytics
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'ultralytics': ultralytics.__version__,
+        'cuda_available': torch.cuda.is_available(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the detection pipeline stage by stage and over HTTP")
+    parser.add_argument("--suites", default=','.join(SUITES), help=f"Comma-separated subset of {', '.join(SUITES)}")
+    parser.add_argument("--images", default=str(SAMPLE_IMAGES), help="Directory of sample images")
+    parser.add_argument("--model", default=str(BACKEND_DIR / 'best.pt'), help="Path to the YOLO model file")
+    parser.add_argument("--backend", default='pytorch', help="Inference backend (see INFERENCE_BACKEND)")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per measurement")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic images")
+    parser.add_argument("--batch-sizes", default='1,2,4,8')
+    parser.add_argument("--imgsz-values", default='320,640,960,1280')
+    parser.add_argument("--thread-counts", default=','.join(str(n) for n in sorted({1, 2, os.cpu_count() or 1})))
+    parser.add_argument("--cold-runs", type=int, default=3, help="Fresh processes for the cold-start suite")
+    parser.add_argument("--concurrency", default='1,4', help="Concurrent HTTP clients per load level")
+    parser.add_argument("--http-requests", type=int, default=16, help="Requests per load level")
+    parser.add_argument("--poll-interval", type=float, default=0.05)
+    parser.add_argument("--workdir", help="Scratch directory (default: a fresh temporary directory)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    args = parser.parse_args()
+    args.model = os.path.abspath(args.model)
+    args.batch_sizes = [int(v) for v in args.batch_sizes.split(',')]
+    args.imgsz_values = [int(v) for v in args.imgsz_values.split(',')]
+    args.thread_counts = [int(v) for v in args.thread_counts.split(',')]
+    args.concurrency = [int(v) for v in args.concurrency.split(',')]
+    suites = [s for s in args.suites.split(',') if s]
+    output = os.path.abspath(args.output) if args.output else None
+
+    # Everything the app writes (uploads, outputs, SQLite) goes to the scratch directory;
+    # the environment must be set before the app's modules read it at import time
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix='pipeline-bench-')).resolve()
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.environ['DATABASE_URL'] = f"sqlite:///{workdir / 'bench.db'}"
+    os.environ['RESULT_CACHE_ENABLED'] = '0'
+    os.environ['INFERENCE_BACKEND'] = args.backend
+    os.environ['INFERENCE_IMGSZ'] = str(args.imgsz)
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(workdir)
+    for folder in ('uploads', 'output'):
+        os.makedirs(folder, exist_ok=True)
+
+    from database import init_db
+    from runtimes import load_model
+    init_db()
+    paths = prepare_images(workdir, args.images, args.seed)
+    model = load_model(args.model, backend=args.backend)
+
+    report = {
+        'environment': environment(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('output', 'workdir')},
+        'images': [{'name': p.name, 'bytes': p.stat().st_size} for p in paths],
+        'suites': {},
+    }
+    for suite in suites:
+        start = time.perf_counter()
+        if suite == 'stages':
+            result = bench_stages(model, paths, args, workdir)
+        elif suite == 'batch':
+            result = bench_batch(model, paths, args)
+        elif suite == 'imgsz':
+            result = bench_imgsz(model, paths, args)
+        elif suite == 'threads':
+            result = bench_threads(paths, args)
+        elif suite == 'cold':
+            result = bench_cold(paths, args)
+        elif suite == 'http':
+            result = bench_http(paths, args)
+        else:
+            raise SystemExit(f"Unknown suite {suite!r}; choose from {', '.join(SUITES)}")
+        report['suites'][suite] = dict(result, suite_seconds=time.perf_counter() - start)
+
+    text = json.dumps(report, indent=2)
+    if output:
+        Path(output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
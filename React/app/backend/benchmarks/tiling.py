@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import argparse
+from pathlib import Path
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from inference import percentile
+from settings import MODEL_PATH, INFERENCE_IMGSZ, TILE_SIZE, TILE_OVERLAP, TILE_SKIP_THRESHOLD
+from tiling import predict_tiled
+
+SAMPLE_IMAGES = Path(__file__).resolve().parents[4] / 'Streamlit' / 'detected_images'
+IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg')
+
+
+def load_labels(label_path: Path, width: int, height: int) -> np.ndarray:
+    # YOLO txt format: class cx cy w h, normalised
+    if not label_path.exists():
+        return np.zeros((0, 5))
+    rows = np.loadtxt(label_path, ndmin=2)
+    if not len(rows):
+        return np.zeros((0, 5))
+    cls, cx, cy, w, h = rows.T
+    return np.stack([
+        cls,
+        (cx - w / 2) * width, (cy - h / 2) * height,
+        (cx + w / 2) * width, (cy + h / 2) * height,
+    ], axis=1)
+
+
+def iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def count_matches(result, labels: np.ndarray, iou_threshold: float) -> int:
+    data = result.boxes.data.cpu().numpy()
+    matched = 0
+    used = np.zeros(len(data), dtype=bool)
+    for label in labels:
+        candidates = (data[:, 5] == label[0]) & ~used if len(data) else np.zeros(0, dtype=bool)
+        if not candidates.any():
+            continue
+        overlaps = np.where(candidates, iou(label[1:], data[:, :4]), 0)
+        best = int(overlaps.argmax())
+        if overlaps[best] >= iou_threshold:
+            used[best] = True
+            matched += 1
+    return matched
+
+
+def summarize(latencies: list, detections: int, matched: int, labelled: int) -> dict:
+    latencies = sorted(latencies)
+    return {
+        'latency_mean': float(np.mean(latencies)) if latencies else 0.0,
+        'latency_p50': percentile(latencies, 50),
+        'latency_p95': percentile(latencies, 95),
+        'detections': detections,
+        'recall': matched / labelled if labelled else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare tiled and whole-image inference")
+    parser.add_argument("--images", default=str(SAMPLE_IMAGES), help="Directory of images to run")
+    parser.add_argument("--labels", help="Directory of YOLO-format .txt labels for recall")
+    parser.add_argument("--model", default=MODEL_PATH, help="Path to the YOLO model file")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per image")
+    parser.add_argument("--iou", type=float, default=0.5, help="IoU for a detection to count as a match")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE)
+    parser.add_argument("--tile-overlap", type=float, default=TILE_OVERLAP)
+    parser.add_argument("--skip-threshold", type=float, default=TILE_SKIP_THRESHOLD)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+
+    args = parser.parse_args()
+
+    model = YOLO(args.model)
+    paths = sorted(p for p in Path(args.images).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    modes = {
+        'whole': lambda image: model(image, imgsz=INFERENCE_IMGSZ, verbose=False)[0],
+        'tiled': lambda image: predict_tiled(model, image, tile_size=args.tile_size, overlap=args.tile_overlap,
+                                             skip_threshold=args.skip_threshold),
+    }
+    totals = {mode: {'latencies': [], 'detections': 0, 'matched': 0} for mode in modes}
+    labelled = 0
+    per_image = []
+
+    for path in paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        height, width = image.shape[:2]
+        labels = load_labels(Path(args.labels) / f"{path.stem}.txt", width, height) if args.labels else np.zeros((0, 5))
+        labelled += len(labels)
+        entry = {'image': path.name, 'width': width, 'height': height, 'labels': len(labels)}
+
+        for mode, run in modes.items():
+            run(image)  # warm-up, untimed
+            latencies = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                result = run(image)
+                latencies.append(time.perf_counter() - start)
+            matched = count_matches(result, labels, args.iou)
+            totals[mode]['latencies'].extend(latencies)
+            totals[mode]['detections'] += len(result.boxes)
+            totals[mode]['matched'] += matched
+            entry[mode] = {
+                'latency_p50': percentile(sorted(latencies), 50),
+                'detections': len(result.boxes),
+                'matched': matched,
+                'tiles_run': getattr(result, 'tiles_run', None),
+                'tiles_skipped': getattr(result, 'tiles_skipped', None),
+            }
+        per_image.append(entry)
+
+    report = {
+        'model': os.path.abspath(args.model),
+        'images': len(per_image),
+        'labelled_objects': labelled,
+        'tile_size': args.tile_size,
+        'tile_overlap': args.tile_overlap,
+        'skip_threshold': args.skip_threshold,
+        'summary': {mode: summarize(t['latencies'], t['detections'], t['matched'], labelled)
+                    for mode, t in totals.items()},
+        'per_image': per_image,
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
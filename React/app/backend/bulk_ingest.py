@@ -0,0 +1,230 @@
+import os
+import hashlib
+import logging
+import tarfile
+import zipfile
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from werkzeug.utils import secure_filename
+from database import open_session
+from db_models import Upload, Analysis
+from analysis import analyze_with_cache, complete_analysis
+from events import record_upload_created
+from metrics import timed_stage
+from storage import blob_store
+from settings import (
+    MODEL_PATH, OUTPUT_FOLDER, IMAGE_EXTENSIONS, INFERENCE_MODE,
+    INGEST_ROOT, INGEST_BATCH_SIZE, INGEST_DECODE_THREADS, INGEST_MAX_ENTRY_BYTES
+)
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_TYPES = {'zip': ('.zip',), 'tar': ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tar.xz')}
+
+
+def archive_type(filename: str):
+    lower = filename.lower()
+    for source_type, suffixes in ARCHIVE_TYPES.items():
+        if lower.endswith(suffixes):
+            return source_type
+    return None
+
+
+def resolve_folder(folder: str) -> str:
+    if not INGEST_ROOT:
+        raise ValueError("Folder ingestion is disabled (INGEST_ROOT is not set)")
+    root = os.path.realpath(INGEST_ROOT)
+    path = os.path.realpath(os.path.join(root, folder))
+    if os.path.commonpath([root, path]) != root or not os.path.isdir(path):
+        raise ValueError(f"Folder not found under ingest root: {folder}")
+    return path
+
+
+def is_image(name: str) -> bool:
+    return name.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS if '.' in name else False
+
+
+def wanted(name: str, size: int, max_bytes: int = INGEST_MAX_ENTRY_BYTES) -> bool:
+    if not is_image(name):
+        return False
+    if size > max_bytes:
+        logger.warning(f"Skipping {name}: {size} bytes exceeds the {max_bytes} byte limit")
+        return False
+    return True
+
+
+def iter_entries(source_type: str, source_path: str, max_bytes: int = INGEST_MAX_ENTRY_BYTES):
+    """Yields ``(name, bytes)`` one entry at a time; archives are never extracted as a whole.
+
+    Names and sizes are checked against the archive's own listing before
+    anything is read: non-images, oversized entries and non-regular tar
+    members yield ``(name, None)`` so the caller can count them as skipped.
+    """
+    if source_type == 'zip':
+        with zipfile.ZipFile(source_path) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                if not wanted(info.filename, info.file_size, max_bytes):
+                    yield info.filename, None
+                    continue
+                with archive.open(info) as f:
+                    # file_size comes from the archive header, which can lie; never read past the limit
+                    data = f.read(max_bytes + 1)
+                yield info.filename, data if len(data) <= max_bytes else None
+    elif source_type == 'tar':
+        with tarfile.open(source_path, mode='r|*') as archive:
+            for member in archive:
+                if member.isdir():
+                    continue
+                if not member.isfile() or not wanted(member.name, member.size, max_bytes):
+                    yield member.name, None
+                    continue
+                yield member.name, archive.extractfile(member).read()
+    elif source_type == 'folder':
+        for dirpath, _, filenames in os.walk(source_path):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, source_path)
+                if not os.path.isfile(path) or not wanted(name, os.path.getsize(path), max_bytes):
+                    yield name, None
+                    continue
+                with open(path, 'rb') as f:
+                    yield name, f.read()
+    else:
+        raise ValueError(f"Unknown ingest source type: {source_type}")
+
+
+def decode_entry(job_id: int, name: str, data: bytes) -> dict:
+    # Runs on the decode pool: hash and decode (both release the GIL); storing happens per batch
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return {
+        'name': name,
+        'filename': f"{job_id}_{secure_filename(name)}",
+        'data': data,
+        'size': len(data),
+        'content_hash': hashlib.sha256(data).hexdigest(),
+        'image': image,
+    }
+
+
+class BulkIngestor:
+    """Ingests an archive or folder of images for one IngestJob.
+
+    Entries are read one at a time and hashed and decoded on a thread pool.
+    Each batch of ``batch_size`` images then goes through the same
+    ``analyze_with_cache`` path as ``/api/analyze/<id>``: result cache,
+    perceptual-hash reuse and INFERENCE_MODE included. The batch is
+    analyzed on concurrent threads so the inference engine can batch it.
+    Originals go into the blob store, which writes only content it does not
+    have yet; undecodable entries are never stored. Each batch's Upload,
+    Analysis and Detection rows go in with a single commit, after which the
+    job's progress counters are updated.
+    """
+
+    def __init__(self, db, job, model_path: str = MODEL_PATH, batch_size: int = INGEST_BATCH_SIZE,
+                 decode_threads: int = INGEST_DECODE_THREADS, mode: str = INFERENCE_MODE):
+        self.db = db
+        self.job = job
+        self.model_path = model_path
+        self.mode = mode
+        self.batch_size = max(1, batch_size)
+        self.decode_threads = max(1, decode_threads)
+
+    def run(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.decode_threads, thread_name_prefix='ingest-decode') as decoders, \
+                ThreadPoolExecutor(max_workers=self.batch_size, thread_name_prefix='ingest-analyze') as analyzers:
+            pending = []
+            for name, data in iter_entries(self.job.source_type, self.job.source_path):
+                if data is None:
+                    self.job.skipped += 1
+                    continue
+                pending.append(decoders.submit(decode_entry, self.job.id, name, data))
+                # Bound the in-flight window so memory stays proportional to one batch
+                if len(pending) >= self.batch_size:
+                    self._process_batch(analyzers, [f.result() for f in pending])
+                    pending = []
+            if pending:
+                self._process_batch(analyzers, [f.result() for f in pending])
+
+    def _analyze(self, item: dict, path: str):
+        # Own session: the similarity lookup reads the database, and sessions are not shared across threads
+        db = open_session(read_only=True)
+        try:
+            return analyze_with_cache(path, self.model_path, OUTPUT_FOLDER, self.mode, item['content_hash'],
+                                      item['data'], db, image=item['image'])
+        finally:
+            db.close()
+
+    def _process_batch(self, analyzers, items: list) -> None:
+        decoded = [item for item in items if item['image'] is not None]
+        for item in items:
+            if item['image'] is None:
+                logger.warning(f"Ingest job {self.job.id}: could not decode {item['name']}")
+
+        paths = [blob_store.store_bytes(self.db, item['data'], item['filename'], item['content_hash'])[0]
+                 for item in decoded]
+        futures = [analyzers.submit(self._analyze, item, path) for item, path in zip(decoded, paths)]
+
+        analyses = []
+        for item, path, future in zip(decoded, paths, futures):
+            try:
+                output_path, metadata = future.result()
+            except RuntimeError as e:
+                logger.warning(f"Ingest job {self.job.id}: analysis of {item['name']} failed: {e}")
+                blob_store.release(self.db, item['content_hash'])
+                continue
+            upload = Upload(
+                user_id=self.job.user_id,
+                filename=item['filename'],
+                original_path=path,
+                file_type=f"image/{item['filename'].rsplit('.', 1)[-1].lower()}",
+                file_size=item['size'],
+                content_hash=item['content_hash']
+            )
+            analysis = Analysis(upload=upload, status='running')
+            metadata = dict(metadata, source=item['name'], ingest_job_id=self.job.id)
+            analyses.append((analysis, output_path, metadata))
+
+        self.db.add_all(analysis for analysis, _, _ in analyses)
+        self.db.flush()
+        for analysis, output_path, metadata in analyses:
+            record_upload_created(self.db, analysis.upload)
+            complete_analysis(self.db, analysis, output_path, metadata)
+
+        self.job.processed += len(analyses)
+        self.job.failed += len(items) - len(analyses)
+        with timed_stage('db_commit'):
+            self.db.commit()
+        logger.info(f"Ingest job {self.job.id}: {self.job.processed} processed, {self.job.failed} failed")
+
+
+def remove_staged_source(source_type: str, source_path: str) -> None:
+    # Uploaded archives are only staging copies; folders belong to the caller
+    if source_type != 'folder' and os.path.exists(source_path):
+        os.remove(source_path)
+
+
+def run_ingest(db, job) -> None:
+    try:
+        BulkIngestor(db, job).run()
+        job.status = 'completed'
+        job.finished_at = datetime.utcnow()
+    finally:
+        remove_staged_source(job.source_type, job.source_path)
+
+
+def ingest_job_to_dict(job) -> dict:
+    return {
+        "ingest_id": job.id,
+        "status": job.status,
+        "source_type": job.source_type,
+        "processed": job.processed,
+        "failed": job.failed,
+        "skipped": job.skipped,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
@@ -0,0 +1,103 @@
+import os
+import time
+import logging
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from model_registry import registry as model_registry
+from inference import get_engine
+from tiling import predict_tiled
+from metrics import registry as metrics_registry, timed_stage, STAGE_SECONDS
+from settings import SCREEN_MODEL_PATH, SCREEN_IMGSZ, SCREEN_THRESHOLD, TILE_MAX_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+CASCADE_MODES = ('cascade', 'tiled-cascade')
+
+CASCADE_DECISIONS = metrics_registry.counter(
+    'windsight_cascade_decisions_total', 'Cascade analyses by the stage that decided them', ('stage',))
+
+
+class Screener:
+    """First, cheap stage of the cascade.
+
+    Runs ``model_path`` (a small detector trained on the same classes) at
+    ``imgsz``, or the full model itself at that reduced size when no
+    screening model is configured. An image or tile is flagged when any box
+    reaches ``threshold``. The threshold is the recall knob: lower it and more
+    borderline images go on to best.pt.
+    """
+
+    def __init__(self, model_path: str = SCREEN_MODEL_PATH, imgsz: int = SCREEN_IMGSZ,
+                 threshold: float = SCREEN_THRESHOLD, max_batch_size: int = TILE_MAX_BATCH_SIZE):
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.threshold = threshold
+        self.max_batch_size = max(1, max_batch_size)
+
+    def describe(self, full_model_path: str) -> dict:
+        return {
+            'screen_model': os.path.basename(self.model_path or full_model_path),
+            'screen_imgsz': self.imgsz,
+            'threshold': self.threshold,
+        }
+
+    def scores(self, images: list, full_model_path: str) -> list:
+        """Highest screening confidence per image, 0.0 where nothing reached the threshold."""
+        model = model_registry.get(self.model_path or full_model_path)
+        scores = []
+        for start in range(0, len(images), self.max_batch_size):
+            batch = images[start:start + self.max_batch_size]
+            for result in model(batch, imgsz=self.imgsz, conf=self.threshold, verbose=False):
+                scores.append(float(result.boxes.conf.max()) if len(result.boxes) else 0.0)
+        return scores
+
+
+def predict_cascade(model_path: str, image: np.ndarray, tiled: bool = False, path: str = '',
+                    timings: dict = None, screener: Screener = None) -> Results:
+    """Screens ``image`` and runs the full model only if the screener flags it.
+
+    With ``tiled`` every textured tile is screened and only flagged tiles go
+    through best.pt. The returned result carries a ``cascade`` dict recording
+    which stage decided the image; ``screen`` and ``inference`` are timed
+    separately into ``timings``.
+    """
+    screener = screener or Screener()
+    timings = {} if timings is None else timings
+    info = screener.describe(model_path)
+
+    if not tiled:
+        with timed_stage('screen', timings):
+            score = screener.scores([image], model_path)[0]
+        info['screen_score'] = round(score, 4)
+        if score >= screener.threshold:
+            with timed_stage('inference', timings):
+                # Escalated images share the engine's batches with plain 'whole' requests
+                result = get_engine(model_path).predict(image)
+        else:
+            names = model_registry.get(model_path).names
+            result = Results(orig_img=image, path=path, names=names, boxes=torch.zeros((0, 6)))
+        info['decided_by'] = 'full' if score >= screener.threshold else 'screen'
+    else:
+        screen_seconds = []
+
+        def screen(tiles):
+            start = time.perf_counter()
+            flags = [score >= screener.threshold for score in screener.scores(tiles, model_path)]
+            screen_seconds.append(time.perf_counter() - start)
+            return flags
+
+        start = time.perf_counter()
+        result = predict_tiled(model_registry.get(model_path), image, path=path, screen=screen)
+        elapsed = time.perf_counter() - start
+        # predict_tiled calls screen() internally; split its time back out so the stages do not overlap
+        for stage, seconds in (('screen', sum(screen_seconds)), ('inference', elapsed - sum(screen_seconds))):
+            STAGE_SECONDS.observe(seconds, stage=stage)
+            timings[stage] = round(timings.get(stage, 0.0) + seconds, 6)
+        info['tiles_escalated'] = result.tiles_run
+        info['tiles_screened_out'] = result.tiles_screened_out
+        info['decided_by'] = 'full' if result.tiles_run else 'screen'
+
+    CASCADE_DECISIONS.inc(stage=info['decided_by'])
+    result.cascade = info
+    return result
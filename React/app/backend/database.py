@@ -1,5 +1,8 @@
 import os
-from sqlalchemy import create_engine
+import time
+import threading
+from collections import deque
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker
 from db_models import Base
 
@@ -9,15 +12,143 @@ DATABASE_URL = os.getenv('DATABASE_URL')
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is not set")
 
-engine = create_engine(DATABASE_URL)
+# Optional replica for read-only listing endpoints; defaults to the primary
+DATABASE_READ_URL = os.getenv('DATABASE_READ_URL', DATABASE_URL)
+
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 30))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', '1') == '1'
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+
+
+def engine_options(url: str) -> dict:
+    options = {
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+    # SQLite uses its own pool classes, which take no sizing arguments
+    if url.startswith('sqlite'):
+        return options
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+    )
+    if url.startswith('postgresql') and DB_STATEMENT_TIMEOUT_MS > 0:
+        options['connect_args'] = {'options': f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return options
+
+
+class PoolMetrics:
+    def __init__(self, engine):
+        self.engine = engine
+        self.in_use = 0
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self._waits = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        event.listen(engine, 'checkout', self._on_checkout)
+        event.listen(engine, 'checkin', self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+
+    def _on_checkin(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.in_use = max(0, self.in_use - 1)
+
+    def record_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+            self._waits.append(seconds)
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                'pool': pool.__class__.__name__,
+                'size': pool.size() if hasattr(pool, 'size') else None,
+                'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+                'checked_in': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+                'in_use': self.in_use,
+                'checkouts': self.checkouts,
+                'checkout_wait_total': self.wait_total,
+                'checkout_wait_max': self.wait_max,
+                'checkout_wait_p95': waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+            }
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+read_engine = engine if DATABASE_READ_URL == DATABASE_URL else create_engine(
+    DATABASE_READ_URL, **engine_options(DATABASE_READ_URL)
+)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadOnlySessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+pool_metrics = {'primary': PoolMetrics(engine)}
+if read_engine is not engine:
+    pool_metrics['read'] = PoolMetrics(read_engine)
+
+
+@event.listens_for(ReadOnlySessionLocal, 'after_begin')
+def _begin_read_only(session, transaction, connection):
+    if connection.dialect.name == 'postgresql':
+        connection.exec_driver_sql('SET TRANSACTION READ ONLY')
+
+
+@event.listens_for(ReadOnlySessionLocal, 'before_flush')
+def _reject_writes(session, flush_context, instances):
+    raise RuntimeError("Attempted to write through a read-only session")
+
+
+def open_session(read_only: bool = False):
+    db = ReadOnlySessionLocal() if read_only else SessionLocal()
+    metrics = pool_metrics['read' if read_only and 'read' in pool_metrics else 'primary']
+    # Check the connection out now so pool waits are measured where they happen
+    start = time.perf_counter()
+    db.connection()
+    metrics.record_wait(time.perf_counter() - start)
+    return db
+
+
+def pool_stats() -> dict:
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+
+def add_missing_columns():
+    # No migration tool here: add nullable columns introduced after a table was created
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
 
 def init_db():
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+    # create_all skips tables that already exist, so add any newer indexes to them
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
 
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
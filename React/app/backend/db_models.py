@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, Float, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Date, DateTime, ForeignKey, Boolean, Float, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -28,20 +28,150 @@ class Upload(Base):
     upload_date = Column(DateTime, default=datetime.utcnow)
     file_type = Column(String)
     file_size = Column(Float)
+    content_hash = Column(String(64), index=True)
 
     user = relationship('User', back_populates='uploads')
     analyses = relationship('Analysis', back_populates='upload')
 
+    __table_args__ = (
+        Index('ix_uploads_user_upload_date', 'user_id', 'upload_date', 'id'),
+        # Resolves /uploads/<filename> and /api/image/upload/<filename> to the stored blob
+        Index('ix_uploads_filename', 'filename', 'id'),
+    )
+
+class Blob(Base):
+    __tablename__ = 'blobs'
+
+    # One row per distinct file content; Upload.content_hash points here
+    content_hash = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    ref_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    released_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_blobs_ref_count_released_at', 'ref_count', 'released_at'),
+    )
+
 class Analysis(Base):
     __tablename__ = 'analyses'
 
     id = Column(Integer, primary_key=True)
-    upload_id = Column(Integer, ForeignKey('uploads.id'), nullable=False)
+    upload_id = Column(Integer, ForeignKey('uploads.id'), nullable=False, index=True)
     analysis_date = Column(DateTime, default=datetime.utcnow)
     status = Column(String, nullable=False)
     result_path = Column(String)
     analysis_metadata = Column(JSON)  
+    # Lease of the worker running it; see jobs.recover_stale_jobs
+    claimed_at = Column(DateTime)
+    attempts = Column(Integer)
     upload = relationship('Upload', back_populates='analyses')
+    detections = relationship('Detection', back_populates='analysis')
+
+class ImageHash(Base):
+    __tablename__ = 'image_hashes'
+
+    # Perceptual hash of each analyzed image, loaded into similarity.PhashIndex
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey('analyses.id'), nullable=False)
+    model_key = Column(String, nullable=False)
+    phash = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index('ix_image_hashes_model_key_id', 'model_key', 'id'),
+    )
+
+class Detection(Base):
+    __tablename__ = 'detections'
+
+    id = Column(Integer, primary_key=True)
+    analysis_id = Column(Integer, ForeignKey('analyses.id'), nullable=False, index=True)
+    # Denormalized from Upload/Analysis so defect queries never need a join
+    upload_id = Column(Integer, ForeignKey('uploads.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    detected_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    model_version = Column(String)
+    frame = Column(Integer)
+    class_id = Column(Integer, nullable=False)
+    class_name = Column(String, nullable=False)
+    confidence = Column(Float, nullable=False)
+    x1 = Column(Float, nullable=False)
+    y1 = Column(Float, nullable=False)
+    x2 = Column(Float, nullable=False)
+    y2 = Column(Float, nullable=False)
+
+    analysis = relationship('Analysis', back_populates='detections')
+
+    __table_args__ = (
+        # Serves /api/detections keyset pages (newest id first) for one user
+        Index('ix_detections_user_id_id', 'user_id', 'id'),
+        Index('ix_detections_user_class_confidence', 'user_id', 'class_name', 'confidence'),
+        Index('ix_detections_user_detected_at', 'user_id', 'detected_at'),
+        Index('ix_detections_class_confidence', 'class_name', 'confidence'),
+    )
+
+
+class DefectRollup(Base):
+    __tablename__ = 'defect_rollups'
+
+    # Detections per day, user, class and confidence decile, kept current by rollups.record_analysis
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    class_name = Column(String, primary_key=True)
+    confidence_bucket = Column(Integer, primary_key=True)
+    detections = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_defect_rollups_user_day', 'user_id', 'day'),
+    )
+
+
+class AnalysisRollup(Base):
+    __tablename__ = 'analysis_rollups'
+
+    # Completed analyses per day and user, and how many of them found anything
+    day = Column(Date, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    analyses = Column(Integer, nullable=False, default=0)
+    with_detections = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_analysis_rollups_user_day', 'user_id', 'day'),
+    )
+
+
+class IngestJob(Base):
+    __tablename__ = 'ingest_jobs'
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    source_type = Column(String, nullable=False)
+    source_path = Column(String, nullable=False)
+    status = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+    processed = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    error = Column(String)
+    claimed_at = Column(DateTime)
+    attempts = Column(Integer)
+
+
+class Event(Base):
+    __tablename__ = 'events'
+
+    # Append-only change feed behind /api/events, written in the same transaction as the change
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
+    kind = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        Index('ix_events_user_id_id', 'user_id', 'id'),
+    )
 
 
 class Subscription(Base):
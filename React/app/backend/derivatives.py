@@ -0,0 +1,157 @@
+import os
+import glob
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from inference import load_image
+from analysis import is_video
+from settings import (
+    DERIVATIVE_FOLDER, DERIVATIVE_SIZES, DERIVATIVE_FORMATS, DERIVATIVE_DEFAULT_QUALITY,
+    DERIVATIVE_WORKERS, DERIVATIVE_MAX_PENDING
+)
+
+logger = logging.getLogger(__name__)
+
+ENCODE_PARAMS = {
+    'jpeg': ('.jpg', cv2.IMWRITE_JPEG_QUALITY),
+    'webp': ('.webp', cv2.IMWRITE_WEBP_QUALITY),
+}
+MIMETYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+
+
+class DerivativeError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_quality(value) -> int:
+    if value in (None, ''):
+        return DERIVATIVE_DEFAULT_QUALITY
+    try:
+        quality = int(value)
+    except ValueError:
+        raise DerivativeError("quality must be an integer")
+    # Round to steps of 5 so arbitrary values cannot fill the disk with variants
+    return min(95, max(10, 5 * round(quality / 5)))
+
+
+def read_frame(source: str):
+    if not is_video(source):
+        return load_image(source)
+    capture = cv2.VideoCapture(source)
+    try:
+        ok, frame = capture.read()
+    finally:
+        capture.release()
+    if not ok:
+        raise RuntimeError(f"Could not read a frame from {source}")
+    return frame
+
+
+def render_derivative(source: str, width: int, fmt: str, quality: int) -> bytes:
+    image = read_frame(source)
+    height, original_width = image.shape[:2]
+    longest = max(height, original_width)
+    if longest > width:
+        scale = width / longest
+        size = (max(1, round(original_width * scale)), max(1, round(height * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    extension, flag = ENCODE_PARAMS[fmt]
+    ok, encoded = cv2.imencode(extension, image, [flag, quality])
+    if not ok:
+        raise RuntimeError(f"Could not encode {source} as {fmt}")
+    return encoded.tobytes()
+
+
+class DerivativeService:
+    """Generates resized, re-encoded copies of images on demand and keeps them on disk.
+
+    A derivative is named after its variant (size, quality) and the source's
+    mtime and size, so rewriting the source yields a new file and the stale
+    one is removed once its replacement exists. Rendering runs on a fixed
+    thread pool; concurrent requests for the same derivative share one
+    render, and requests beyond ``max_pending`` are refused rather than queued.
+    """
+
+    def __init__(self, root: str = DERIVATIVE_FOLDER, workers: int = DERIVATIVE_WORKERS,
+                 max_pending: int = DERIVATIVE_MAX_PENDING):
+        self.root = root
+        self.max_pending = max_pending
+        self.generated = 0
+        self.served = 0
+        self.rejected = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="derivatives")
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def path_for(self, source: str, size: str, fmt: str, quality: int) -> str:
+        stat = os.stat(source)
+        digest = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()
+        name = f"{size}-q{quality}-{stat.st_mtime_ns}-{stat.st_size}{ENCODE_PARAMS[fmt][0]}"
+        return os.path.join(self.root, digest[:2], digest, name)
+
+    def get(self, source: str, size: str, fmt: str, quality: int = DERIVATIVE_DEFAULT_QUALITY,
+            timeout: float = 30) -> str:
+        if size not in DERIVATIVE_SIZES:
+            raise DerivativeError(f"size must be one of {', '.join(sorted(DERIVATIVE_SIZES))}")
+        if fmt not in DERIVATIVE_FORMATS:
+            raise DerivativeError(f"format must be one of {', '.join(sorted(DERIVATIVE_FORMATS))}")
+        if not os.path.isfile(source):
+            raise DerivativeError("File not found", 404)
+
+        path = self.path_for(source, size, fmt, quality)
+        if os.path.exists(path):
+            with self._lock:
+                self.served += 1
+            return path
+
+        with self._lock:
+            future = self._inflight.get(path)
+            if future is None:
+                if len(self._inflight) >= self.max_pending:
+                    self.rejected += 1
+                    raise DerivativeError("Too many thumbnails being generated, retry shortly", 503)
+                future = self._executor.submit(self._generate, source, path, size, fmt, quality)
+                self._inflight[path] = future
+                future.add_done_callback(lambda _: self._forget(path))
+        future.result(timeout=timeout)
+        return path
+
+    def _forget(self, path: str) -> None:
+        with self._lock:
+            self._inflight.pop(path, None)
+
+    def _generate(self, source: str, path: str, size: str, fmt: str, quality: int) -> None:
+        data = render_derivative(source, DERIVATIVE_SIZES[size], fmt, quality)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        # Drop renders of the same variant made from an older version of the source
+        for stale in glob.glob(os.path.join(os.path.dirname(path), f"{size}-q{quality}-*{ENCODE_PARAMS[fmt][0]}")):
+            if stale != path:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        with self._lock:
+            self.generated += 1
+        logger.info(f"Rendered {size} {fmt} derivative of {source} ({len(data)} bytes)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'generated': self.generated,
+                'served_from_disk': self.served,
+                'rejected': self.rejected,
+                'pending': len(self._inflight),
+                'max_pending': self.max_pending,
+            }
+
+
+derivatives = DerivativeService()
@@ -0,0 +1,81 @@
+from datetime import datetime
+from db_models import Detection
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def iter_detections(metadata: dict):
+    # Images keep a flat list; videos keep one list per analysed frame
+    for detection in metadata.get('detections') or []:
+        yield None, detection
+    for frame in metadata.get('frames') or []:
+        for detection in frame['detections']:
+            yield frame['frame'], detection
+
+
+def store_detections(db, analysis, user_id: int, metadata: dict) -> int:
+    detected_at = analysis.analysis_date or datetime.utcnow()
+    model_version = metadata.get('model_version')
+    rows = [{
+        'analysis_id': analysis.id,
+        'upload_id': analysis.upload_id,
+        'user_id': user_id,
+        'detected_at': detected_at,
+        'model_version': model_version,
+        'frame': frame,
+        'class_id': detection['class_id'],
+        'class_name': detection['class_name'],
+        'confidence': detection['confidence'],
+        'x1': detection['bbox'][0],
+        'y1': detection['bbox'][1],
+        'x2': detection['bbox'][2],
+        'y2': detection['bbox'][3],
+    } for frame, detection in iter_detections(metadata)]
+    if rows:
+        db.bulk_insert_mappings(Detection, rows)
+    return len(rows)
+
+
+def query_detections(db, user_id: int = None, class_name: str = None, min_confidence: float = None,
+                     max_confidence: float = None, start_date: datetime = None, end_date: datetime = None,
+                     model_version: str = None, cursor: int = None, limit: int = DEFAULT_PAGE_SIZE) -> tuple:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(Detection)
+    if user_id is not None:
+        query = query.filter(Detection.user_id == user_id)
+    if class_name:
+        query = query.filter(Detection.class_name == class_name)
+    if min_confidence is not None:
+        query = query.filter(Detection.confidence >= min_confidence)
+    if max_confidence is not None:
+        query = query.filter(Detection.confidence <= max_confidence)
+    if start_date is not None:
+        query = query.filter(Detection.detected_at >= start_date)
+    if end_date is not None:
+        query = query.filter(Detection.detected_at < end_date)
+    if model_version:
+        query = query.filter(Detection.model_version == model_version)
+    # Keyset pagination: newest first, continue below the last id seen. ix_detections_user_id_id
+    # (or the primary key, fleet-wide) walks this order directly, so deep pages cost the same as the first.
+    if cursor is not None:
+        query = query.filter(Detection.id < cursor)
+
+    rows = query.order_by(Detection.id.desc()).limit(limit + 1).all()
+    next_cursor = rows[limit - 1].id if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def detection_to_dict(detection) -> dict:
+    return {
+        "id": detection.id,
+        "analysis_id": detection.analysis_id,
+        "upload_id": detection.upload_id,
+        "detected_at": detection.detected_at.isoformat(),
+        "model_version": detection.model_version,
+        "frame": detection.frame,
+        "class_id": detection.class_id,
+        "class_name": detection.class_name,
+        "confidence": detection.confidence,
+        "bbox": [detection.x1, detection.y1, detection.x2, detection.y2]
+    }
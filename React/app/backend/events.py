@@ -0,0 +1,199 @@
+import json
+import time
+import queue
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from db_models import Event
+from uploads import upload_to_dict
+from metrics import registry as metrics_registry
+from settings import EVENT_POLL_INTERVAL, EVENT_QUEUE_SIZE, EVENT_RETENTION_SECONDS
+
+logger = logging.getLogger(__name__)
+
+SYNC_OVERLAP = 1000
+REPLAY_LIMIT = 1000
+
+EVENT_SUBSCRIBERS = metrics_registry.gauge(
+    'windsight_event_subscribers', 'Open /api/events streams in this process')
+
+
+def record_event(db, user_id: int, kind: str, payload: dict) -> None:
+    # Added to the caller's transaction, so the event commits (or rolls back) with the change it describes
+    db.add(Event(user_id=user_id, kind=kind, payload=payload))
+
+
+def record_upload_created(db, upload) -> None:
+    if upload.id is None:
+        db.flush()
+    record_event(db, upload.user_id, 'upload.created', upload_to_dict(upload))
+
+
+def record_analysis_event(db, analysis) -> None:
+    if analysis.id is None:
+        db.flush()
+    metadata = analysis.analysis_metadata or {}
+    payload = {
+        'upload_id': analysis.upload_id,
+        'analysis': {'id': analysis.id, 'status': analysis.status, 'result_path': analysis.result_path},
+    }
+    if analysis.result_path:
+        payload['result_url'] = f"/api/image/output/{analysis.result_path}"
+    if metadata.get('error'):
+        payload['error'] = metadata['error']
+    record_event(db, analysis.upload.user_id, f"analysis.{analysis.status}", payload)
+
+
+def event_to_dict(event) -> dict:
+    return {'id': event.id, 'kind': event.kind, 'data': event.payload}
+
+
+def format_sse(event: dict) -> str:
+    return f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+def replay_events(db, user_id: int, after_id: int, limit: int = REPLAY_LIMIT) -> tuple:
+    """Events for ``user_id`` after ``after_id``; returns ``(events, complete)``.
+
+    ``complete`` is False when some of the missed events may already have
+    been pruned, or there are more than ``limit`` of them; the client should
+    then reload its list instead of applying the deltas.
+    """
+    oldest = db.query(func.min(Event.id)).scalar()
+    rows = db.query(Event).filter(Event.user_id == user_id, Event.id > after_id) \
+        .order_by(Event.id).limit(limit + 1).all()
+    complete = len(rows) <= limit and oldest is not None and oldest <= after_id + 1
+    return [event_to_dict(row) for row in rows[:limit]], complete
+
+
+def prune_events(db, retention_seconds: int = EVENT_RETENTION_SECONDS) -> int:
+    cutoff = datetime.utcnow() - timedelta(seconds=retention_seconds)
+    deleted = db.query(Event).filter(Event.created_at < cutoff).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+
+class EventSubscription:
+    def __init__(self, user_id: int, maxsize: int = EVENT_QUEUE_SIZE):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize)
+        self.dropped = False
+
+    def get(self, timeout: float):
+        # None once the broadcaster has dropped this subscriber for falling behind
+        if self.dropped:
+            return None
+        return self.queue.get(timeout=timeout)
+
+
+class EventBroadcaster:
+    """Fans the ``events`` table out to the open /api/events streams.
+
+    Changes are written to ``events`` by whichever process makes them (web
+    requests, analysis workers). One thread per web process tails the table
+    by id every ``poll_interval``, however many dashboards are connected,
+    and hands each event to the queues of that user's streams. Like
+    ``PhashIndex`` it re-reads a short id overlap, because ids can commit
+    out of order. A stream whose queue fills up is dropped; the browser
+    reconnects with Last-Event-ID and catches up from the table. The thread
+    stops when the last stream closes.
+    """
+
+    def __init__(self, poll_interval: float = EVENT_POLL_INTERVAL, queue_size: int = EVENT_QUEUE_SIZE):
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._last_id = None
+        self._delivered = set()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def _session(self):
+        from database import SessionLocal
+        return SessionLocal()
+
+    def subscribe(self, user_id: int) -> EventSubscription:
+        subscription = EventSubscription(user_id, self.queue_size)
+        with self._lock:
+            if self._last_id is None:
+                # Start from the current end of the table; anything earlier is the caller's to replay
+                db = self._session()
+                try:
+                    self._last_id = db.query(func.max(Event.id)).scalar() or 0
+                    # Already in the past for every stream; the overlap re-read must not deliver them
+                    self._delivered = {i for (i,) in db.query(Event.id).filter(
+                        Event.id > self._last_id - SYNC_OVERLAP)}
+                finally:
+                    db.close()
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='event-broadcaster', daemon=True)
+                self._thread.start()
+            EVENT_SUBSCRIBERS.set(sum(len(s) for s in self._subscribers.values()))
+        return subscription
+
+    def unsubscribe(self, subscription: EventSubscription) -> None:
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+            EVENT_SUBSCRIBERS.set(sum(len(s) for s in self._subscribers.values()))
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    self._last_id = None
+                    self._delivered = set()
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"Event broadcaster poll failed: {e}")
+
+    def poll(self) -> None:
+        db = self._session()
+        try:
+            # Ids only (primary key) for the overlap; full rows just for the events not yet delivered
+            ids = [i for (i,) in db.query(Event.id).filter(Event.id > self._last_id - SYNC_OVERLAP)]
+            new_ids = [i for i in ids if i not in self._delivered]
+            rows = db.query(Event).filter(Event.id.in_(new_ids)).order_by(Event.id).all() if new_ids else []
+            events = [(row.user_id, event_to_dict(row)) for row in rows]
+        finally:
+            db.close()
+
+        with self._lock:
+            for user_id, event in events:
+                self._delivered.add(event['id'])
+                for subscription in self._subscribers.get(user_id, ()):
+                    if subscription.dropped:
+                        continue
+                    try:
+                        subscription.queue.put_nowait(event)
+                        self.published += 1
+                    except queue.Full:
+                        subscription.dropped = True
+                        self.dropped += 1
+            if ids:
+                self._last_id = max(self._last_id, max(ids))
+                self._delivered = {i for i in self._delivered if i > self._last_id - SYNC_OVERLAP}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'streams': sum(len(s) for s in self._subscribers.values()),
+                'users': len(self._subscribers),
+                'last_event_id': self._last_id,
+                'published': self.published,
+                'dropped_streams': self.dropped,
+            }
+
+
+broadcaster = EventBroadcaster()
@@ -0,0 +1,173 @@
+import io
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+import cv2
+import numpy as np
+from PIL import Image
+from model_registry import registry as model_registry
+from settings import INFERENCE_IMGSZ, INFERENCE_MAX_BATCH_SIZE, INFERENCE_MAX_WAIT_MS
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceEngine:
+    """Collects concurrent single-image requests into batched forward passes.
+
+    Callers decode their image and block on a future; a background thread
+    drains the queue for up to ``max_wait_ms`` or ``max_batch_size`` images,
+    runs one batched predict at ``imgsz`` and hands each caller its result.
+    The predictor letterboxes every image to ``imgsz`` so the batch stacks
+    into one tensor, and boxes come back in original image coordinates.
+    """
+
+    def __init__(self, model_path: str, max_batch_size: int = INFERENCE_MAX_BATCH_SIZE,
+                 max_wait_ms: float = INFERENCE_MAX_WAIT_MS, imgsz: int = INFERENCE_IMGSZ):
+        self.model_path = model_path
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.imgsz = imgsz
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._batches = 0
+        self._images = 0
+        self._busy_time = 0.0
+        self._started_at = time.time()
+
+        self._thread = threading.Thread(target=self._run, name="inference-engine", daemon=True)
+        self._thread.start()
+
+    def submit(self, source) -> Future:
+        image = load_image(source)
+        future = Future()
+        self._queue.put((image, future, time.perf_counter()))
+        return future
+
+    def predict(self, source, timeout: float = None):
+        return self.submit(source).result(timeout=timeout)
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            images = [item[0] for item in batch]
+            start = time.perf_counter()
+            try:
+                model = model_registry.get(self.model_path)
+                results = model(images, imgsz=self.imgsz, verbose=False)
+            except Exception as e:
+                logger.error(f"Batched prediction failed for {len(batch)} image(s): {e}")
+                for _, future, _ in batch:
+                    future.set_exception(RuntimeError(f"Prediction failed: {e}"))
+                continue
+            end = time.perf_counter()
+
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+            with self._stats_lock:
+                self._batches += 1
+                self._images += len(batch)
+                self._busy_time += end - start
+                self._latencies.extend(end - enqueued for _, _, enqueued in batch)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            elapsed = time.time() - self._started_at
+            return {
+                'model_path': self.model_path,
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000.0,
+                'imgsz': self.imgsz,
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'images': self._images,
+                'avg_batch_size': self._images / self._batches if self._batches else 0.0,
+                'images_per_second': self._images / elapsed if elapsed > 0 else 0.0,
+                'inference_images_per_second': self._images / self._busy_time if self._busy_time > 0 else 0.0,
+                'latency_p50': percentile(latencies, 50),
+                'latency_p95': percentile(latencies, 95),
+                'latency_p99': percentile(latencies, 99),
+            }
+
+
+def load_image(source) -> np.ndarray:
+    if isinstance(source, np.ndarray):
+        return source
+    image = cv2.imread(str(source))
+    if image is None:
+        # OpenCV cannot read GIFs; fall back to Pillow and convert to BGR
+        try:
+            with Image.open(source) as img:
+                image = np.ascontiguousarray(np.asarray(img.convert('RGB'))[..., ::-1])
+        except Exception as e:
+            raise RuntimeError(f"Could not decode image {source}: {e}")
+    return image
+
+
+def decode_image(data: bytes) -> np.ndarray:
+    # np.frombuffer wraps the request bytes without copying them; only the decoded pixels are new
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                image = np.ascontiguousarray(np.asarray(img.convert('RGB'))[..., ::-1])
+        except Exception as e:
+            raise RuntimeError(f"Could not decode image: {e}")
+    return image
+
+
+def result_to_detections(result) -> list:
+    names = result.names
+    detections = []
+    for box in result.boxes:
+        class_id = int(box.cls.item())
+        detections.append({
+            'class_id': class_id,
+            'class_name': names[class_id],
+            'confidence': round(float(box.conf.item()), 4),
+            'bbox': [round(float(v), 1) for v in box.xyxy[0].tolist()],
+        })
+    return detections
+
+
+def percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_path: str) -> InferenceEngine:
+    with _engines_lock:
+        engine = _engines.get(model_path)
+        if engine is None:
+            engine = _engines[model_path] = InferenceEngine(model_path)
+        return engine
+
+
+def engine_stats() -> list:
+    return [engine.stats() for engine in _engines.values()]
+
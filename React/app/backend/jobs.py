@@ -0,0 +1,345 @@
+import time
+import logging
+import threading
+import multiprocessing
+from sqlalchemy import func
+from datetime import datetime, timedelta
+from database import engine, SessionLocal
+from db_models import Analysis, IngestJob
+from analysis import run_analysis
+from bulk_ingest import run_ingest, remove_staged_source
+from inference import engine_stats
+from result_cache import result_cache
+from process_stats import publish_stats
+from events import record_analysis_event, prune_events
+from metrics import registry as metrics_registry, timed_stage, set_engine_gauges, ANALYSES_TOTAL, STAGE_SECONDS
+from settings import (ANALYSIS_WORKERS, ANALYSIS_POLL_INTERVAL, ANALYSIS_WORKER_THREADS, INFERENCE_STATS_INTERVAL,
+                      JOB_HEARTBEAT_INTERVAL, JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, WORKER_SUPERVISE_INTERVAL)
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ('queued', 'running', 'completed', 'failed')
+ACTIVE_STATUSES = ('queued', 'running')
+EVENT_PRUNE_INTERVAL = 60.0
+
+_pool = []
+_pool_lock = threading.Lock()
+
+# Jobs this process is running, by model, for the heartbeat to keep their leases
+_running = {Analysis: set(), IngestJob: set()}
+_running_lock = threading.Lock()
+_recovered_at = {}
+
+
+def enqueue_analysis(db, upload) -> Analysis:
+    # Re-clicking "Analyze" while a job is pending returns the pending job
+    existing = db.query(Analysis).filter(
+        Analysis.upload_id == upload.id,
+        Analysis.status.in_(ACTIVE_STATUSES)
+    ).first()
+    if existing:
+        return existing
+
+    analysis = Analysis(upload=upload, status='queued')
+    db.add(analysis)
+    record_analysis_event(db, analysis)
+    db.commit()
+    db.refresh(analysis)
+    return analysis
+
+
+def recover_stale_jobs(db, model, lease_seconds: float = JOB_LEASE_SECONDS,
+                       max_attempts: int = JOB_MAX_ATTEMPTS) -> int:
+    """Requeues or fails 'running' jobs whose worker stopped refreshing the lease.
+
+    Analyses go back to the queue until they have been claimed
+    ``max_attempts`` times, so an image that kills its worker cannot loop
+    forever. Ingest jobs are failed instead: the batches they already
+    committed would be imported again.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=lease_seconds)
+    stale = db.query(model).filter(
+        model.status == 'running',
+        (model.claimed_at < cutoff) | (model.claimed_at.is_(None))
+    ).all()
+    recovered = 0
+    staged = []
+    for job in stale:
+        requeue = model is Analysis and (job.attempts or 0) < max_attempts
+        # Conditional, like the claim, so only one worker recovers each job and a late heartbeat wins
+        updated = db.query(model).filter(
+            model.id == job.id,
+            model.status == 'running',
+            (model.claimed_at < cutoff) | (model.claimed_at.is_(None))
+        ).update({'status': 'queued' if requeue else 'failed'}, synchronize_session=False)
+        if not updated:
+            continue
+        db.refresh(job)
+        error = f"Worker stopped responding after {job.attempts or 0} attempt(s)"
+        logger.warning(f"{model.__name__} {job.id}: {'requeued' if requeue else 'failed'}, lease expired")
+        if model is Analysis:
+            if not requeue:
+                job.analysis_metadata = {'error': error}
+                ANALYSES_TOTAL.inc(status='failed')
+            record_analysis_event(db, job)
+        else:
+            job.error = error
+            job.finished_at = datetime.utcnow()
+            staged.append((job.source_type, job.source_path))
+        recovered += 1
+    db.commit()
+    # After the commit: run_ingest's cleanup died with the worker, and nothing will run these jobs again
+    for source_type, source_path in staged:
+        try:
+            remove_staged_source(source_type, source_path)
+        except OSError as e:
+            logger.warning(f"Failed to remove staged ingest source {source_path}: {e}")
+    return recovered
+
+
+def _maybe_recover(db, model) -> None:
+    # Every consumer thread calls claim_next each poll; one lease sweep per heartbeat interval is plenty
+    now = time.monotonic()
+    with _running_lock:
+        if now - _recovered_at.get(model, 0.0) < JOB_HEARTBEAT_INTERVAL:
+            return
+        _recovered_at[model] = now
+    try:
+        recover_stale_jobs(db, model)
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"Failed to recover stale {model.__tablename__}: {e}")
+
+
+def claim_next(db, model):
+    _maybe_recover(db, model)
+    while True:
+        candidate = db.query(model.id).filter(
+            model.status == 'queued'
+        ).order_by(model.id).first()
+        if candidate is None:
+            return None
+
+        # Conditional update so two workers never run the same job
+        claimed = db.query(model).filter(
+            model.id == candidate.id,
+            model.status == 'queued'
+        ).update({
+            'status': 'running',
+            'claimed_at': datetime.utcnow(),
+            'attempts': func.coalesce(model.attempts, 0) + 1,
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            with _running_lock:
+                _running[model].add(candidate.id)
+            return db.query(model).get(candidate.id)
+
+
+def release_claim(model, job_id: int) -> None:
+    with _running_lock:
+        _running[model].discard(job_id)
+
+
+def heartbeat(interval: float = JOB_HEARTBEAT_INTERVAL) -> None:
+    # Keeps the leases of this process's running jobs fresh; stops with the process, so their leases lapse
+    while True:
+        time.sleep(interval)
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            for model, running in _running.items():
+                with _running_lock:
+                    ids = list(running)
+                if ids:
+                    db.query(model).filter(model.id.in_(ids), model.status == 'running') \
+                        .update({'claimed_at': now}, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"Failed to refresh job leases: {e}")
+        finally:
+            db.close()
+
+
+def claim_next_job(db):
+    return claim_next(db, Analysis)
+
+
+def enqueue_ingest(db, user_id: int, source_type: str, source_path: str) -> IngestJob:
+    job = IngestJob(
+        user_id=user_id,
+        source_type=source_type,
+        source_path=source_path,
+        status='queued',
+        processed=0,
+        failed=0,
+        skipped=0
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def process_ingest(db, job) -> None:
+    logger.info(f"Running ingest job {job.id} ({job.source_type})")
+    try:
+        run_ingest(db, job)
+        db.commit()
+        logger.info(f"Ingest job {job.id} completed: {job.processed} image(s)")
+    except Exception as e:
+        # Roll back first: anything set on the job before the rollback would be discarded with it
+        db.rollback()
+        logger.error(f"Ingest job {job.id} failed: {e}")
+        job.status = 'failed'
+        job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.commit()
+
+
+def process_job(db, analysis) -> None:
+    logger.info(f"Running analysis job {analysis.id} for upload {analysis.upload_id}")
+    record_analysis_event(db, analysis)
+    db.commit()
+    if analysis.analysis_date is not None:
+        STAGE_SECONDS.observe(max(0.0, (datetime.utcnow() - analysis.analysis_date).total_seconds()),
+                              stage='queue_wait')
+    try:
+        run_analysis(db, analysis)
+        with timed_stage('db_commit'):
+            db.commit()
+        ANALYSES_TOTAL.inc(status='completed')
+        logger.info(f"Analysis job {analysis.id} completed")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Analysis job {analysis.id} failed: {e}")
+        analysis.status = 'failed'
+        analysis.analysis_metadata = {'error': str(e)}
+        record_analysis_event(db, analysis)
+        db.commit()
+        ANALYSES_TOTAL.inc(status='failed')
+
+
+def consume_jobs(poll_interval: float = ANALYSIS_POLL_INTERVAL) -> None:
+    while True:
+        db = SessionLocal()
+        try:
+            analysis = claim_next_job(db)
+            if analysis is not None:
+                job_id = analysis.id
+                try:
+                    process_job(db, analysis)
+                finally:
+                    release_claim(Analysis, job_id)
+                continue
+            # Single analyses first; bulk ingests only when nothing interactive is waiting
+            ingest = claim_next(db, IngestJob)
+            if ingest is not None:
+                job_id = ingest.id
+                try:
+                    process_ingest(db, ingest)
+                finally:
+                    release_claim(IngestJob, job_id)
+                continue
+            time.sleep(poll_interval)
+        except Exception as e:
+            logger.error(f"Analysis worker error: {e}")
+            time.sleep(poll_interval)
+        finally:
+            db.close()
+
+
+def report_stats(interval: float = INFERENCE_STATS_INTERVAL) -> None:
+    pruned_at = time.monotonic()
+    while True:
+        time.sleep(interval)
+        if time.monotonic() - pruned_at >= EVENT_PRUNE_INTERVAL:
+            # Workers always run, so they keep the events table short even when no dashboard is open
+            pruned_at = time.monotonic()
+            db = SessionLocal()
+            try:
+                prune_events(db)
+            except Exception as e:
+                db.rollback()
+                logger.warning(f"Failed to prune events: {e}")
+            finally:
+                db.close()
+        try:
+            engines = engine_stats()
+            set_engine_gauges(engines)
+            publish_stats({
+                'engines': engines,
+                'result_cache': result_cache.stats(),
+                'metrics': metrics_registry.snapshot(),
+            })
+        except OSError as e:
+            logger.warning(f"Failed to publish worker stats: {e}")
+
+
+def worker_loop(poll_interval: float = ANALYSIS_POLL_INTERVAL, threads: int = ANALYSIS_WORKER_THREADS) -> None:
+    # Connections inherited from the parent must not be shared with the child
+    engine.dispose()
+
+    # Several consumers per process keep the inference engine's batches full
+    consumers = [
+        threading.Thread(target=consume_jobs, args=(poll_interval,), name=f"analysis-consumer-{i}", daemon=True)
+        for i in range(max(1, threads))
+    ]
+    for consumer in consumers:
+        consumer.start()
+    threading.Thread(target=report_stats, name="worker-stats", daemon=True).start()
+    threading.Thread(target=heartbeat, name="job-heartbeat", daemon=True).start()
+    for consumer in consumers:
+        consumer.join()
+
+
+def start_worker_pool(workers: int = ANALYSIS_WORKERS, daemon: bool = True) -> list:
+    ctx = multiprocessing.get_context('spawn')
+    processes = []
+    for i in range(workers):
+        process = ctx.Process(target=worker_loop, name=f"analysis-worker-{i}", daemon=daemon)
+        process.start()
+        processes.append(process)
+    logger.info(f"Started {workers} analysis worker(s)")
+    return processes
+
+
+def ensure_workers(workers: int = ANALYSIS_WORKERS, daemon: bool = True) -> None:
+    # Starts whatever part of the pool is missing, including workers that have died
+    if workers <= 0:
+        return
+    with _pool_lock:
+        _pool[:] = [p for p in _pool if p.is_alive()]
+        missing = workers - len(_pool)
+        if missing > 0:
+            _pool.extend(start_worker_pool(missing, daemon=daemon))
+
+
+def supervise_workers(workers: int = ANALYSIS_WORKERS, daemon: bool = True,
+                      interval: float = WORKER_SUPERVISE_INTERVAL) -> None:
+    """Keeps ``workers`` analysis processes running; never returns.
+
+    Run it from exactly one long-lived process (worker.py, or ``python
+    app.py`` in development), never from web requests: enqueueing only
+    commits a row, so a failed spawn is logged and retried here instead of
+    failing a request whose job is already queued.
+    """
+    while True:
+        try:
+            ensure_workers(workers, daemon=daemon)
+        except Exception as e:
+            logger.error(f"Failed to start analysis workers: {e}")
+        time.sleep(interval)
+
+
+def job_to_dict(analysis) -> dict:
+    metadata = analysis.analysis_metadata or {}
+    return {
+        "job_id": analysis.id,
+        "upload_id": analysis.upload_id,
+        "status": analysis.status,
+        "result_path": analysis.result_path,
+        "error": metadata.get('error'),
+        "analysis_date": analysis.analysis_date.isoformat() if analysis.analysis_date else None
+    }
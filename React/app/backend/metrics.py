@@ -0,0 +1,211 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Seconds; covers a cache hit (~ms) up to a long video (minutes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+def _label_key(labelnames: tuple, labels: dict) -> tuple:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {labelnames}, got {tuple(labels)}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[dict(zip(self.labelnames, key)), value] for key, value in self._values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labels': list(self.labelnames), 'samples': samples}
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry['buckets'][i] += 1
+            entry['sum'] += value
+            entry['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = [[dict(zip(self.labelnames, key)), dict(value, buckets=list(value['buckets']))]
+                       for key, value in self._values.items()]
+        return {'type': self.type, 'help': self.documentation, 'labels': list(self.labelnames),
+                'bounds': list(self.buckets), 'samples': samples}
+
+
+class MetricsRegistry:
+    """Process-local metrics with a JSON snapshot and Prometheus text rendering.
+
+    Analysis workers run in separate processes, so each one publishes its
+    snapshot through process_stats and the web process merges them with its
+    own when rendering ``/metrics``: counters and histograms are summed, and
+    gauges are summed too (per-process queue depths add up to the total).
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name: str, documentation: str, labelnames: tuple = (), **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {metric.name: metric.snapshot() for metric in metrics}
+
+
+def merge_snapshots(snapshots: list) -> dict:
+    merged = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, dict(metric, samples={}))
+            for labels, value in metric['samples']:
+                key = tuple(sorted(labels.items()))
+                current = target['samples'].get(key)
+                if current is None:
+                    target['samples'][key] = value if metric['type'] != 'histogram' else dict(
+                        value, buckets=list(value['buckets']))
+                elif metric['type'] == 'histogram':
+                    current['buckets'] = [a + b for a, b in zip(current['buckets'], value['buckets'])]
+                    current['sum'] += value['sum']
+                    current['count'] += value['count']
+                else:
+                    target['samples'][key] = current + value
+    return merged
+
+
+def _format_labels(labels) -> str:
+    if not labels:
+        return ''
+    escaped = (k + '="' + str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') + '"'
+               for k, v in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+def render_prometheus(merged: dict) -> str:
+    lines = []
+    for name in sorted(merged):
+        metric = merged[name]
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for labels, value in sorted(metric['samples'].items()):
+            if metric['type'] != 'histogram':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                continue
+            # Bucket counts are already cumulative: observe() increments every bucket at or above the value
+            for bound, count in zip(metric['bounds'], value['buckets']):
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', _format_value(bound)),))} {count}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(value['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {value['count']}")
+    return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    'windsight_stage_duration_seconds', 'Time spent in each analysis pipeline stage', ('stage',))
+REQUEST_SECONDS = registry.histogram(
+    'windsight_http_request_duration_seconds', 'HTTP request latency by route', ('method', 'route', 'status'))
+ANALYSES_TOTAL = registry.counter(
+    'windsight_analyses_total', 'Analyses finished by this process, by outcome', ('status',))
+INFERENCE_QUEUE_DEPTH = registry.gauge(
+    'windsight_inference_queue_depth', 'Images waiting for a batched forward pass')
+JOBS = registry.gauge(
+    'windsight_jobs', 'Queued and running jobs in the database', ('kind', 'status'))
+DB_POOL_CONNECTIONS = registry.gauge(
+    'windsight_db_pool_connections', 'Web process database pool connections by state', ('pool', 'state'))
+
+
+def set_engine_gauges(engines: list) -> None:
+    INFERENCE_QUEUE_DEPTH.set(sum(engine['queue_depth'] for engine in engines))
+
+
+def set_pool_gauges(pools: dict) -> None:
+    for name, stats in pools.items():
+        for state in ('in_use', 'checked_in', 'overflow'):
+            if stats.get(state) is not None:
+                # QueuePool reports overflow as negative while below pool_size
+                DB_POOL_CONNECTIONS.set(max(0, stats[state]), pool=name, state=state)
+
+
+@contextmanager
+def timed_stage(stage: str, timings: dict = None):
+    """Observes ``stage`` in the stage histogram and adds its duration to ``timings`` if given."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(timings.get(stage, 0.0) + elapsed, 6)
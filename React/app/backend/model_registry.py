@@ -0,0 +1,102 @@
+import os
+import time
+import logging
+import threading
+import numpy as np
+from ultralytics import YOLO
+from runtimes import load_model, backend_id
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+WARMUP_IMGSZ = int(os.getenv('MODEL_WARMUP_IMGSZ', 640))
+
+
+class ModelRegistry:
+    """Loads each weights file once per process and hands out the cached model.
+
+    Entries are keyed by absolute path and checked against the file's mtime on
+    every lookup, so replacing best.pt on disk reloads it on the next request.
+    Which runtime serves the weights is set by ``INFERENCE_BACKEND``.
+    """
+
+    def __init__(self, warmup_imgsz: int = WARMUP_IMGSZ):
+        self.warmup_imgsz = warmup_imgsz
+        self._models = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _path_lock(self, path: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def get(self, model_path: str) -> YOLO:
+        path = os.path.abspath(model_path)
+        mtime = os.path.getmtime(path)
+
+        entry = self._models.get(path)
+        if entry and entry['mtime'] == mtime:
+            entry['hits'] += 1
+            return entry['model']
+
+        # Only one thread loads a given file; the others wait and reuse it
+        with self._path_lock(path):
+            entry = self._models.get(path)
+            if entry and entry['mtime'] == mtime:
+                entry['hits'] += 1
+                return entry['model']
+            entry = self._load(path, mtime)
+            self._models[path] = entry
+            return entry['model']
+
+    def _load(self, path: str, mtime: float) -> dict:
+        logger.info(f"Loading model from {path} with the {backend_id()} backend")
+        start = time.perf_counter()
+        try:
+            model = load_model(path)
+        except Exception as e:
+            raise RuntimeError(f"Failed to load model from {path}: {e}")
+        load_time = time.perf_counter() - start
+        STAGE_SECONDS.observe(load_time, stage='model_load')
+
+        warmup_time = self._warmup(model)
+        STAGE_SECONDS.observe(warmup_time, stage='model_warmup')
+        logger.info(f"Model {path} loaded in {load_time:.3f}s, warm-up took {warmup_time:.3f}s")
+
+        return {
+            'model': model,
+            'backend': backend_id(),
+            'mtime': mtime,
+            'loaded_at': time.time(),
+            'load_time': load_time,
+            'warmup_time': warmup_time,
+            'hits': 0,
+        }
+
+    def _warmup(self, model: YOLO) -> float:
+        # The first forward pass builds kernels and fuses layers; pay for it here
+        dummy = np.zeros((self.warmup_imgsz, self.warmup_imgsz, 3), dtype=np.uint8)
+        start = time.perf_counter()
+        try:
+            model(dummy, imgsz=self.warmup_imgsz, verbose=False)
+        except Exception as e:
+            logger.warning(f"Model warm-up failed: {e}")
+        return time.perf_counter() - start
+
+    def stats(self) -> list:
+        return [{
+            'model_path': path,
+            'backend': entry['backend'],
+            'mtime': entry['mtime'],
+            'loaded_at': entry['loaded_at'],
+            'load_time': entry['load_time'],
+            'warmup_time': entry['warmup_time'],
+            'hits': entry['hits'],
+        } for path, entry in self._models.items()]
+
+
+registry = ModelRegistry()
+
+
+def get_model(model_path: str) -> YOLO:
+    return registry.get(model_path)
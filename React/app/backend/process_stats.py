@@ -0,0 +1,31 @@
+import os
+import json
+import time
+from settings import STATS_FOLDER
+
+
+def publish_stats(sections: dict, stats_dir: str = STATS_FOLDER) -> None:
+    # Worker processes publish their counters so the web process can serve them
+    os.makedirs(stats_dir, exist_ok=True)
+    path = os.path.join(stats_dir, f"worker-{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(sections, pid=os.getpid(), published_at=time.time()), f)
+    os.replace(tmp_path, path)
+
+
+def read_published_stats(stats_dir: str = STATS_FOLDER, max_age: float = 60.0) -> list:
+    published = []
+    if not os.path.isdir(stats_dir):
+        return published
+    now = time.time()
+    for name in os.listdir(stats_dir):
+        path = os.path.join(stats_dir, name)
+        try:
+            if not name.endswith('.json') or now - os.path.getmtime(path) > max_age:
+                continue
+            with open(path) as f:
+                published.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return published
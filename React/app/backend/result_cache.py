@@ -0,0 +1,184 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+from settings import RESULT_CACHE_FOLDER, RESULT_CACHE_MAX_BYTES
+
+HASH_CHUNK_SIZE = 1024 * 1024
+# Eviction frees down to this fraction of max_bytes, so the next few puts don't each trigger a scan
+EVICT_LOW_WATER = 0.9
+# Other worker processes write to the same directory; rescan this often to see what they added
+RESCAN_EVERY = 256
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_weights_hashes = {}
+
+
+def weights_sha256(model_path: str) -> str:
+    # Hashing best.pt is not free; redo it only when the file changes
+    path = os.path.abspath(model_path)
+    stat = os.stat(path)
+    signature = (stat.st_mtime, stat.st_size)
+    cached = _weights_hashes.get(path)
+    if cached and cached[0] == signature:
+        return cached[1]
+    digest = file_sha256(path)
+    _weights_hashes[path] = (signature, digest)
+    return digest
+
+
+class ResultCache:
+    """Size-bounded on-disk cache of analysis results keyed by content.
+
+    The key combines the uploaded file's hash, the weights hash and the
+    inference mode, so a new best.pt never serves stale detections. Each
+    entry is a JSON metadata file plus the annotated output, sharded by the
+    first two hex digits of the key. Hits touch the entry; when the cache
+    grows past ``max_bytes`` the least recently used entries are removed.
+    Puts add to a running size total, so the directory is only scanned when
+    that total crosses ``max_bytes`` or every ``RESCAN_EVERY`` puts.
+    """
+
+    def __init__(self, cache_dir: str = RESULT_CACHE_FOLDER, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.scans = 0
+        self._size = None
+        self._puts_since_scan = 0
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+    def key(self, content_hash: str, model_path: str, mode: str) -> str:
+        raw = f"{content_hash}:{weights_sha256(model_path)}:{mode}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def get(self, key: str):
+        path = self._entry_path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+            if not os.path.exists(entry['output_path']):
+                raise FileNotFoundError(entry['output_path'])
+            os.utime(path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return entry
+
+    def put(self, key: str, output_path: str, metadata: dict) -> None:
+        shard = os.path.join(self.cache_dir, key[:2])
+        os.makedirs(shard, exist_ok=True)
+        cached_output = os.path.join(shard, f"{key}{os.path.splitext(output_path)[1]}")
+        link_or_copy(output_path, cached_output)
+
+        path = self._entry_path(key)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'output_path': cached_output, 'metadata': metadata}, f)
+        os.replace(tmp_path, path)
+
+        added = os.path.getsize(cached_output) + os.path.getsize(path)
+        with self._lock:
+            self._puts_since_scan += 1
+            if self._size is not None:
+                self._size += added
+            scan = (self._size is None or self._size > self.max_bytes
+                    or self._puts_since_scan >= RESCAN_EVERY)
+        if scan:
+            self.evict()
+
+    def materialize(self, entry: dict, output_path: str) -> str:
+        link_or_copy(entry['output_path'], output_path)
+        return output_path
+
+    def _entries(self) -> list:
+        entries = []
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            groups = {}
+            for item in os.scandir(shard.path):
+                groups.setdefault(item.name.split('.', 1)[0], []).append(item)
+            for key, items in groups.items():
+                meta = next((item for item in items if item.name == f"{key}.json"), None)
+                if meta is None:
+                    continue
+                size = sum(item.stat().st_size for item in items)
+                entries.append((meta.stat().st_mtime, size, [item.path for item in items]))
+        return entries
+
+    def evict(self) -> None:
+        """Rescans the cache and, if it is over ``max_bytes``, removes LRU entries down to the low-water mark."""
+        if not os.path.isdir(self.cache_dir):
+            return
+        # One scan at a time; a put that finds one running leaves the eviction to it
+        if not self._evict_lock.acquire(blocking=False):
+            return
+        try:
+            entries = self._entries()
+            total = sum(size for _, size, _ in entries)
+            if total > self.max_bytes:
+                target = self.max_bytes * EVICT_LOW_WATER
+                for _, size, files in sorted(entries):
+                    if total <= target:
+                        break
+                    for f in files:
+                        try:
+                            os.remove(f)
+                        except OSError:
+                            pass
+                    total -= size
+                    with self._lock:
+                        self.evictions += 1
+            with self._lock:
+                self._size = total
+                self._puts_since_scan = 0
+                self.scans += 1
+        finally:
+            self._evict_lock.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'scans': self.scans,
+                'size_bytes': self._size,
+                'max_bytes': self.max_bytes,
+            }
+
+
+def link_or_copy(src: str, dst: str) -> None:
+    # Hard links cost no extra disk; fall back to a copy across filesystems
+    if os.path.abspath(src) == os.path.abspath(dst):
+        return
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+result_cache = ResultCache()
@@ -0,0 +1,194 @@
+import logging
+import argparse
+from collections import Counter
+from datetime import date, datetime, timedelta
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from db_models import DefectRollup, AnalysisRollup, Analysis, Upload, Detection
+from detections import iter_detections
+
+logger = logging.getLogger(__name__)
+
+CONFIDENCE_BUCKETS = 10
+PERIODS = ('day', 'week')
+REBUILD_BATCH_SIZE = 10000
+
+
+def confidence_bucket(confidence: float) -> int:
+    # Deciles: bucket 7 holds confidences in [0.7, 0.8); 1.0 goes into the top bucket
+    return min(max(int(confidence * CONFIDENCE_BUCKETS), 0), CONFIDENCE_BUCKETS - 1)
+
+
+def _increment(db, model, key: dict, values: dict) -> None:
+    # Increment first so an existing row never needs a read-modify-write, as in BlobStore._acquire
+    conditions = [getattr(model, column) == value for column, value in key.items()]
+    updated = db.execute(
+        update(model).where(*conditions)
+        .values({column: getattr(model, column) + amount for column, amount in values.items()})
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.add(model(**key, **values))
+        except IntegrityError:
+            # Another transaction inserted the same row first
+            _increment(db, model, key, values)
+
+
+def record_analysis(db, analysis, user_id: int, metadata: dict) -> None:
+    """Adds one completed analysis to the rollups, in the caller's transaction.
+
+    Counts the same detections ``store_detections`` writes, so a rebuild from
+    the detections table gives the same numbers. Rows are updated in key
+    order, so two workers completing analyses for the same user and day lock
+    them in the same order and cannot deadlock.
+    """
+    day = (analysis.analysis_date or datetime.utcnow()).date()
+    counts = Counter(
+        (detection['class_name'], confidence_bucket(detection['confidence']))
+        for _, detection in iter_detections(metadata)
+    )
+    _increment(db, AnalysisRollup, {'day': day, 'user_id': user_id},
+               {'analyses': 1, 'with_detections': 1 if counts else 0})
+    for (class_name, bucket), count in sorted(counts.items()):
+        _increment(db, DefectRollup,
+                   {'day': day, 'user_id': user_id, 'class_name': class_name, 'confidence_bucket': bucket},
+                   {'detections': count})
+
+
+def period_start(day: date, period: str) -> date:
+    return day - timedelta(days=day.weekday()) if period == 'week' else day
+
+
+def _filter(query, model, user_id: int, start_date: date, end_date: date):
+    if user_id is not None:
+        query = query.filter(model.user_id == user_id)
+    if start_date is not None:
+        query = query.filter(model.day >= start_date)
+    if end_date is not None:
+        query = query.filter(model.day < end_date)
+    return query
+
+
+def summarize(db, user_id: int = None, start_date: date = None, end_date: date = None, class_name: str = None,
+              min_confidence: float = None, period: str = 'week') -> dict:
+    """Defect counts from the rollup tables; never touches uploads, analyses or detections.
+
+    The work depends on the number of days, classes and buckets in range (and
+    users, for fleet-wide summaries), not on how many images were analyzed.
+    ``end_date`` is exclusive. ``min_confidence`` is applied at bucket
+    granularity.
+    """
+    defects = _filter(db.query(
+        DefectRollup.day, DefectRollup.class_name, DefectRollup.confidence_bucket,
+        func.sum(DefectRollup.detections)
+    ), DefectRollup, user_id, start_date, end_date)
+    analyses = _filter(db.query(
+        AnalysisRollup.day, func.sum(AnalysisRollup.analyses), func.sum(AnalysisRollup.with_detections)
+    ), AnalysisRollup, user_id, start_date, end_date)
+    if class_name:
+        defects = defects.filter(DefectRollup.class_name == class_name)
+    if min_confidence is not None:
+        defects = defects.filter(DefectRollup.confidence_bucket >= confidence_bucket(min_confidence))
+
+    by_class, by_confidence, series = Counter(), Counter(), Counter()
+    for day, name, bucket, count in defects.group_by(
+            DefectRollup.day, DefectRollup.class_name, DefectRollup.confidence_bucket).all():
+        by_class[name] += count
+        by_confidence[bucket] += count
+        series[(period_start(day, period), name)] += count
+
+    analysed, with_detections = Counter(), Counter()
+    for day, count, found in analyses.group_by(AnalysisRollup.day).all():
+        analysed[period_start(day, period)] += count
+        with_detections[period_start(day, period)] += found
+
+    return {
+        'period': period,
+        'total_detections': sum(by_class.values()),
+        'total_analyses': sum(analysed.values()),
+        'by_class': dict(by_class.most_common()),
+        'by_confidence': [{
+            'bucket': bucket,
+            'min_confidence': bucket / CONFIDENCE_BUCKETS,
+            'max_confidence': (bucket + 1) / CONFIDENCE_BUCKETS,
+            'detections': by_confidence[bucket],
+        } for bucket in sorted(by_confidence)],
+        'series': [{
+            'period_start': start.isoformat(),
+            'class_name': name,
+            'detections': count,
+        } for (start, name), count in sorted(series.items())],
+        'analyses': [{
+            'period_start': start.isoformat(),
+            'analyses': analysed[start],
+            'with_detections': with_detections[start],
+        } for start in sorted(analysed)],
+    }
+
+
+def rebuild(db, batch_size: int = REBUILD_BATCH_SIZE) -> dict:
+    """Recomputes both rollup tables from the detections and completed analyses.
+
+    Streams the denormalized detections table (no result files are read) and
+    replaces the rollups in one transaction. Analyses completed while it runs
+    can be counted twice or missed, so run it with the workers stopped or
+    re-run it after they drain.
+    """
+    defects = Counter()
+    analyses_with_detections = set()
+    rows = db.query(Detection.analysis_id, Detection.user_id, Detection.detected_at, Detection.class_name,
+                    Detection.confidence).yield_per(batch_size)
+    for analysis_id, user_id, detected_at, class_name, confidence in rows:
+        defects[(detected_at.date(), user_id, class_name, confidence_bucket(confidence))] += 1
+        analyses_with_detections.add(analysis_id)
+
+    analyses = Counter()
+    found = Counter()
+    rows = db.query(Analysis.id, Analysis.analysis_date, Upload.user_id).join(Upload) \
+        .filter(Analysis.status == 'completed').yield_per(batch_size)
+    for analysis_id, analysis_date, user_id in rows:
+        key = ((analysis_date or datetime.utcnow()).date(), user_id)
+        analyses[key] += 1
+        found[key] += analysis_id in analyses_with_detections
+
+    db.query(DefectRollup).delete(synchronize_session=False)
+    db.query(AnalysisRollup).delete(synchronize_session=False)
+    db.bulk_insert_mappings(DefectRollup, [
+        {'day': day, 'user_id': user_id, 'class_name': class_name, 'confidence_bucket': bucket, 'detections': count}
+        for (day, user_id, class_name, bucket), count in defects.items()
+    ])
+    db.bulk_insert_mappings(AnalysisRollup, [
+        {'day': day, 'user_id': user_id, 'analyses': count, 'with_detections': found[(day, user_id)]}
+        for (day, user_id), count in analyses.items()
+    ])
+    db.commit()
+    return {'defect_rows': len(defects), 'analysis_rows': len(analyses),
+            'detections': sum(defects.values()), 'analyses': sum(analyses.values())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the defect rollup tables")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('rebuild', help="Backfill the rollups from existing analyses and detections")
+    summary_parser = subparsers.add_parser('summary', help="Print the summary the API would return")
+    summary_parser.add_argument("--user-id", type=int)
+    summary_parser.add_argument("--period", choices=PERIODS, default='week')
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == 'rebuild':
+            print(rebuild(db))
+        else:
+            print(summarize(db, user_id=args.user_id, period=args.period))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
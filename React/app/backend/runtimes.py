@@ -0,0 +1,261 @@
+import os
+import json
+import time
+import fcntl
+import shutil
+import logging
+from pathlib import Path
+import cv2
+import numpy as np
+import torch
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+try:
+    from ultralytics.utils.nms import non_max_suppression
+except ImportError:  # Ultralytics < 8.3.200 keeps NMS in ops
+    from ultralytics.utils.ops import non_max_suppression
+from result_cache import weights_sha256
+from settings import (
+    EXPORT_FOLDER, IMAGE_EXTENSIONS, INFERENCE_BACKEND, INFERENCE_THREADS, INFERENCE_INT8, INFERENCE_IMGSZ,
+    INT8_CALIBRATION_DIR, INT8_CALIBRATION_IMAGES
+)
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('pytorch', 'onnx', 'openvino')
+# Ultralytics predict() defaults, so exported models return the same boxes as best.pt
+CONF_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.7
+MAX_DETECTIONS = 300
+LETTERBOX_COLOR = 114
+STRIDE = 32
+
+
+def backend_id(backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8) -> str:
+    return f"{backend}-int8" if int8 and backend != 'pytorch' else backend
+
+
+def letterbox(image: np.ndarray, size: int, auto: bool = False) -> tuple:
+    # Same geometry as Ultralytics' LetterBox: scale to fit, pad evenly on both sides;
+    # with ``auto`` only pad up to the next multiple of the stride, as predict() does
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = round(width * ratio), round(height * ratio)
+    pad_x, pad_y = size - new_width, size - new_height
+    if auto:
+        pad_x, pad_y = pad_x % STRIDE, pad_y % STRIDE
+    pad_x, pad_y = pad_x / 2, pad_y / 2
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    top, bottom = round(pad_y - 0.1), round(pad_y + 0.1)
+    left, right = round(pad_x - 0.1), round(pad_x + 0.1)
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT,
+                               value=(LETTERBOX_COLOR,) * 3)
+    return image, ratio, (left, top)
+
+
+def preprocess(images: list, imgsz: int) -> tuple:
+    # BGR HWC uint8 -> RGB NCHW float32 in [0, 1]; same-shape batches get the tighter rectangle
+    auto = len({image.shape for image in images}) == 1
+    padded, geometry = [], []
+    for image in images:
+        boxed, ratio, offset = letterbox(image, imgsz, auto)
+        padded.append(boxed[..., ::-1].transpose(2, 0, 1))
+        geometry.append((ratio, offset))
+    batch = np.ascontiguousarray(np.stack(padded), dtype=np.float32) / 255.0
+    return batch, geometry
+
+
+def read_source(source) -> np.ndarray:
+    if isinstance(source, np.ndarray):
+        return source
+    image = cv2.imread(str(source))
+    if image is None:
+        raise RuntimeError(f"Could not decode image {source}")
+    return image
+
+
+class ExportedModel:
+    """Runs an ONNX or OpenVINO export of best.pt behind the same call signature as ``YOLO``.
+
+    ``model(images, imgsz=...)`` letterboxes the batch, runs it through the
+    runtime and returns Ultralytics ``Results``, so the inference engine,
+    tiling, video and ingest paths work unchanged with any backend.
+    """
+
+    def __init__(self, artifact: str, backend: str, names: dict, threads: int = INFERENCE_THREADS):
+        self.artifact = artifact
+        self.backend = backend
+        self.names = names
+        self.threads = threads
+        if backend == 'onnx':
+            import onnxruntime as ort
+            options = ort.SessionOptions()
+            if threads:
+                options.intra_op_num_threads = threads
+            self._session = ort.InferenceSession(artifact, sess_options=options, providers=['CPUExecutionProvider'])
+            self._input = self._session.get_inputs()[0].name
+        elif backend == 'openvino':
+            import openvino as ov
+            config = {'PERFORMANCE_HINT': 'LATENCY'}
+            if threads:
+                config['INFERENCE_NUM_THREADS'] = threads
+            self._compiled = ov.Core().compile_model(artifact, 'CPU', config)
+        else:
+            raise ValueError(f"Unknown exported backend {backend!r}")
+
+    def _infer(self, batch: np.ndarray) -> np.ndarray:
+        if self.backend == 'onnx':
+            return self._session.run(None, {self._input: batch})[0]
+        # A compiled model's default request is not thread-safe; use one per call
+        request = self._compiled.create_infer_request()
+        request.infer({0: batch})
+        return request.get_output_tensor(0).data.copy()
+
+    def __call__(self, source, imgsz: int = INFERENCE_IMGSZ, conf: float = CONF_THRESHOLD,
+                 iou: float = IOU_THRESHOLD, verbose: bool = False, **kwargs) -> list:
+        sources = source if isinstance(source, (list, tuple)) else [source]
+        images = [read_source(s) for s in sources]
+        start = time.perf_counter()
+        batch, geometry = preprocess(images, imgsz)
+        preprocessed = time.perf_counter()
+        predictions = torch.from_numpy(self._infer(batch))
+        inferred = time.perf_counter()
+        detections = non_max_suppression(predictions, conf, iou, max_det=MAX_DETECTIONS)
+        # Per-image milliseconds, in the same shape as Results.speed from YOLO.predict()
+        speed = {
+            'preprocess': (preprocessed - start) * 1000 / len(images),
+            'inference': (inferred - preprocessed) * 1000 / len(images),
+            'postprocess': (time.perf_counter() - inferred) * 1000 / len(images),
+        }
+
+        results = []
+        for src, image, (ratio, (left, top)), boxes in zip(sources, images, geometry, detections):
+            boxes = boxes[:, :6].clone()
+            boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - left) / ratio).clamp(0, image.shape[1])
+            boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - top) / ratio).clamp(0, image.shape[0])
+            path = src if isinstance(src, (str, Path)) else ''
+            result = Results(orig_img=image, path=str(path), names=self.names, boxes=boxes)
+            result.speed = speed
+            results.append(result)
+        return results
+
+
+def calibration_batches(directory: str, imgsz: int, limit: int = INT8_CALIBRATION_IMAGES) -> list:
+    paths = sorted(p for p in Path(directory).rglob('*') if p.suffix.lower().lstrip('.') in IMAGE_EXTENSIONS)
+    batches = []
+    for path in paths[:limit]:
+        image = cv2.imread(str(path))
+        if image is not None:
+            batches.append(preprocess([image], imgsz)[0])
+    if not batches:
+        raise RuntimeError(f"INT8 calibration needs sample images in {directory}")
+    return batches
+
+
+def quantize_onnx(source: str, target: str, batches: list) -> None:
+    from onnxruntime import InferenceSession
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    input_name = InferenceSession(source, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = iter(batches)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {input_name: batch}
+
+    quantize_static(source, target, Reader(), quant_format=QuantFormat.QDQ, per_channel=True,
+                    activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def quantize_openvino(source: str, target: str, batches: list) -> None:
+    import nncf
+    import openvino as ov
+    model = ov.Core().read_model(source)
+    quantized = nncf.quantize(model, nncf.Dataset(batches), preset=nncf.QuantizationPreset.MIXED,
+                              subset_size=len(batches))
+    ov.save_model(quantized, target)
+
+
+def export_model(model_path: str, backend: str, imgsz: int = INFERENCE_IMGSZ, int8: bool = False,
+                 calibration_dir: str = INT8_CALIBRATION_DIR, export_dir: str = EXPORT_FOLDER) -> tuple:
+    """Exports ``model_path`` for ``backend`` once and returns ``(artifact path, class names)``.
+
+    Exports are cached under ``export_dir`` by weights hash, backend, input
+    size and precision. A file lock makes concurrent worker processes wait for
+    the first one's export instead of repeating it.
+    """
+    key = f"{weights_sha256(model_path)[:16]}-{backend_id(backend, int8)}-{imgsz}"
+    target = os.path.join(export_dir, key)
+    meta_path = os.path.join(target, 'meta.json')
+    os.makedirs(export_dir, exist_ok=True)
+
+    with open(f"{target}.lock", 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(meta_path):
+            _export(model_path, backend, imgsz, int8, calibration_dir, target)
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    names = {int(k): v for k, v in meta['names'].items()}
+    return os.path.join(target, meta['artifact']), names
+
+
+def _export(model_path: str, backend: str, imgsz: int, int8: bool, calibration_dir: str, target: str) -> None:
+    logger.info(f"Exporting {model_path} to {backend_id(backend, int8)} at imgsz={imgsz}")
+    start = time.perf_counter()
+    tmp = f"{target}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    # Export a private copy so the artifacts land here rather than next to best.pt
+    weights = os.path.join(tmp, 'model.pt')
+    shutil.copyfile(model_path, weights)
+    model = YOLO(weights)
+    try:
+        exported = model.export(format=backend, imgsz=imgsz, dynamic=True)
+    except Exception as e:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise RuntimeError(f"Failed to export {model_path} to {backend}: {e}")
+
+    artifact = exported if backend == 'onnx' else os.path.join(exported, 'model.xml')
+    if int8:
+        batches = calibration_batches(calibration_dir, imgsz)
+        quantized = os.path.join(tmp, f"model-int8{os.path.splitext(artifact)[1]}")
+        try:
+            (quantize_onnx if backend == 'onnx' else quantize_openvino)(artifact, quantized, batches)
+        except Exception as e:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise RuntimeError(f"INT8 quantization for {backend} failed: {e}")
+        artifact = quantized
+    os.remove(weights)
+
+    with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+        json.dump({
+            'backend': backend,
+            'int8': int8,
+            'imgsz': imgsz,
+            'artifact': os.path.relpath(artifact, tmp),
+            'names': model.names,
+            'weights': os.path.abspath(model_path),
+            'export_time': time.perf_counter() - start,
+        }, f)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp, target)
+    logger.info(f"Exported {model_path} to {target} in {time.perf_counter() - start:.1f}s")
+
+
+def load_model(model_path: str, backend: str = INFERENCE_BACKEND, threads: int = INFERENCE_THREADS,
+               int8: bool = INFERENCE_INT8, imgsz: int = INFERENCE_IMGSZ,
+               calibration_dir: str = INT8_CALIBRATION_DIR, export_dir: str = EXPORT_FOLDER):
+    if backend not in BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND must be one of {', '.join(BACKENDS)}, got {backend!r}")
+    if backend == 'pytorch':
+        if threads:
+            torch.set_num_threads(threads)
+        return YOLO(model_path)
+    artifact, names = export_model(model_path, backend, imgsz=imgsz, int8=int8, calibration_dir=calibration_dir,
+                                   export_dir=export_dir)
+    return ExportedModel(artifact, backend, names, threads)
@@ -0,0 +1,116 @@
+import os
+
+UPLOAD_FOLDER = 'uploads'
+OUTPUT_FOLDER = 'output'
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+VIDEO_EXTENSIONS = {'mp4', 'mov', 'avi'}
+ALLOWED_EXTENSIONS = IMAGE_EXTENSIONS | VIDEO_EXTENSIONS
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'best.pt')
+STATS_FOLDER = os.path.join(OUTPUT_FOLDER, '.stats')
+RESULT_CACHE_FOLDER = os.path.join(OUTPUT_FOLDER, '.cache')
+CHUNKED_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, '.partial')
+INGEST_FOLDER = os.path.join(UPLOAD_FOLDER, '.ingest')
+BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.blobs')
+DERIVATIVE_FOLDER = os.path.join(OUTPUT_FOLDER, '.derivatives')
+EXPORT_FOLDER = os.path.join(OUTPUT_FOLDER, '.exports')
+PHASH_FOLDER = os.path.join(OUTPUT_FOLDER, '.phash')
+
+# Analysis job queue
+ANALYSIS_WORKERS = int(os.getenv('ANALYSIS_WORKERS', 2))
+ANALYSIS_POLL_INTERVAL = float(os.getenv('ANALYSIS_POLL_INTERVAL', 0.5))
+ANALYSIS_WORKER_THREADS = int(os.getenv('ANALYSIS_WORKER_THREADS', 4))
+# worker.py checks this often for dead worker processes and replaces them
+WORKER_SUPERVISE_INTERVAL = float(os.getenv('WORKER_SUPERVISE_INTERVAL', 5))
+# Workers refresh claimed_at on their running jobs; a job not refreshed for JOB_LEASE_SECONDS is taken to be
+# orphaned by a dead worker. Analyses are requeued up to JOB_MAX_ATTEMPTS times, ingests are failed.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv('JOB_HEARTBEAT_INTERVAL', 30))
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', 300))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+
+# 'whole' runs the image as-is, 'tiled' slices it into overlapping tiles;
+# 'cascade' and 'tiled-cascade' screen the image (or each tile) first and run best.pt only where flagged
+INFERENCE_MODE = os.getenv('INFERENCE_MODE', 'whole')
+
+# Cascade screening: a small model (e.g. a yolo11n trained on the same classes), or best.pt at
+# SCREEN_IMGSZ when unset. Any screening box at or above SCREEN_THRESHOLD sends the image to best.pt.
+SCREEN_MODEL_PATH = os.getenv('SCREEN_MODEL_PATH')
+SCREEN_IMGSZ = int(os.getenv('SCREEN_IMGSZ', 320))
+SCREEN_THRESHOLD = float(os.getenv('SCREEN_THRESHOLD', 0.1))
+
+# 'pytorch' runs best.pt directly; 'onnx' and 'openvino' export it once and run the exported model
+INFERENCE_BACKEND = os.getenv('INFERENCE_BACKEND', 'pytorch')
+INFERENCE_THREADS = int(os.getenv('INFERENCE_THREADS', 0))  # 0 leaves the runtime default
+INFERENCE_INT8 = os.getenv('INFERENCE_INT8', '0') == '1'
+INT8_CALIBRATION_DIR = os.getenv('INT8_CALIBRATION_DIR', UPLOAD_FOLDER)
+INT8_CALIBRATION_IMAGES = int(os.getenv('INT8_CALIBRATION_IMAGES', 100))
+
+# Micro-batching inference engine
+INFERENCE_IMGSZ = int(os.getenv('INFERENCE_IMGSZ', 640))
+INFERENCE_MAX_BATCH_SIZE = int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8))
+INFERENCE_MAX_WAIT_MS = float(os.getenv('INFERENCE_MAX_WAIT_MS', 10))
+INFERENCE_STATS_INTERVAL = float(os.getenv('INFERENCE_STATS_INTERVAL', 5))
+
+# Streaming video analysis
+VIDEO_FRAME_STRIDE = int(os.getenv('VIDEO_FRAME_STRIDE', 1))
+VIDEO_BATCH_SIZE = int(os.getenv('VIDEO_BATCH_SIZE', 8))
+VIDEO_DUPLICATE_THRESHOLD = float(os.getenv('VIDEO_DUPLICATE_THRESHOLD', 2.0))
+VIDEO_OUTPUT_FOURCC = os.getenv('VIDEO_OUTPUT_FOURCC', 'mp4v')
+
+# Tiled inference for high-resolution imagery
+TILE_SIZE = int(os.getenv('TILE_SIZE', 640))
+TILE_OVERLAP = float(os.getenv('TILE_OVERLAP', 0.2))
+TILE_SKIP_THRESHOLD = float(os.getenv('TILE_SKIP_THRESHOLD', 10.0))
+TILE_MAX_BATCH_SIZE = int(os.getenv('TILE_MAX_BATCH_SIZE', 16))
+TILE_NMS_IOU = float(os.getenv('TILE_NMS_IOU', 0.5))
+TILE_INCLUDE_FULL = os.getenv('TILE_INCLUDE_FULL', '1') == '1'
+
+# Content-addressed result cache
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE_ENABLED', '1') == '1'
+RESULT_CACHE_MAX_BYTES = int(os.getenv('RESULT_CACHE_MAX_BYTES', 2 * 1024 ** 3))
+
+# Near-duplicate reuse: images within PHASH_MAX_DISTANCE bits (of 64) of an analyzed image reuse its result.
+# PHASH_REUSE=empty only reuses neighbours with no detections and re-runs the model otherwise; 'all' reuses any.
+# Off by default: reusing an empty result for a near-identical image can hide a small new defect, which
+# the hash cannot see. Enable it for highly redundant imagery once the false-negative rate is measured.
+PHASH_ENABLED = os.getenv('PHASH_ENABLED', '0') == '1'
+PHASH_MAX_DISTANCE = int(os.getenv('PHASH_MAX_DISTANCE', 4))
+PHASH_REUSE = os.getenv('PHASH_REUSE', 'empty')
+PHASH_SYNC_INTERVAL = float(os.getenv('PHASH_SYNC_INTERVAL', 2))
+PHASH_SNAPSHOT_EVERY = int(os.getenv('PHASH_SNAPSHOT_EVERY', 10000))
+
+# Chunked, resumable uploads
+UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 8 * 1024 ** 2))
+UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('UPLOAD_MAX_CHUNK_SIZE', 64 * 1024 ** 2))
+# Sessions with no chunk for this long are deleted, swept at most once per UPLOAD_SESSION_SWEEP_INTERVAL
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv('UPLOAD_SESSION_TTL_SECONDS', 24 * 3600))
+UPLOAD_SESSION_SWEEP_INTERVAL = float(os.getenv('UPLOAD_SESSION_SWEEP_INTERVAL', 600))
+# Content-addressed upload storage; unreferenced blobs are kept this long before GC may delete them
+BLOB_GC_GRACE_SECONDS = int(os.getenv('BLOB_GC_GRACE_SECONDS', 3600))
+# Originals posted to /api/analyze are written in the background, or inline once this many are pending
+ORIGINAL_WRITE_WORKERS = int(os.getenv('ORIGINAL_WRITE_WORKERS', 2))
+ORIGINAL_WRITE_MAX_PENDING = int(os.getenv('ORIGINAL_WRITE_MAX_PENDING', 16))
+# How long a request for an original waits for it to land, when another web process is writing it
+ORIGINAL_WAIT_SECONDS = float(os.getenv('ORIGINAL_WAIT_SECONDS', 10))
+
+# Server-sent events (/api/events): one poll of the events table per web process, however many streams are open
+EVENT_POLL_INTERVAL = float(os.getenv('EVENT_POLL_INTERVAL', 0.5))
+EVENT_HEARTBEAT_SECONDS = float(os.getenv('EVENT_HEARTBEAT_SECONDS', 15))
+# Streams end after this long and the browser reconnects with Last-Event-ID, so server threads get recycled
+EVENT_STREAM_MAX_SECONDS = float(os.getenv('EVENT_STREAM_MAX_SECONDS', 300))
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', 256))
+EVENT_RETENTION_SECONDS = int(os.getenv('EVENT_RETENTION_SECONDS', 3600))
+
+# Bulk archive / folder ingestion
+INGEST_ROOT = os.getenv('INGEST_ROOT')  # server-side folders must live under this; unset disables them
+INGEST_BATCH_SIZE = int(os.getenv('INGEST_BATCH_SIZE', 16))
+INGEST_DECODE_THREADS = int(os.getenv('INGEST_DECODE_THREADS', 4))
+# Archive or folder entries larger than this are skipped without being read
+INGEST_MAX_ENTRY_BYTES = int(os.getenv('INGEST_MAX_ENTRY_BYTES', 256 * 1024 ** 2))
+
+# Thumbnails and resized image derivatives
+DERIVATIVE_SIZES = {'thumb': 256, 'small': 640, 'medium': 1280}
+DERIVATIVE_FORMATS = {'jpeg', 'webp'}
+DERIVATIVE_DEFAULT_QUALITY = int(os.getenv('DERIVATIVE_DEFAULT_QUALITY', 80))
+DERIVATIVE_WORKERS = int(os.getenv('DERIVATIVE_WORKERS', 2))
+DERIVATIVE_MAX_PENDING = int(os.getenv('DERIVATIVE_MAX_PENDING', 32))
+IMAGE_CACHE_MAX_AGE = int(os.getenv('IMAGE_CACHE_MAX_AGE', 3600))
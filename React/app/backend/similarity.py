@@ -0,0 +1,234 @@
+import os
+import time
+import logging
+import threading
+from itertools import combinations
+import cv2
+import numpy as np
+from db_models import Analysis, ImageHash
+from settings import PHASH_FOLDER, PHASH_MAX_DISTANCE, PHASH_SYNC_INTERVAL, PHASH_SNAPSHOT_EVERY
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+CHUNKS = 4
+CHUNK_BITS = HASH_BITS // CHUNKS
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+MERGE_THRESHOLD = 4096
+SYNC_OVERLAP = 1000
+POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def phash(image: np.ndarray) -> int:
+    """64-bit DCT perceptual hash: the 8x8 lowest frequencies of a 32x32 grayscale thumbnail vs. their median."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    # The DC term is just overall brightness; leave it out of the median
+    bits = low > np.median(low[1:])
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(hashes: np.ndarray, value: int) -> np.ndarray:
+    # Byte-table popcount; np.bitwise_count needs NumPy 2
+    xor = np.bitwise_xor(hashes, np.uint64(value))
+    return POPCOUNT[xor.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def to_signed(value: int) -> int:
+    # The database column is a signed BIGINT
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def _flip_masks(radius: int) -> np.ndarray:
+    masks = [0]
+    for r in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), r):
+            masks.append(sum(1 << b for b in bits))
+    return np.array(masks, dtype=np.uint16)
+
+
+class HashIndex:
+    """Hamming-distance neighbour search over 64-bit hashes (multi-index hashing).
+
+    Each hash is split into four 16-bit chunks, and every chunk has its own
+    sorted array. Two hashes within distance ``d`` agree to within ``d // 4``
+    bits in at least one chunk. A query therefore probes each sorted array
+    for the chunk values that close to its own, then checks the full distance
+    of the few candidates found.
+
+    Storage is flat NumPy arrays, about 40 bytes per image, so millions of
+    images fit in memory. New hashes wait in a small unsorted tail, which is
+    scanned directly until it is merged into the arrays.
+    """
+
+    def __init__(self):
+        self._hashes = np.zeros(0, dtype=np.uint64)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._tables = []
+        self._tail_hashes = []
+        self._tail_ids = []
+        self._masks = {}
+
+    def __len__(self) -> int:
+        return len(self._hashes) + len(self._tail_hashes)
+
+    def add(self, value: int, item_id: int) -> None:
+        self._tail_hashes.append(value)
+        self._tail_ids.append(item_id)
+        if len(self._tail_hashes) >= MERGE_THRESHOLD:
+            self.merge()
+
+    def extend(self, hashes: np.ndarray, ids: np.ndarray) -> None:
+        self._tail_hashes.extend(int(h) for h in hashes)
+        self._tail_ids.extend(int(i) for i in ids)
+        self.merge()
+
+    def merge(self) -> None:
+        if not self._tail_hashes:
+            return
+        self._hashes = np.concatenate([self._hashes, np.array(self._tail_hashes, dtype=np.uint64)])
+        self._ids = np.concatenate([self._ids, np.array(self._tail_ids, dtype=np.int64)])
+        self._tail_hashes, self._tail_ids = [], []
+        self._tables = []
+        for chunk in range(CHUNKS):
+            values = ((self._hashes >> np.uint64(chunk * CHUNK_BITS)) & np.uint64(CHUNK_MASK)).astype(np.uint16)
+            order = np.argsort(values, kind='stable').astype(np.int32 if len(values) < 2 ** 31 else np.int64)
+            self._tables.append((values[order], order))
+
+    def arrays(self) -> tuple:
+        self.merge()
+        return self._hashes, self._ids
+
+    def query(self, value: int, max_distance: int) -> list:
+        """Returns ``(distance, id)`` pairs within ``max_distance`` bits, nearest first."""
+        found = []
+        if len(self._hashes):
+            masks = self._masks.get(max_distance // CHUNKS)
+            if masks is None:
+                masks = self._masks[max_distance // CHUNKS] = _flip_masks(max_distance // CHUNKS)
+            positions = []
+            for chunk, (values, order) in enumerate(self._tables):
+                probes = np.unique(masks ^ np.uint16((value >> (chunk * CHUNK_BITS)) & CHUNK_MASK))
+                starts = np.searchsorted(values, probes, side='left')
+                ends = np.searchsorted(values, probes, side='right')
+                positions.extend(order[start:end] for start, end in zip(starts, ends) if end > start)
+            if positions:
+                candidates = np.unique(np.concatenate(positions))
+                distances = hamming(self._hashes[candidates], value)
+                close = distances <= max_distance
+                found.extend(zip(distances[close].tolist(), self._ids[candidates[close]].tolist()))
+        if self._tail_hashes:
+            distances = hamming(np.array(self._tail_hashes, dtype=np.uint64), value)
+            found.extend((int(d), self._tail_ids[i]) for i, d in enumerate(distances) if d <= max_distance)
+        return sorted(found)
+
+
+class PhashIndex:
+    """The HashIndex of analyzed images for one model key, kept in step with ``image_hashes``.
+
+    Completed analyses insert their hash into the ``image_hashes`` table,
+    which is the durable copy. Every process tails the table by row id, at
+    most once per ``sync_interval``, re-reading a short overlap because ids
+    can commit out of order. An ``.npz`` snapshot is rewritten every
+    ``snapshot_every`` new rows, so a restart loads the snapshot and reads
+    only the rows added after it.
+    """
+
+    def __init__(self, model_key: str, folder: str = PHASH_FOLDER, sync_interval: float = PHASH_SYNC_INTERVAL,
+                 snapshot_every: int = PHASH_SNAPSHOT_EVERY):
+        self.model_key = model_key
+        self.snapshot_path = os.path.join(folder, f"{model_key.replace(':', '_')}.npz")
+        self.sync_interval = sync_interval
+        self.snapshot_every = snapshot_every
+        self.index = HashIndex()
+        self._last_id = 0
+        self._recent = set()
+        self._since_snapshot = 0
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._load_snapshot()
+
+    def _load_snapshot(self) -> None:
+        try:
+            with np.load(self.snapshot_path) as snapshot:
+                self.index.extend(snapshot['hashes'], snapshot['ids'])
+                self._last_id = int(snapshot['last_row_id'])
+        except FileNotFoundError:
+            return
+        except (OSError, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable similarity snapshot {self.snapshot_path}: {e}")
+            self.index = HashIndex()
+            self._last_id = 0
+            return
+        logger.info(f"Loaded {len(self.index)} image hashes from {self.snapshot_path}")
+
+    def _save_snapshot(self) -> None:
+        hashes, ids = self.index.arrays()
+        os.makedirs(os.path.dirname(self.snapshot_path), exist_ok=True)
+        tmp_path = f"{self.snapshot_path}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_path, hashes=hashes, ids=ids, last_row_id=np.int64(self._last_id))
+        os.replace(tmp_path, self.snapshot_path)
+        self._since_snapshot = 0
+
+    def sync(self, db, force: bool = False) -> None:
+        with self._lock:
+            if not force and time.monotonic() - self._synced_at < self.sync_interval:
+                return
+            rows = db.query(ImageHash.id, ImageHash.phash, ImageHash.analysis_id).filter(
+                ImageHash.model_key == self.model_key,
+                ImageHash.id > self._last_id - SYNC_OVERLAP
+            ).order_by(ImageHash.id).all()
+            for row_id, value, analysis_id in rows:
+                if row_id in self._recent or (row_id <= self._last_id and not self._recent):
+                    continue
+                self.index.add(to_unsigned(value), analysis_id)
+                self._since_snapshot += 1
+            if rows:
+                self._last_id = max(self._last_id, rows[-1][0])
+                self._recent = {row[0] for row in rows if row[0] > self._last_id - SYNC_OVERLAP}
+            self._synced_at = time.monotonic()
+            if self._since_snapshot >= self.snapshot_every:
+                try:
+                    self._save_snapshot()
+                except OSError as e:
+                    logger.warning(f"Failed to write similarity snapshot {self.snapshot_path}: {e}")
+
+    def find(self, db, value: int, max_distance: int = PHASH_MAX_DISTANCE):
+        """Returns ``(analysis, distance)`` for the nearest completed analysis, or ``(None, None)``."""
+        self.sync(db)
+        with self._lock:
+            matches = self.index.query(value, max_distance)
+        for distance, analysis_id in matches:
+            analysis = db.query(Analysis).get(analysis_id)
+            if analysis is not None and analysis.status == 'completed':
+                return analysis, distance
+        return None, None
+
+    def stats(self) -> dict:
+        return {
+            'model_key': self.model_key,
+            'entries': len(self.index),
+            'last_row_id': self._last_id,
+            'snapshot': self.snapshot_path,
+        }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(model_key: str) -> PhashIndex:
+    with _indexes_lock:
+        index = _indexes.get(model_key)
+        if index is None:
+            index = _indexes[model_key] = PhashIndex(model_key)
+        return index
+
+
+def similarity_stats() -> list:
+    return [index.stats() for index in _indexes.values()]
@@ -0,0 +1,347 @@
+import os
+import re
+import uuid
+import shutil
+import hashlib
+import logging
+import argparse
+from datetime import datetime, timedelta
+from sqlalchemy import func, update, exists
+from sqlalchemy.exc import IntegrityError
+from db_models import Blob, Upload
+from result_cache import file_sha256
+from settings import BLOB_FOLDER, UPLOAD_FOLDER, BLOB_GC_GRACE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+STREAM_BLOCK_SIZE = 1024 * 1024
+BLOB_NAME = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]+)?$')
+
+
+def write_bytes(path: str, data: bytes) -> None:
+    # Temp file then rename, so readers never see a half-written file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def unreferenced():
+    # Blobs no upload row points at, whatever their ref_count says
+    return ~exists().where(Upload.content_hash == Blob.content_hash)
+
+
+class BlobStore:
+    """Content-addressed upload storage.
+
+    Each distinct file is stored once, at ``root/ab/cd/<sha256><ext>``, so no
+    directory grows past a few hundred entries and two uploads with the same
+    name can no longer overwrite each other. A ``Blob`` row per file counts
+    the ``Upload`` rows that use it; the count is changed in the caller's
+    transaction, next to the Upload insert. Uploading content that is already
+    stored costs a row update and no disk writes. ``gc`` removes blobs whose
+    count has been zero for longer than the grace period, after zeroing the
+    count of any blob no upload row references any more.
+    """
+
+    def __init__(self, root: str = BLOB_FOLDER):
+        self.root = root
+        self._tmp = os.path.join(root, '.tmp')
+
+    def path_for(self, content_hash: str, ext: str = '') -> str:
+        return os.path.join(self.root, content_hash[:2], content_hash[2:4], f"{content_hash}{ext}")
+
+    def _acquire(self, db, content_hash: str, ext: str, size: int) -> str:
+        # Increment first so a blob that already exists never needs a read-modify-write
+        updated = db.execute(
+            update(Blob).where(Blob.content_hash == content_hash)
+            .values(ref_count=Blob.ref_count + 1, released_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        if not updated:
+            try:
+                with db.begin_nested():
+                    db.add(Blob(content_hash=content_hash, path=self.path_for(content_hash, ext), size=size,
+                                ref_count=1))
+            except IntegrityError:
+                # Another request inserted the same content first
+                return self._acquire(db, content_hash, ext, size)
+        return db.query(Blob.path).filter(Blob.content_hash == content_hash).scalar()
+
+    def release(self, db, content_hash: str) -> None:
+        db.execute(
+            update(Blob).where(Blob.content_hash == content_hash, Blob.ref_count > 0)
+            .values(ref_count=Blob.ref_count - 1, released_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+
+    def _place(self, path: str, write) -> bool:
+        if os.path.exists(path):
+            return False
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write(path)
+        return True
+
+    def store_bytes(self, db, data: bytes, filename: str, content_hash: str = None, writer=write_bytes) -> tuple:
+        """References ``data`` from a new upload; returns ``(path, content_hash)``.
+
+        ``writer(path, data)`` is only called when the content is not stored
+        yet; pass a background writer to take the write off the request.
+        """
+        content_hash = content_hash or hashlib.sha256(data).hexdigest()
+        path = self._acquire(db, content_hash, os.path.splitext(filename)[1].lower(), len(data))
+        self._place(path, lambda target: writer(target, data))
+        return path, content_hash
+
+    def store_stream(self, db, stream, filename: str) -> tuple:
+        """Stores a file-like upload; returns ``(path, size, content_hash)``.
+
+        Seekable streams (Werkzeug spools request files) are hashed first and
+        only written if the content is new; anything else is spooled to a temp
+        file under the store and renamed into place or discarded.
+        """
+        if stream.seekable():
+            digest, size = hashlib.sha256(), 0
+            for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b''):
+                digest.update(block)
+                size += len(block)
+            content_hash = digest.hexdigest()
+            path = self._acquire(db, content_hash, os.path.splitext(filename)[1].lower(), size)
+
+            def write(target):
+                stream.seek(0)
+                tmp_path = self._tmp_path()
+                with open(tmp_path, 'wb') as f:
+                    shutil.copyfileobj(stream, f, STREAM_BLOCK_SIZE)
+                os.replace(tmp_path, target)
+
+            self._place(path, write)
+            return path, size, content_hash
+
+        tmp_path = self._tmp_path()
+        digest, size = hashlib.sha256(), 0
+        with open(tmp_path, 'wb') as f:
+            for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b''):
+                f.write(block)
+                digest.update(block)
+                size += len(block)
+        path, content_hash = self.store_file(db, tmp_path, filename, digest.hexdigest(), size)
+        return path, size, content_hash
+
+    def store_file(self, db, source: str, filename: str, content_hash: str, size: int = None,
+                   keep_source: bool = False) -> tuple:
+        """Moves ``source`` into the store (or drops it if already stored); returns ``(path, content_hash)``.
+
+        With ``keep_source`` the file is hard-linked in (copied across
+        filesystems) and ``source`` is left alone, for callers that may still
+        need it if their transaction fails.
+        """
+        size = os.path.getsize(source) if size is None else size
+        path = self._acquire(db, content_hash, os.path.splitext(filename)[1].lower(), size)
+        if keep_source:
+            self._place(path, lambda target: self._link(source, target))
+        elif not self._place(path, lambda target: shutil.move(source, target)):
+            os.remove(source)
+        return path, content_hash
+
+    def _link(self, source: str, target: str) -> None:
+        tmp_path = self._tmp_path()
+        try:
+            os.link(source, tmp_path)
+        except OSError:
+            shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    def _tmp_path(self) -> str:
+        os.makedirs(self._tmp, exist_ok=True)
+        return os.path.join(self._tmp, uuid.uuid4().hex)
+
+    def resolve(self, db, filename: str, upload_id: int = None, user_id: int = None):
+        """Finds the stored file behind a public upload name, or None.
+
+        Content-addressed names map straight to their shard; anything else is
+        looked up by filename through ``ix_uploads_filename``, newest upload
+        first. Filenames are not unique across users, so that lookup needs
+        ``upload_id`` or ``user_id`` and finds nothing without them.
+        """
+        if BLOB_NAME.match(filename):
+            content_hash, ext = os.path.splitext(filename)
+            path = self.path_for(content_hash, ext)
+            if os.path.exists(path):
+                return path
+            # A committed blob whose file is still being written in the background
+            known = db.query(Blob.content_hash).filter(Blob.content_hash == content_hash).first()
+            return path if known is not None else None
+        if upload_id is None and user_id is None:
+            return None
+        query = db.query(Upload.original_path).filter(Upload.filename == filename)
+        if upload_id is not None:
+            query = query.filter(Upload.id == upload_id)
+        if user_id is not None:
+            query = query.filter(Upload.user_id == user_id)
+        return query.order_by(Upload.id.desc()).limit(1).scalar()
+
+    def release_unreferenced(self, db) -> int:
+        """Zeroes the count of blobs no upload row references; returns how many.
+
+        Catches uploads removed without ``release`` (deleted rows, cascades,
+        manual cleanup). Unlike ``recount`` it never raises a count, so it is
+        safe while uploads are being stored; ``released_at`` starts their grace
+        period now.
+        """
+        released = db.execute(
+            update(Blob).where(Blob.ref_count > 0, unreferenced())
+            .values(ref_count=0, released_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.commit()
+        return released
+
+    def gc(self, db, grace_seconds: int = BLOB_GC_GRACE_SECONDS, dry_run: bool = False,
+           orphans: bool = False) -> dict:
+        """Deletes blobs that no upload has referenced for ``grace_seconds``.
+
+        The grace period covers an upload that has acquired a blob but not yet
+        committed. Rows are deleted and committed before their files are
+        removed, so a crash can leave a stray file but never a row without one;
+        ``orphans`` walks the store for such files (and those of rolled-back
+        uploads) and removes them too. Blobs whose uploads went away without a
+        ``release`` are zeroed first and collected once their grace period ends.
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+        if not dry_run:
+            released = self.release_unreferenced(db)
+            if released:
+                logger.info(f"Released {released} blob(s) no upload references")
+        candidates = db.query(Blob).filter(Blob.ref_count <= 0, Blob.released_at < cutoff,
+                                           unreferenced()).all()
+        removed, freed = [], 0
+        for blob in candidates:
+            if dry_run:
+                removed.append(blob.path)
+                freed += blob.size
+                continue
+            # Conditional delete: skips any blob re-acquired or referenced again since the query
+            deleted = db.query(Blob).filter(Blob.content_hash == blob.content_hash, Blob.ref_count <= 0,
+                                            unreferenced()) \
+                .delete(synchronize_session=False)
+            if deleted:
+                removed.append(blob.path)
+                freed += blob.size
+        if not dry_run:
+            db.commit()
+            for path in removed:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._sweep_tmp(cutoff)
+        if orphans:
+            for path, size in self._orphans(db, cutoff):
+                removed.append(path)
+                freed += size
+                if not dry_run:
+                    os.remove(path)
+        return {'removed': len(removed), 'freed_bytes': freed, 'dry_run': dry_run}
+
+    def _orphans(self, db, cutoff: datetime):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for name in filenames:
+                if not BLOB_NAME.match(name):
+                    continue
+                path = os.path.join(dirpath, name)
+                stat = os.stat(path)
+                if datetime.utcfromtimestamp(stat.st_mtime) >= cutoff:
+                    continue
+                if db.query(Blob.content_hash).filter(Blob.content_hash == os.path.splitext(name)[0]).first() is None:
+                    yield path, stat.st_size
+
+    def _sweep_tmp(self, cutoff: datetime) -> None:
+        # Spool files left behind by requests that died mid-upload
+        if not os.path.isdir(self._tmp):
+            return
+        for name in os.listdir(self._tmp):
+            path = os.path.join(self._tmp, name)
+            try:
+                if datetime.utcfromtimestamp(os.path.getmtime(path)) < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    def recount(self, db) -> int:
+        """Resets every blob's count from the Upload rows; returns how many changed."""
+        counts = dict(db.query(Upload.content_hash, func.count(Upload.id))
+                      .filter(Upload.content_hash.isnot(None)).group_by(Upload.content_hash).all())
+        changed = 0
+        for blob in db.query(Blob).all():
+            count = counts.get(blob.content_hash, 0)
+            if blob.ref_count != count:
+                blob.ref_count = count
+                blob.released_at = datetime.utcnow() if count == 0 else None
+                changed += 1
+        db.commit()
+        return changed
+
+    def migrate(self, db, upload_folder: str = UPLOAD_FOLDER) -> dict:
+        """Moves uploads stored under their filename in ``upload_folder`` into the store."""
+        migrated = missing = 0
+        uploads = db.query(Upload).filter(~Upload.original_path.startswith(self.root)).all()
+        for upload in uploads:
+            source = upload.original_path
+            if not os.path.exists(source):
+                missing += 1
+                continue
+            # Hash what is on disk: same-named uploads overwrote each other, so the stored hash may be stale
+            content_hash = file_sha256(source)
+            shared = db.query(Upload).filter(Upload.original_path == source, Upload.id != upload.id).count()
+            if shared:
+                # Copy rather than move; the last row sharing the file moves it
+                path = self._acquire(db, content_hash, os.path.splitext(source)[1].lower(),
+                                     os.path.getsize(source))
+                self._place(path, lambda target: shutil.copyfile(source, target))
+            else:
+                path, _ = self.store_file(db, source, source, content_hash)
+            upload.original_path, upload.content_hash = path, content_hash
+            migrated += 1
+            db.commit()
+        return {'migrated': migrated, 'missing': missing}
+
+
+blob_store = BlobStore()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain the content-addressed upload store")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    gc_parser = subparsers.add_parser('gc', help="Delete blobs no upload references")
+    gc_parser.add_argument("--grace", type=int, default=BLOB_GC_GRACE_SECONDS,
+                           help="Seconds a blob must have been unreferenced")
+    gc_parser.add_argument("--dry-run", action="store_true", help="Report what would be deleted")
+    gc_parser.add_argument("--orphans", action="store_true", help="Also remove stored files with no blob row")
+    subparsers.add_parser('recount', help="Recompute reference counts from the uploads table")
+    subparsers.add_parser('migrate', help="Move files stored under their upload filename into the store")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from database import SessionLocal, init_db
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.command == 'gc':
+            print(blob_store.gc(db, args.grace, args.dry_run, args.orphans))
+        elif args.command == 'recount':
+            print({'changed': blob_store.recount(db)})
+        else:
+            print(blob_store.migrate(db))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
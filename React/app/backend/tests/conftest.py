@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import pytest
+
+# The backend modules import each other by bare name and read DATABASE_URL at import time
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.sqlite')}")
+os.environ.setdefault('ANALYSIS_WORKERS', '0')
+
+from database import engine, SessionLocal  # noqa: E402
+from db_models import Base, User, Upload  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def upload(db):
+    user = User(username='test', email='test@example.com', password_hash='test')
+    db.add(user)
+    db.commit()
+    upload = Upload(user_id=user.id, filename='blade.jpg', original_path='blade.jpg')
+    db.add(upload)
+    db.commit()
+    return upload
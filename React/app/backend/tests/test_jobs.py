@@ -0,0 +1,108 @@
+from datetime import datetime, timedelta
+import pytest
+import jobs
+from db_models import Analysis, IngestJob, Event
+from database import SessionLocal
+
+
+def expire(db, job) -> None:
+    # What a dead worker leaves behind: still 'running', lease long past
+    job.claimed_at = datetime.utcnow() - timedelta(seconds=jobs.JOB_LEASE_SECONDS + 60)
+    db.commit()
+
+
+def test_enqueue_returns_the_pending_job_without_starting_workers(db, upload):
+    first = jobs.enqueue_analysis(db, upload)
+    assert first.status == 'queued'
+    assert jobs.enqueue_analysis(db, upload).id == first.id
+    assert jobs._pool == []
+
+
+def test_claim_takes_each_job_once(db, upload):
+    job = jobs.enqueue_analysis(db, upload)
+    claimed = jobs.claim_next_job(db)
+    assert claimed.id == job.id
+    assert claimed.status == 'running'
+    assert claimed.attempts == 1
+    assert claimed.claimed_at is not None
+
+    other = SessionLocal()
+    try:
+        assert jobs.claim_next_job(other) is None
+    finally:
+        other.close()
+    jobs.release_claim(Analysis, job.id)
+
+
+def test_live_lease_is_left_alone(db, upload):
+    jobs.enqueue_analysis(db, upload)
+    job = jobs.claim_next_job(db)
+    assert jobs.recover_stale_jobs(db, Analysis) == 0
+    db.refresh(job)
+    assert job.status == 'running'
+    jobs.release_claim(Analysis, job.id)
+
+
+@pytest.mark.parametrize('claimed_at', ['expired', None])
+def test_orphaned_analysis_is_requeued_and_claimed_again(db, upload, claimed_at):
+    jobs.enqueue_analysis(db, upload)
+    job = jobs.claim_next_job(db)
+    if claimed_at is None:
+        # Claimed before the lease column existed
+        job.claimed_at = None
+        db.commit()
+    else:
+        expire(db, job)
+
+    assert jobs.recover_stale_jobs(db, Analysis) == 1
+    db.refresh(job)
+    assert job.status == 'queued'
+    again = jobs.claim_next_job(db)
+    assert again.id == job.id and again.attempts == 2
+    jobs.release_claim(Analysis, job.id)
+
+
+def test_analysis_fails_after_max_attempts(db, upload):
+    jobs.enqueue_analysis(db, upload)
+    for attempt in range(1, 4):
+        job = jobs.claim_next_job(db)
+        assert job.attempts == attempt
+        expire(db, job)
+        jobs.recover_stale_jobs(db, Analysis, max_attempts=3)
+        jobs.release_claim(Analysis, job.id)
+
+    db.refresh(job)
+    assert job.status == 'failed'
+    assert 'stopped responding' in job.analysis_metadata['error']
+    assert jobs.claim_next_job(db) is None
+    kinds = [kind for (kind,) in db.query(Event.kind).order_by(Event.id)]
+    assert kinds[-1] == 'analysis.failed'
+    # A fresh click queues a new job rather than returning the failed one
+    assert jobs.enqueue_analysis(db, upload).id != job.id
+
+
+def test_orphaned_ingest_fails_and_drops_its_staged_archive(db, upload, tmp_path):
+    archive = tmp_path / 'batch.zip'
+    archive.write_bytes(b'PK')
+    job = jobs.enqueue_ingest(db, upload.user_id, 'zip', str(archive))
+    claimed = jobs.claim_next(db, IngestJob)
+    expire(db, claimed)
+
+    assert jobs.recover_stale_jobs(db, IngestJob) == 1
+    db.refresh(job)
+    assert job.status == 'failed'
+    assert job.finished_at is not None
+    assert not archive.exists()
+    jobs.release_claim(IngestJob, job.id)
+
+
+def test_orphaned_folder_ingest_keeps_the_folder(db, upload, tmp_path):
+    folder = tmp_path / 'images'
+    folder.mkdir()
+    jobs.enqueue_ingest(db, upload.user_id, 'folder', str(folder))
+    claimed = jobs.claim_next(db, IngestJob)
+    expire(db, claimed)
+
+    jobs.recover_stale_jobs(db, IngestJob)
+    assert folder.is_dir()
+    jobs.release_claim(IngestJob, claimed.id)
@@ -0,0 +1,87 @@
+import os
+import pytest
+from result_cache import ResultCache, EVICT_LOW_WATER, RESCAN_EVERY
+
+ENTRY_BYTES = 1000
+
+
+@pytest.fixture
+def output(tmp_path):
+    path = tmp_path / 'result.jpg'
+    path.write_bytes(b'x' * ENTRY_BYTES)
+    return str(path)
+
+
+def key(i: int) -> str:
+    return f"{i:064x}"
+
+
+def disk_usage(cache: ResultCache) -> int:
+    return sum(os.path.getsize(os.path.join(dirpath, name))
+               for dirpath, _, names in os.walk(cache.cache_dir) for name in names)
+
+
+def age(cache: ResultCache, i: int, seconds: float) -> None:
+    # Entries are ordered by their metadata file's mtime, which hits refresh
+    path = cache._entry_path(key(i))
+    mtime = os.path.getmtime(path) - seconds
+    os.utime(path, (mtime, mtime))
+
+
+def test_get_returns_what_put_stored(tmp_path, output):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10 ** 6)
+    cache.put(key(1), output, {'detections': []})
+    entry = cache.get(key(1))
+    assert entry['metadata'] == {'detections': []}
+    assert cache.get(key(2)) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_eviction_frees_down_to_the_low_water_mark(tmp_path, output):
+    max_bytes = 20 * ENTRY_BYTES
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=max_bytes)
+    i = 0
+    while cache.evictions == 0:
+        cache.put(key(i), output, {})
+        i += 1
+    assert disk_usage(cache) <= max_bytes * EVICT_LOW_WATER
+    assert cache.stats()['size_bytes'] == disk_usage(cache)
+
+
+def test_puts_under_the_cap_do_not_rescan(tmp_path, output):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10 ** 9)
+    # Only the first put scans, to learn the starting size
+    cache.put(key(0), output, {})
+    for i in range(1, RESCAN_EVERY):
+        cache.put(key(i), output, {})
+    assert cache.scans == 1
+    cache.put(key(RESCAN_EVERY), output, {})
+    assert cache.scans == 2
+
+
+def test_least_recently_used_entries_go_first(tmp_path, output):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10 ** 6)
+    for i in range(10):
+        cache.put(key(i), output, {})
+        age(cache, i, 100 - i)
+    # A hit makes the oldest entry the most recently used
+    assert cache.get(key(0)) is not None
+
+    cache.max_bytes = disk_usage(cache) - 1
+    cache.evict()
+    assert cache.get(key(0)) is not None
+    assert cache.get(key(1)) is None
+    assert cache.get(key(9)) is not None
+
+
+def test_rescan_sees_entries_written_by_other_processes(tmp_path, output):
+    directory = str(tmp_path / 'cache')
+    cache = ResultCache(directory, max_bytes=10 * ENTRY_BYTES)
+    cache.put(key(0), output, {})
+    other = ResultCache(directory, max_bytes=10 ** 9)
+    for i in range(1, 20):
+        other.put(key(i), output, {})
+    assert cache.stats()['size_bytes'] < disk_usage(cache)
+
+    cache.evict()
+    assert disk_usage(cache) <= 10 * ENTRY_BYTES * EVICT_LOW_WATER
@@ -0,0 +1,71 @@
+import random
+import numpy as np
+import pytest
+import similarity
+from similarity import HashIndex, hamming, phash, to_signed, to_unsigned
+
+
+def brute_force(items: list, value: int, max_distance: int) -> list:
+    found = [(bin(h ^ value).count('1'), i) for h, i in items]
+    return sorted((d, i) for d, i in found if d <= max_distance)
+
+
+def flip(value: int, bits: list) -> int:
+    for bit in bits:
+        value ^= 1 << bit
+    return value
+
+
+@pytest.fixture
+def items():
+    rng = random.Random(7)
+    base = [rng.getrandbits(64) for _ in range(50)]
+    # Near neighbours of every base hash at 1..8 bits, so each query has matches to find
+    near = [flip(h, rng.sample(range(64), rng.randint(1, 8))) for h in base for _ in range(4)]
+    return [(h, i) for i, h in enumerate(base + near)]
+
+
+@pytest.mark.parametrize('max_distance', [0, 3, 4, 7, 8])
+def test_query_matches_brute_force(items, max_distance):
+    index = HashIndex()
+    index.extend(np.array([h for h, _ in items], dtype=np.uint64), np.array([i for _, i in items]))
+    for value, _ in items[:50]:
+        assert index.query(value, max_distance) == brute_force(items, value, max_distance)
+
+
+def test_query_searches_the_unmerged_tail(items, monkeypatch):
+    monkeypatch.setattr(similarity, 'MERGE_THRESHOLD', 10 ** 6)
+    index = HashIndex()
+    merged, tail = items[:100], items[100:]
+    index.extend(np.array([h for h, _ in merged], dtype=np.uint64), np.array([i for _, i in merged]))
+    for value, item_id in tail:
+        index.add(value, item_id)
+    assert len(index._tail_hashes) == len(tail)
+    for value, _ in items[:50]:
+        assert index.query(value, 6) == brute_force(items, value, 6)
+
+
+def test_empty_index_finds_nothing():
+    assert HashIndex().query(12345, 8) == []
+
+
+def test_hamming_counts_differing_bits():
+    hashes = np.array([0, 0xFF, 2 ** 64 - 1], dtype=np.uint64)
+    assert hamming(hashes, 0).tolist() == [0, 8, 64]
+
+
+def test_signed_round_trip():
+    for value in (0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 1):
+        signed = to_signed(value)
+        assert -2 ** 63 <= signed < 2 ** 63
+        assert to_unsigned(signed) == value
+
+
+def test_phash_is_stable_under_small_changes():
+    rng = np.random.default_rng(0)
+    image = (rng.random((240, 320, 3)) * 255).astype(np.uint8)
+    image = np.ascontiguousarray(np.repeat(np.repeat(image[::8, ::8], 8, axis=0), 8, axis=1))
+    brighter = np.clip(image.astype(np.int16) + 4, 0, 255).astype(np.uint8)
+    other = (rng.random((240, 320, 3)) * 255).astype(np.uint8)
+    assert bin(phash(image) ^ phash(brighter)).count('1') <= 4
+    assert bin(phash(image) ^ phash(other)).count('1') > 8
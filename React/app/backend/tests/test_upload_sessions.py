@@ -0,0 +1,127 @@
+import io
+import os
+import time
+import hashlib
+import pytest
+from upload_sessions import UploadSessions, UploadSessionError
+
+
+@pytest.fixture
+def sessions(tmp_path):
+    return UploadSessions(root=str(tmp_path / 'partial'))
+
+
+def keep(path, filename, content_hash):
+    return path
+
+
+def start(sessions, data: bytes) -> str:
+    os.makedirs(sessions.root, exist_ok=True)
+    return sessions.create(1, 'blade.jpg', len(data))['upload_token']
+
+
+def put(sessions, token, offset, chunk, checksum=None, length=None):
+    return sessions.write_chunk(token, offset, io.BytesIO(chunk), len(chunk) if length is None else length,
+                                checksum)
+
+
+def test_chunks_must_arrive_at_the_current_offset(sessions):
+    token = start(sessions, b'abcdef')
+    put(sessions, token, 0, b'abc')
+    with pytest.raises(UploadSessionError) as error:
+        put(sessions, token, 0, b'abc')
+    assert error.value.status == 409
+    with pytest.raises(UploadSessionError) as error:
+        put(sessions, token, 5, b'f')
+    assert error.value.status == 409
+    assert sessions.status(token)['received'] == 3
+
+
+def test_truncated_chunk_is_dropped(sessions):
+    token = start(sessions, b'abcdef')
+    put(sessions, token, 0, b'ab')
+    with pytest.raises(UploadSessionError, match='truncated'):
+        # The body ends before its Content-Length, like a dropped connection
+        sessions.write_chunk(token, 2, io.BytesIO(b'c'), 4)
+    assert sessions.status(token)['received'] == 2
+    put(sessions, token, 2, b'cdef')
+    assert sessions.complete(token, store=keep)['content_hash'] == hashlib.sha256(b'abcdef').hexdigest()
+
+
+def test_checksum_mismatch_drops_the_chunk(sessions):
+    token = start(sessions, b'abcdef')
+    put(sessions, token, 0, b'abc', checksum=hashlib.sha256(b'abc').hexdigest())
+    with pytest.raises(UploadSessionError, match='checksum'):
+        put(sessions, token, 3, b'dex', checksum=hashlib.sha256(b'def').hexdigest())
+    assert sessions.status(token)['received'] == 3
+    put(sessions, token, 3, b'def', checksum=hashlib.sha256(b'def').hexdigest())
+    assert sessions.status(token)['received'] == 6
+
+
+def test_chunk_past_declared_size_is_rejected(sessions):
+    token = start(sessions, b'abc')
+    with pytest.raises(UploadSessionError, match='past the declared file size'):
+        put(sessions, token, 0, b'abcd')
+
+
+def test_file_hash_is_rebuilt_in_a_process_that_has_not_seen_the_session(sessions):
+    token = start(sessions, b'abcdef')
+    put(sessions, token, 0, b'abc')
+    # Another web process: same directory, no in-memory hasher
+    other = UploadSessions(root=sessions.root)
+    put(other, token, 3, b'def')
+    completed = other.complete(token, checksum=hashlib.sha256(b'abcdef').hexdigest(), store=keep)
+    assert completed['content_hash'] == hashlib.sha256(b'abcdef').hexdigest()
+
+
+def test_complete_rejects_a_wrong_file_checksum(sessions):
+    token = start(sessions, b'abc')
+    put(sessions, token, 0, b'abc')
+    with pytest.raises(UploadSessionError, match='File checksum mismatch'):
+        sessions.complete(token, checksum=hashlib.sha256(b'xyz').hexdigest(), store=keep)
+
+
+def test_session_is_kept_until_finish(sessions, tmp_path):
+    token = start(sessions, b'abc')
+    put(sessions, token, 0, b'abc')
+    stored = []
+    sessions.complete(token, store=lambda path, filename, content_hash: stored.append(path) or 'stored')
+    # A failed commit after complete() can retry it: the partial file is still there
+    assert os.path.exists(stored[0])
+    assert sessions.complete(token, store=lambda *args: 'stored')['path'] == 'stored'
+
+    sessions.finish(token)
+    assert not os.path.exists(os.path.join(sessions.root, token))
+    assert token not in sessions._hashers and token not in sessions._locks
+    with pytest.raises(UploadSessionError) as error:
+        sessions.status(token)
+    assert error.value.status == 404
+
+
+def test_sweep_removes_idle_sessions_only(sessions):
+    idle = start(sessions, b'abc')
+    put(sessions, idle, 0, b'a')
+    active = start(sessions, b'abc')
+    put(sessions, active, 0, b'a')
+    old = time.time() - sessions.ttl_seconds - 60
+    os.utime(sessions._data_path(idle), (old, old))
+
+    assert sessions.sweep() == 1
+    assert not os.path.exists(os.path.join(sessions.root, idle))
+    assert idle not in sessions._hashers and idle not in sessions._locks
+    assert sessions.status(active)['received'] == 1
+
+
+def test_sweep_forgets_sessions_finished_elsewhere(sessions):
+    token = start(sessions, b'abc')
+    put(sessions, token, 0, b'a')
+    UploadSessions(root=sessions.root).finish(token)
+    assert token in sessions._hashers
+    sessions.sweep()
+    assert token not in sessions._hashers and token not in sessions._locks
+
+
+def test_invalid_token_is_not_found(sessions):
+    with pytest.raises(UploadSessionError) as error:
+        sessions.status('../etc')
+    assert error.value.status == 404
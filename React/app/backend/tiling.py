@@ -0,0 +1,103 @@
+import logging
+import cv2
+import numpy as np
+import torch
+from torchvision.ops import batched_nms
+from ultralytics.engine.results import Results
+from settings import (
+    TILE_SIZE, TILE_OVERLAP, TILE_SKIP_THRESHOLD, TILE_MAX_BATCH_SIZE, TILE_NMS_IOU, TILE_INCLUDE_FULL
+)
+
+logger = logging.getLogger(__name__)
+
+
+def tile_origins(length: int, tile_size: int, overlap: float) -> list:
+    if length <= tile_size:
+        return [0]
+    step = max(1, int(tile_size * (1 - overlap)))
+    origins = list(range(0, length - tile_size, step))
+    # Last tile is flush with the edge so nothing is cut off
+    origins.append(length - tile_size)
+    return origins
+
+
+def iter_tiles(image: np.ndarray, tile_size: int = TILE_SIZE, overlap: float = TILE_OVERLAP):
+    height, width = image.shape[:2]
+    for y in tile_origins(height, tile_size, overlap):
+        for x in tile_origins(width, tile_size, overlap):
+            yield x, y, image[y:y + tile_size, x:x + tile_size]
+
+
+def tile_texture(tile: np.ndarray) -> float:
+    # Sky and flat background have almost no edges; a 64px Laplacian is enough to tell
+    gray = cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (64, 64), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(small, cv2.CV_32F).var())
+
+
+def predict_tiled(model, image: np.ndarray, tile_size: int = TILE_SIZE, overlap: float = TILE_OVERLAP,
+                  skip_threshold: float = TILE_SKIP_THRESHOLD, max_batch_size: int = TILE_MAX_BATCH_SIZE,
+                  nms_iou: float = TILE_NMS_IOU, include_full: bool = TILE_INCLUDE_FULL,
+                  path: str = '', screen=None) -> Results:
+    """Runs ``model`` over overlapping tiles of ``image`` and merges the boxes.
+
+    Tiles whose texture score is below ``skip_threshold`` are dropped before
+    inference. Boxes from all tiles (plus an optional downscaled whole-image
+    pass, which catches defects larger than a tile) are shifted back to
+    full-image coordinates and merged with class-aware NMS.
+
+    ``screen(tiles)``, if given, returns a keep flag per remaining tile; only
+    kept tiles reach ``model``, and if none are kept the whole-image pass is
+    skipped as well.
+    """
+    height, width = image.shape[:2]
+    offsets, crops = [], []
+    skipped = 0
+    for x, y, tile in iter_tiles(image, tile_size, overlap):
+        if tile_texture(tile) < skip_threshold:
+            skipped += 1
+            continue
+        offsets.append((x, y))
+        crops.append(tile)
+
+    screened_out = 0
+    if screen is not None and crops:
+        keep = screen(crops)
+        screened_out = len(crops) - sum(keep)
+        offsets = [offset for offset, flag in zip(offsets, keep) if flag]
+        crops = [crop for crop, flag in zip(crops, keep) if flag]
+        include_full = include_full and bool(crops)
+
+    boxes, scores, classes = [], [], []
+
+    def collect(results, batch_offsets):
+        for (x, y), result in zip(batch_offsets, results):
+            data = result.boxes.data.cpu()
+            if not len(data):
+                continue
+            xyxy = data[:, :4].clone()
+            xyxy[:, [0, 2]] += x
+            xyxy[:, [1, 3]] += y
+            boxes.append(xyxy)
+            scores.append(data[:, 4])
+            classes.append(data[:, 5])
+
+    for start in range(0, len(crops), max_batch_size):
+        batch = crops[start:start + max_batch_size]
+        collect(model(batch, imgsz=tile_size, verbose=False), offsets[start:start + max_batch_size])
+
+    if include_full and (height > tile_size or width > tile_size):
+        collect(model(image, imgsz=tile_size, verbose=False), [(0, 0)])
+
+    if boxes:
+        boxes, scores, classes = torch.cat(boxes), torch.cat(scores), torch.cat(classes)
+        keep = batched_nms(boxes, scores, classes.long(), nms_iou)
+        data = torch.cat([boxes[keep], scores[keep, None], classes[keep, None]], dim=1)
+    else:
+        data = torch.zeros((0, 6))
+
+    logger.info(f"Tiled inference on {width}x{height}: {len(crops)} tile(s) run, {skipped} skipped, "
+                f"{screened_out} screened out, {len(data)} box(es)")
+    result = Results(orig_img=image, path=path, names=model.names, boxes=data)
+    result.tiles_run, result.tiles_skipped, result.tiles_screened_out = len(crops), skipped, screened_out
+    return result
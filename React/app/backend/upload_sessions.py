@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from storage import write_bytes
+from settings import (
+    UPLOAD_FOLDER, CHUNKED_UPLOAD_FOLDER, UPLOAD_CHUNK_SIZE, UPLOAD_MAX_CHUNK_SIZE, ORIGINAL_WRITE_WORKERS,
+    ORIGINAL_WRITE_MAX_PENDING, ORIGINAL_WAIT_SECONDS, UPLOAD_SESSION_TTL_SECONDS, UPLOAD_SESSION_SWEEP_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_BLOCK_SIZE = 1024 * 1024
+ORIGINAL_POLL_INTERVAL = 0.05
+
+
+class UploadSessionError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+def save_stream(stream, path: str, block_size: int = STREAM_BLOCK_SIZE) -> tuple:
+    # Write in fixed-size blocks and hash on the way through; returns (size, sha256)
+    digest = hashlib.sha256()
+    size = 0
+    with open(path, 'wb') as f:
+        for block in iter(lambda: stream.read(block_size), b''):
+            f.write(block)
+            digest.update(block)
+            size += len(block)
+    return size, digest.hexdigest()
+
+
+class OriginalWriter:
+    """Writes uploaded originals to disk off the request thread.
+
+    ``/api/analyze`` already holds the upload in memory and analyzes it from
+    there, so the copy on disk is only needed later (re-analysis, the image
+    endpoints). Writes go to a small thread pool; once ``max_pending`` are
+    queued, further writes happen inline so buffered uploads cannot pile up
+    in memory. ``wait`` blocks until ``path`` is on disk: a write this
+    process queued is waited on directly, one queued by another web process
+    is polled for. ``write_bytes`` renames the file into place whole, so
+    once it exists it is complete.
+    """
+
+    def __init__(self, workers: int = ORIGINAL_WRITE_WORKERS, max_pending: int = ORIGINAL_WRITE_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='original-writer')
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.written = 0
+        self.inline = 0
+        self.failed = 0
+
+    def persist(self, path: str, data: bytes) -> None:
+        future = None
+        with self._lock:
+            if len(self._pending) < self.max_pending and path not in self._pending:
+                future = self._pending[path] = self._executor.submit(self._write, path, data)
+            else:
+                self.inline += 1
+        if future is not None:
+            # Registered outside the lock: a write that already finished runs the callback right here
+            future.add_done_callback(lambda done: self._discard(path, done))
+            return
+        self._wait_pending(path)
+        self._write(path, data)
+
+    def _write(self, path: str, data: bytes) -> None:
+        try:
+            write_bytes(path, data)
+        except OSError as e:
+            logger.error(f"Failed to persist original {path}: {e}")
+            with self._lock:
+                self.failed += 1
+            return
+        with self._lock:
+            self.written += 1
+
+    def _discard(self, path: str, future) -> None:
+        with self._lock:
+            if self._pending.get(path) is future:
+                del self._pending[path]
+
+    def _wait_pending(self, path: str, timeout: float = None) -> None:
+        with self._lock:
+            future = self._pending.get(path)
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def wait(self, path: str, timeout: float = ORIGINAL_WAIT_SECONDS) -> bool:
+        """Blocks until ``path`` exists; returns False if it is still missing after ``timeout``."""
+        deadline = time.monotonic() + timeout
+        try:
+            self._wait_pending(path, timeout)
+        except FuturesTimeoutError:
+            return False
+        while not os.path.exists(path):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(ORIGINAL_POLL_INTERVAL)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'max_pending': self.max_pending,
+                'written': self.written,
+                'written_inline': self.inline,
+                'failed': self.failed,
+            }
+
+
+class UploadSessions:
+    """Resumable chunked uploads written straight to disk.
+
+    Each session lives in its own directory with the partial file and a small
+    JSON manifest, so a dropped connection (or a restarted worker) can resume
+    from ``received``. Chunks must arrive in order; the running sha256 of the
+    whole file is kept in memory per process and rebuilt from the partial
+    file when a chunk lands on a process that has not seen the session yet.
+    Sessions left idle for ``ttl_seconds`` are swept, from disk and from
+    every process's memory, as new sessions are created.
+    """
+
+    def __init__(self, root: str = CHUNKED_UPLOAD_FOLDER, ttl_seconds: int = UPLOAD_SESSION_TTL_SECONDS,
+                 sweep_interval: float = UPLOAD_SESSION_SWEEP_INTERVAL):
+        self.root = root
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self._hashers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._swept_at = 0.0
+
+    def _dir(self, token: str) -> str:
+        if not token or not all(c in '0123456789abcdef' for c in token):
+            raise UploadSessionError("Invalid upload token", 404)
+        return os.path.join(self.root, token)
+
+    def _session_lock(self, token: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(token, threading.Lock())
+
+    def _read_manifest(self, token: str) -> dict:
+        try:
+            with open(os.path.join(self._dir(token), 'manifest.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadSessionError("Upload session not found", 404)
+
+    def _write_manifest(self, token: str, manifest: dict) -> None:
+        path = os.path.join(self._dir(token), 'manifest.json')
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _data_path(self, token: str) -> str:
+        return os.path.join(self._dir(token), 'data')
+
+    def create(self, user_id: int, filename: str, file_size: int, content_type: str = None) -> dict:
+        self._maybe_sweep()
+        token = uuid.uuid4().hex
+        os.makedirs(self._dir(token))
+        open(self._data_path(token), 'wb').close()
+        manifest = {
+            'token': token,
+            'user_id': user_id,
+            'filename': filename,
+            'file_size': file_size,
+            'content_type': content_type,
+            'created_at': time.time(),
+        }
+        self._write_manifest(token, manifest)
+        return self.status(token)
+
+    def status(self, token: str) -> dict:
+        manifest = self._read_manifest(token)
+        return {
+            'upload_token': token,
+            'filename': manifest['filename'],
+            'file_size': manifest['file_size'],
+            'received': os.path.getsize(self._data_path(token)),
+            'chunk_size': UPLOAD_CHUNK_SIZE,
+        }
+
+    def _hasher(self, token: str, received: int):
+        offset, hasher = self._hashers.get(token, (None, None))
+        if offset == received:
+            return hasher
+        # First chunk seen by this process (or out of step): rebuild from disk
+        hasher = hashlib.sha256()
+        with open(self._data_path(token), 'rb') as f:
+            for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+                hasher.update(block)
+        return hasher
+
+    def write_chunk(self, token: str, offset: int, stream, length: int, checksum: str = None) -> dict:
+        if length is None or length <= 0:
+            raise UploadSessionError("Chunk body is empty")
+        if length > UPLOAD_MAX_CHUNK_SIZE:
+            raise UploadSessionError(f"Chunk exceeds {UPLOAD_MAX_CHUNK_SIZE} bytes", 413)
+
+        with self._session_lock(token):
+            manifest = self._read_manifest(token)
+            data_path = self._data_path(token)
+            received = os.path.getsize(data_path)
+            if offset != received:
+                raise UploadSessionError(f"Expected offset {received}, got {offset}", 409)
+            if received + length > manifest['file_size']:
+                raise UploadSessionError("Chunk extends past the declared file size")
+
+            file_hasher = self._hasher(token, received).copy()
+            chunk_hasher = hashlib.sha256()
+            written = 0
+            with open(data_path, 'r+b') as f:
+                f.seek(offset)
+                while written < length:
+                    block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+                    if not block:
+                        break
+                    f.write(block)
+                    chunk_hasher.update(block)
+                    file_hasher.update(block)
+                    written += len(block)
+
+                if written != length or (checksum and checksum.lower() != chunk_hasher.hexdigest()):
+                    # Drop the partial or corrupt chunk so the client can resend it
+                    f.truncate(offset)
+                    self._hashers.pop(token, None)
+                    if written != length:
+                        raise UploadSessionError(f"Chunk truncated: expected {length} bytes, got {written}")
+                    raise UploadSessionError("Chunk checksum mismatch")
+
+            self._hashers[token] = (offset + written, file_hasher)
+        return self.status(token)
+
+    def complete(self, token: str, checksum: str = None, store=None) -> dict:
+        """Verifies a finished upload and hands the file to ``store(path, filename, content_hash)``.
+
+        ``store`` puts a copy of the file into permanent storage and returns
+        where it went; without one the file is copied under its name into
+        UPLOAD_FOLDER. The session stays until ``finish``, so a caller whose
+        transaction fails can let the client retry the completion.
+        """
+        with self._session_lock(token):
+            manifest = self._read_manifest(token)
+            data_path = self._data_path(token)
+            received = os.path.getsize(data_path)
+            if received != manifest['file_size']:
+                raise UploadSessionError(f"Upload incomplete: {received} of {manifest['file_size']} bytes", 409)
+
+            content_hash = self._hasher(token, received).hexdigest()
+            if checksum and checksum.lower() != content_hash:
+                raise UploadSessionError("File checksum mismatch")
+
+            if store is None:
+                destination = os.path.join(UPLOAD_FOLDER, manifest['filename'])
+                shutil.copyfile(data_path, destination)
+            else:
+                destination = store(data_path, manifest['filename'], content_hash)
+        return dict(manifest, path=destination, content_hash=content_hash)
+
+    def finish(self, token: str) -> None:
+        # Called once whatever ``complete`` handed the file to has been committed
+        with self._session_lock(token):
+            shutil.rmtree(self._dir(token), ignore_errors=True)
+        self._forget(token)
+
+    def _forget(self, token: str) -> None:
+        with self._lock:
+            self._hashers.pop(token, None)
+            self._locks.pop(token, None)
+
+    def _maybe_sweep(self) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if now - self._swept_at < self.sweep_interval:
+                return
+            self._swept_at = now
+        try:
+            self.sweep()
+        except OSError as e:
+            logger.warning(f"Failed to sweep upload sessions: {e}")
+
+    def sweep(self) -> int:
+        """Deletes sessions with no activity for ``ttl_seconds``; returns how many.
+
+        Activity is the partial file's mtime, which every chunk bumps. Also
+        drops in-memory state for sessions another process finished or swept.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        tokens = os.listdir(self.root) if os.path.isdir(self.root) else []
+        for token in tokens:
+            try:
+                session_dir = self._dir(token)
+            except UploadSessionError:
+                continue
+            with self._session_lock(token):
+                try:
+                    expired = os.path.getmtime(self._data_path(token)) < cutoff
+                except FileNotFoundError:
+                    # Crashed between creating the directory and the data file
+                    expired = os.path.getmtime(session_dir) < cutoff
+                if not expired:
+                    continue
+                shutil.rmtree(session_dir, ignore_errors=True)
+            self._forget(token)
+            removed += 1
+        with self._lock:
+            gone = [token for token in set(self._hashers) | set(self._locks)
+                    if not os.path.isdir(os.path.join(self.root, token))]
+        for token in gone:
+            self._forget(token)
+        if removed:
+            logger.info(f"Swept {removed} abandoned upload session(s)")
+        return removed
+
+
+upload_sessions = UploadSessions()
+originals = OriginalWriter()
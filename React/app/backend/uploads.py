@@ -0,0 +1,73 @@
+from datetime import datetime
+from sqlalchemy import or_, and_
+from sqlalchemy.orm import selectinload
+from db_models import Upload
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+UPLOAD_FIELDS = ('id', 'filename', 'upload_date', 'file_type', 'file_size', 'analyses')
+
+
+def encode_cursor(upload) -> str:
+    return f"{upload.upload_date.isoformat()}_{upload.id}"
+
+
+def decode_cursor(cursor: str) -> tuple:
+    upload_date, _, upload_id = cursor.rpartition('_')
+    try:
+        return datetime.fromisoformat(upload_date), int(upload_id)
+    except ValueError:
+        # The parsers' own messages ("Invalid isoformat string: ''") mean nothing to an API client
+        raise ValueError("invalid cursor") from None
+
+
+def parse_fields(value: str) -> tuple:
+    if not value:
+        return UPLOAD_FIELDS
+    fields = tuple(f.strip() for f in value.split(',') if f.strip())
+    unknown = set(fields) - set(UPLOAD_FIELDS)
+    if unknown:
+        raise ValueError(f"unknown field(s): {', '.join(sorted(unknown))}")
+    return fields
+
+
+def query_uploads(db, user_id: int, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE,
+                  fields: tuple = UPLOAD_FIELDS) -> tuple:
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = db.query(Upload).filter(Upload.user_id == user_id)
+    # Analyses for the whole page come back in one extra IN query, not one per upload
+    if 'analyses' in fields:
+        query = query.options(selectinload(Upload.analyses))
+
+    # Keyset pagination on (upload_date, id), served by ix_uploads_user_upload_date
+    if cursor:
+        upload_date, upload_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Upload.upload_date < upload_date,
+            and_(Upload.upload_date == upload_date, Upload.id < upload_id)
+        ))
+
+    rows = query.order_by(Upload.upload_date.desc(), Upload.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def upload_to_dict(upload, fields: tuple = UPLOAD_FIELDS) -> dict:
+    data = {}
+    if 'id' in fields:
+        data["id"] = upload.id
+    if 'filename' in fields:
+        data["filename"] = upload.filename
+    if 'upload_date' in fields:
+        data["upload_date"] = upload.upload_date.isoformat()
+    if 'file_type' in fields:
+        data["file_type"] = upload.file_type
+    if 'file_size' in fields:
+        data["file_size"] = upload.file_size
+    if 'analyses' in fields:
+        data["analyses"] = [{
+            "id": analysis.id,
+            "status": analysis.status,
+            "result_path": analysis.result_path
+        } for analysis in upload.analyses]
+    return data
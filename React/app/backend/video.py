@@ -0,0 +1,141 @@
+import logging
+import cv2
+import numpy as np
+from model_registry import registry as model_registry
+from inference import result_to_detections
+from settings import (
+    INFERENCE_IMGSZ, VIDEO_FRAME_STRIDE, VIDEO_BATCH_SIZE,
+    VIDEO_DUPLICATE_THRESHOLD, VIDEO_OUTPUT_FOURCC
+)
+
+logger = logging.getLogger(__name__)
+
+
+def iter_frames(video_path: str, stride: int = VIDEO_FRAME_STRIDE):
+    # Decode lazily; only one frame is held at a time
+    capture = cv2.VideoCapture(str(video_path))
+    if not capture.isOpened():
+        raise RuntimeError(f"Could not open video {video_path}")
+    try:
+        index = 0
+        while True:
+            if index % stride == 0:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield index, frame
+            elif not capture.grab():
+                break
+            index += 1
+    finally:
+        capture.release()
+
+
+def frame_signature(frame: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(gray, (64, 36), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def is_near_duplicate(signature: np.ndarray, previous: np.ndarray, threshold: float) -> bool:
+    return previous is not None and float(np.mean(np.abs(signature - previous))) < threshold
+
+
+class VideoAnalyzer:
+    """Runs a video through the model in bounded batches and writes the result as it goes.
+
+    Frames whose downscaled grayscale signature is within ``duplicate_threshold``
+    of the last analysed frame are not sent to the model; the previous
+    annotated frame and detections are reused for them.
+    """
+
+    def __init__(self, model_path: str, stride: int = VIDEO_FRAME_STRIDE, batch_size: int = VIDEO_BATCH_SIZE,
+                 duplicate_threshold: float = VIDEO_DUPLICATE_THRESHOLD, imgsz: int = INFERENCE_IMGSZ):
+        self.model_path = model_path
+        self.stride = max(1, stride)
+        self.batch_size = max(1, batch_size)
+        self.duplicate_threshold = duplicate_threshold
+        self.imgsz = imgsz
+
+    def run(self, video_path: str, output_path: str) -> dict:
+        model = model_registry.get(self.model_path)
+
+        capture = cv2.VideoCapture(str(video_path))
+        fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+        total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        capture.release()
+
+        self._writer = None
+        self._output_path = output_path
+        self._output_fps = fps / self.stride
+        self._frames = []
+        self._last_annotated = None
+        self._last_detections = []
+        self._processed = 0
+        self._skipped = 0
+
+        pending = []
+        previous_signature = None
+        try:
+            for index, frame in iter_frames(video_path, self.stride):
+                signature = frame_signature(frame)
+                if is_near_duplicate(signature, previous_signature, self.duplicate_threshold):
+                    pending.append((index, None))
+                else:
+                    previous_signature = signature
+                    pending.append((index, frame))
+
+                if sum(1 for _, f in pending if f is not None) >= self.batch_size:
+                    self._flush(model, pending)
+                    pending = []
+            self._flush(model, pending)
+        finally:
+            if self._writer is not None:
+                self._writer.release()
+
+        return {
+            'type': 'video',
+            'fps': fps,
+            'total_frames': total_frames,
+            'frame_stride': self.stride,
+            'frames_analyzed': self._processed,
+            'frames_skipped_duplicate': self._skipped,
+            'frames': self._frames,
+        }
+
+    def _flush(self, model, pending: list) -> None:
+        if not pending:
+            return
+        frames = [frame for _, frame in pending if frame is not None]
+        results = iter(model(frames, imgsz=self.imgsz, verbose=False)) if frames else iter(())
+
+        for index, frame in pending:
+            if frame is None:
+                # Near-duplicate: reuse what the last analysed frame produced
+                self._skipped += 1
+                annotated, detections = self._last_annotated, self._last_detections
+            else:
+                result = next(results)
+                annotated, detections = result.plot(), result_to_detections(result)
+                self._processed += 1
+                self._last_annotated, self._last_detections = annotated, detections
+
+            if annotated is None:
+                continue
+            self._write(annotated)
+            if detections:
+                self._frames.append({'frame': index, 'detections': detections})
+
+    def _write(self, frame: np.ndarray) -> None:
+        if self._writer is None:
+            height, width = frame.shape[:2]
+            fourcc = cv2.VideoWriter_fourcc(*VIDEO_OUTPUT_FOURCC)
+            self._writer = cv2.VideoWriter(str(self._output_path), fourcc, self._output_fps, (width, height))
+            if not self._writer.isOpened():
+                raise RuntimeError(f"Could not open video writer for {self._output_path}")
+        self._writer.write(frame)
+
+
+def predict_video(video_path: str, model_path: str, output_path: str) -> tuple:
+    logger.info(f"Streaming video analysis of {video_path} to {output_path}")
+    metadata = VideoAnalyzer(model_path).run(video_path, output_path)
+    return str(output_path), metadata
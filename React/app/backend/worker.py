@@ -0,0 +1,18 @@
+import argparse
+import logging
+from jobs import supervise_workers
+from settings import ANALYSIS_WORKERS
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WindSightAI analysis worker pool")
+    parser.add_argument("--workers", type=int, default=ANALYSIS_WORKERS, help="Number of worker processes")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    # Restarts workers that die; web processes never start workers themselves
+    supervise_workers(args.workers, daemon=False)
+
+if __name__ == "__main__":
+    main()
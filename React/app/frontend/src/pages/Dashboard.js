@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import axios from 'axios';
 import {
   Box,
@@ -23,6 +23,28 @@ import { Button } from '../components/common/Button';
 import { Card } from '../components/common/Card';
 import { FileInput } from '../components/common/FileInput';
 import { Spinner } from '../components/common/Spinner';
+import { uploadFileChunked, CHUNKED_UPLOAD_THRESHOLD } from '../services/chunkedUpload';
+
+const UPLOADS_PAGE_SIZE = 20;
+// Pushed by /api/events; each carries one upload or one analysis status change
+const ANALYSIS_EVENTS = ['analysis.queued', 'analysis.running', 'analysis.completed', 'analysis.failed'];
+// Grid previews use server-side thumbnails; the modal still opens the full-resolution file
+const PREVIEW_SIZE = 'small';
+// Longest an Analyze click waits for its completion event before asking /api/analysis/<id> directly
+const JOB_WAIT_TIMEOUT_MS = 10 * 60 * 1000;
+
+const completedAnalysis = (upload) =>
+  upload.analyses?.find((analysis) => analysis.status === 'completed');
+
+const applyAnalysisEvent = (uploads, { upload_id: uploadId, analysis }) =>
+  uploads.map((upload) =>
+    upload.id !== uploadId
+      ? upload
+      : {
+          ...upload,
+          analyses: [...(upload.analyses || []).filter((existing) => existing.id !== analysis.id), analysis],
+        }
+  );
 
 // ImageWithFallback Component
 const ImageWithFallback = ({ src, alt, onClick, ...props }) => {
@@ -92,6 +114,8 @@ const Dashboard = () => {
   const [file, setFile] = useState(null);
   const [preview, setPreview] = useState(null);
   const [uploads, setUploads] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [userId, setUserId] = useState(null);
   const [isUploading, setIsUploading] = useState(false);
   const [isAnalyzing, setIsAnalyzing] = useState({});
@@ -104,10 +128,18 @@ const Dashboard = () => {
   const [selectedImage, setSelectedImage] = useState(null);
   const [isModalOpen, setIsModalOpen] = useState(false);
 
-  const fetchUploads = useCallback(async (id) => {
+  // Analysis jobs this tab is waiting on, and finished jobs whose event arrived before anyone waited
+  const jobWaiters = useRef({});
+  const settledJobs = useRef({});
+
+  const fetchUploads = useCallback(async (id, cursor = null) => {
     try {
-      const response = await axios.get(`/api/uploads?user_id=${id}`);
-      setUploads(response.data);
+      const response = await axios.get('/api/uploads', {
+        params: { user_id: id, limit: UPLOADS_PAGE_SIZE, ...(cursor && { cursor }) },
+      });
+      const { uploads: page, next_cursor: next } = response.data;
+      setUploads((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(next);
     } catch (error) {
       toast({
         title: 'Error fetching uploads',
@@ -129,6 +161,100 @@ const Dashboard = () => {
     }
   }, [fetchUploads]);
 
+  const settleJob = useCallback((data, failed) => {
+    const jobId = data.analysis.id;
+    const waiter = jobWaiters.current[jobId];
+    if (!waiter) {
+      settledJobs.current[jobId] = { data, failed };
+      return;
+    }
+    delete jobWaiters.current[jobId];
+    clearTimeout(waiter.timer);
+    if (failed) {
+      waiter.reject(new Error(data.error || 'Analysis failed'));
+    } else {
+      waiter.resolve(data);
+    }
+  }, []);
+
+  // Fallback for when events may have been missed (stream error, reset) or never arrive (timeout)
+  const checkJob = useCallback(async (jobId) => {
+    const response = await axios.get(`/api/analysis/${jobId}`);
+    const { upload_id: uploadId, status, result_path: resultPath, error } = response.data;
+    if (status !== 'completed' && status !== 'failed') return false;
+    const data = {
+      upload_id: uploadId,
+      analysis: { id: jobId, status, result_path: resultPath },
+      ...(error && { error }),
+    };
+    setUploads((prev) => applyAnalysisEvent(prev, data));
+    settleJob(data, status === 'failed');
+    return true;
+  }, [settleJob]);
+
+  const checkPendingJobs = useCallback(() => {
+    Object.keys(jobWaiters.current).forEach((jobId) => {
+      checkJob(Number(jobId)).catch(() => {});
+    });
+  }, [checkJob]);
+
+  const waitForJob = (jobId) =>
+    new Promise((resolve, reject) => {
+      const settled = settledJobs.current[jobId];
+      if (settled) {
+        delete settledJobs.current[jobId];
+        if (settled.failed) {
+          reject(new Error(settled.data.error || 'Analysis failed'));
+        } else {
+          resolve(settled.data);
+        }
+        return;
+      }
+      const timer = setTimeout(async () => {
+        let finished = false;
+        try {
+          finished = await checkJob(jobId);
+        } catch (error) {
+          // Reported as a timeout below
+        }
+        if (!finished && jobWaiters.current[jobId]) {
+          delete jobWaiters.current[jobId];
+          reject(new Error('Timed out waiting for the analysis; it will appear here once it finishes'));
+        }
+      }, JOB_WAIT_TIMEOUT_MS);
+      jobWaiters.current[jobId] = { resolve, reject, timer };
+    });
+
+  // Apply pushed deltas instead of re-fetching the upload list after every action. The browser
+  // reconnects on its own and resumes from the last event id it saw.
+  useEffect(() => {
+    if (!userId) return undefined;
+    const source = new EventSource(`/api/events?user_id=${userId}`);
+
+    source.addEventListener('upload.created', (event) => {
+      const upload = JSON.parse(event.data);
+      setUploads((prev) => (prev.some((existing) => existing.id === upload.id) ? prev : [upload, ...prev]));
+    });
+    ANALYSIS_EVENTS.forEach((kind) => {
+      source.addEventListener(kind, (event) => {
+        const data = JSON.parse(event.data);
+        setUploads((prev) => applyAnalysisEvent(prev, data));
+        if (kind === 'analysis.completed' || kind === 'analysis.failed') {
+          settleJob(data, kind === 'analysis.failed');
+        }
+      });
+    });
+    // Sent when the server could not replay everything missed while disconnected
+    source.addEventListener('reset', () => {
+      fetchUploads(userId);
+      checkPendingJobs();
+    });
+    // The browser keeps reconnecting; meanwhile make sure no Analyze click waits on an event it missed
+    source.onerror = checkPendingJobs;
+
+    return () => source.close();
+  }, [userId, fetchUploads, settleJob, checkPendingJobs]);
+
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
     setFile(selectedFile);
@@ -154,20 +280,23 @@ const Dashboard = () => {
   const handleUpload = async () => {
     if (!file || !userId) return;
 
-    const formData = new FormData();
-    formData.append('file', file);
-    formData.append('user_id', userId);
-
     setIsUploading(true);
     try {
-      await axios.post('/api/upload', formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data'
-        }
-      });
+      if (file.size > CHUNKED_UPLOAD_THRESHOLD) {
+        await uploadFileChunked(file, userId);
+      } else {
+        const formData = new FormData();
+        formData.append('file', file);
+        formData.append('user_id', userId);
+
+        await axios.post('/api/upload', formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data'
+          }
+        });
+      }
       setFile(null);
       setPreview(null);
-      fetchUploads(userId);
       toast({
         title: 'Success',
         description: 'File uploaded successfully',
@@ -188,11 +317,25 @@ const Dashboard = () => {
     }
   };
 
+  const handleLoadMore = async () => {
+    setIsLoadingMore(true);
+    try {
+      await fetchUploads(userId, nextCursor);
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   const handleAnalyze = async (uploadId) => {
     setIsAnalyzing(prev => ({ ...prev, [uploadId]: true }));
     try {
-      await axios.post(`/api/analyze/${uploadId}`);
-      fetchUploads(userId);
+      const response = await axios.post(`/api/analyze/${uploadId}`);
+      if (response.data.status === 'completed') {
+        // Served from cache; its completed event still arrives and is applied like any other
+        delete settledJobs.current[response.data.job_id];
+      } else {
+        await waitForJob(response.data.job_id);
+      }
       toast({
         title: 'Success',
         description: 'Analysis completed',
@@ -203,7 +346,7 @@ const Dashboard = () => {
     } catch (error) {
       toast({
         title: 'Analysis failed',
-        description: error.response?.data?.error || 'An unexpected error occurred',
+        description: error.response?.data?.error || error.message || 'An unexpected error occurred',
         status: 'error',
         duration: 5000,
         isClosable: true,
@@ -261,60 +404,76 @@ const Dashboard = () => {
             </Card>
           ) : (
             <Grid templateColumns={{ base: '1fr', lg: 'repeat(2, 1fr)' }} gap={6}>
-              {uploads.map((upload) => (
-                <Card key={upload.id} p={6}>
-                  <VStack spacing={4} align="stretch">
-                    <Flex justify="space-between" align="center">
-                      <Text fontWeight="bold" color={textColor}>{upload.filename}</Text>
-                      <Button
-                        onClick={() => handleAnalyze(upload.id)}
-                        isLoading={isAnalyzing[upload.id]}
-                        loadingText="Analyzing"
-                        isDisabled={upload.analyses && upload.analyses.length > 0}
-                        colorScheme={upload.analyses?.length > 0 ? 'gray' : 'green'}
-                        variant={upload.analyses?.length > 0 ? 'outline' : 'solid'}
-                        size="sm"
-                      >
-                        {upload.analyses && upload.analyses.length > 0 ? 'Analyzed' : 'Analyze'}
-                      </Button>
-                    </Flex>
-
-                    <Grid templateColumns={{ base: '1fr', md: 'repeat(2, 1fr)' }} gap={4}>
-                      <Box>
-                        <Text fontSize="sm" fontWeight="medium" mb={2} color={textColor}>Original Image</Text>
-                        <ImageWithFallback
-                          src={`/api/image/upload/${upload.filename}`}
-                          alt={upload.filename}
-                          onClick={() => {
-                            setSelectedImage(`/api/image/upload/${upload.filename}`);
-                            setIsModalOpen(true);
-                          }}
-                        />
-                      </Box>
-
-                      {upload.analyses && upload.analyses.length > 0 && (
+              {uploads.map((upload) => {
+                const analysis = completedAnalysis(upload);
+                return (
+                  <Card key={upload.id} p={6}>
+                    <VStack spacing={4} align="stretch">
+                      <Flex justify="space-between" align="center">
+                        <Text fontWeight="bold" color={textColor}>{upload.filename}</Text>
+                        <Button
+                          onClick={() => handleAnalyze(upload.id)}
+                          isLoading={isAnalyzing[upload.id]}
+                          loadingText="Analyzing"
+                          isDisabled={!!analysis}
+                          colorScheme={analysis ? 'gray' : 'green'}
+                          variant={analysis ? 'outline' : 'solid'}
+                          size="sm"
+                        >
+                          {analysis ? 'Analyzed' : 'Analyze'}
+                        </Button>
+                      </Flex>
+
+                      <Grid templateColumns={{ base: '1fr', md: 'repeat(2, 1fr)' }} gap={4}>
                         <Box>
-                          <Text fontSize="sm" fontWeight="medium" mb={2} color={textColor}>Analyzed Image</Text>
+                          <Text fontSize="sm" fontWeight="medium" mb={2} color={textColor}>Original Image</Text>
                           <ImageWithFallback
-                            src={`/api/image/output/${upload.analyses[0].result_path}`}
-                            alt="Analyzed Image"
+                            src={`/api/image/upload/${upload.filename}?upload_id=${upload.id}&size=${PREVIEW_SIZE}`}
+                            alt={upload.filename}
                             onClick={() => {
-                              setSelectedImage(`/api/image/output/${upload.analyses[0].result_path}`);
+                              setSelectedImage(`/api/image/upload/${upload.filename}?upload_id=${upload.id}`);
                               setIsModalOpen(true);
                             }}
                           />
                         </Box>
-                      )}
-                    </Grid>
-
-                    <Text fontSize="sm" color="gray.500">
-                      Uploaded on: {new Date(upload.upload_date).toLocaleString()}
-                    </Text>
-                  </VStack>
-                </Card>
-              ))}
+
+                        {analysis && (
+                          <Box>
+                            <Text fontSize="sm" fontWeight="medium" mb={2} color={textColor}>Analyzed Image</Text>
+                            <ImageWithFallback
+                              src={`/api/image/output/${analysis.result_path}?size=${PREVIEW_SIZE}`}
+                              alt="Analyzed Image"
+                              onClick={() => {
+                                setSelectedImage(`/api/image/output/${analysis.result_path}`);
+                                setIsModalOpen(true);
+                              }}
+                            />
+                          </Box>
+                        )}
+                      </Grid>
+
+                      <Text fontSize="sm" color="gray.500">
+                        Uploaded on: {new Date(upload.upload_date).toLocaleString()}
+                      </Text>
+                    </VStack>
+                  </Card>
+                );
+              })}
             </Grid>
           )}
+
+          {nextCursor && (
+            <Flex justify="center" mt={6}>
+              <Button
+                onClick={handleLoadMore}
+                isLoading={isLoadingMore}
+                loadingText="Loading"
+                variant="outline"
+              >
+                Load more
+              </Button>
+            </Flex>
+          )}
         </Box>
       </VStack>
 
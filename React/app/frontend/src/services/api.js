@@ -14,7 +14,7 @@ export const authService = {
 
 export const uploadService = {
   uploadFile: (formData) => api.post('/upload', formData),
-  getUploads: (userId) => api.get(`/uploads?user_id=${userId}`),
+  getUploads: (userId, params = {}) => api.get('/uploads', { params: { user_id: userId, ...params } }),
   analyzeFile: (uploadId) => api.post(`/analyze/${uploadId}`),
 };
 
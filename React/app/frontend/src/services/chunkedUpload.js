@@ -0,0 +1,72 @@
+import axios from 'axios';
+
+// Files above this size go through the resumable chunked upload endpoints
+export const CHUNKED_UPLOAD_THRESHOLD = 32 * 1024 * 1024;
+
+const MAX_CHUNK_RETRIES = 5;
+
+const toHex = (buffer) =>
+  Array.from(new Uint8Array(buffer))
+    .map((b) => b.toString(16).padStart(2, '0'))
+    .join('');
+
+// crypto.subtle only exists in secure contexts (HTTPS or localhost); elsewhere chunks go without a checksum
+const canHash = typeof crypto !== 'undefined' && Boolean(crypto.subtle);
+
+const sha256 = async (blob) => toHex(await crypto.subtle.digest('SHA-256', await blob.arrayBuffer()));
+
+const sessionKey = (file, userId) => `chunked-upload:${userId}:${file.name}:${file.size}:${file.lastModified}`;
+
+export const uploadFileChunked = async (file, userId, onProgress = () => {}) => {
+  const key = sessionKey(file, userId);
+  let session = null;
+
+  // Resume an interrupted upload of the same file if the server still has it
+  const storedToken = localStorage.getItem(key);
+  if (storedToken) {
+    try {
+      session = (await axios.get(`/api/uploads/chunked/${storedToken}`)).data;
+    } catch (error) {
+      localStorage.removeItem(key);
+    }
+  }
+  if (!session) {
+    session = (
+      await axios.post('/api/uploads/chunked', {
+        user_id: userId,
+        filename: file.name,
+        file_size: file.size,
+        content_type: file.type,
+      })
+    ).data;
+    localStorage.setItem(key, session.upload_token);
+  }
+
+  const { upload_token: token, chunk_size: chunkSize } = session;
+  let offset = session.received;
+  let retries = 0;
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + chunkSize);
+    try {
+      const response = await axios.put(`/api/uploads/chunked/${token}?offset=${offset}`, chunk, {
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          ...(canHash && { 'X-Chunk-SHA256': await sha256(chunk) }),
+        },
+      });
+      offset = response.data.received;
+      retries = 0;
+      onProgress(offset / file.size);
+    } catch (error) {
+      if (++retries > MAX_CHUNK_RETRIES) {
+        throw error;
+      }
+      // Ask the server where it actually got to before retrying
+      offset = (await axios.get(`/api/uploads/chunked/${token}`)).data.received;
+    }
+  }
+
+  const response = await axios.post(`/api/uploads/chunked/${token}/complete`);
+  localStorage.removeItem(key);
+  return response.data;
+};
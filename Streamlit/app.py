@@ -1,10 +1,15 @@
 # app.py
 import streamlit as st
 from dashboard import create_dashboard
+from gallery import image_gallery
+from fleet import defect_summary_panel
 from PIL import Image
 import os
+import hashlib
+import threading
+import cv2
+import numpy as np
 from ultralytics import YOLO
-import tempfile
 
 # Set page config
 st.set_page_config(page_title="WindSightAI: Turbine Blade Defect Detection", layout="wide")
@@ -21,23 +26,25 @@ st.sidebar.markdown("[GitHub Repository](https://github.com/MohsenMaaleki/windsi
 st.sidebar.markdown("---")
 
 script_dir = os.path.dirname(os.path.abspath(__file__))
-
-def load_images_from_directory(directory):
-    images = []
-    full_path = os.path.join(script_dir, directory)
-    if os.path.exists(full_path):
-        for filename in os.listdir(full_path):
-            if filename.endswith(('.png', '.jpg', '.jpeg')):
-                img_path = os.path.join(full_path, filename)
-                images.append((Image.open(img_path), filename))
-    else:
-        st.warning(f"Directory '{full_path}' not found. Please check the path.")
-    return images
-
-def display_images(images, columns=3):
-    cols = st.columns(columns)
-    for idx, (img, filename) in enumerate(images):
-        cols[idx % columns].image(img, use_column_width=True, caption=filename)
+weights_path = os.path.join(script_dir, "weights", "best.pt")
+
+@st.cache_resource
+def load_model(path, mtime):
+    # One model per process, shared by every session; mtime in the key picks up new weights
+    return YOLO(path), threading.Lock()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def analyze_image(file_hash, _image_bytes):
+    # Keyed by the upload's sha256 only; the bytes themselves are not hashed again
+    model, lock = load_model(weights_path, os.path.getmtime(weights_path))
+    image = cv2.imdecode(np.frombuffer(_image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Could not decode the uploaded image")
+    # Sessions run on separate threads; the model is not safe to call concurrently
+    with lock:
+        result = model(image, verbose=False)[0]
+    detections = [(model.names[int(box.cls.item())], box.conf.item()) for box in result.boxes]
+    return result.plot()[..., ::-1], detections
 
 # Main content
 if page == "Home":
@@ -66,59 +73,47 @@ if page == "Home":
         image = Image.open(uploaded_file)
         st.image(image, caption="Uploaded Image", use_column_width=True)
         
-        # Save the uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp_file:
-            tmp_file.write(uploaded_file.getvalue())
-            tmp_file_path = tmp_file.name
-
-        # Load the YOLO model
-        model = YOLO(os.path.join(script_dir, "weights", "best.pt"))  # load your custom model
-
-        # Perform prediction
+        image_bytes = uploaded_file.getvalue()
+        # Hash each upload once, not on every widget interaction
+        upload_hashes = st.session_state.setdefault("upload_hashes", {})
+        if uploaded_file.file_id not in upload_hashes:
+            upload_hashes[uploaded_file.file_id] = hashlib.sha256(image_bytes).hexdigest()
+        file_hash = upload_hashes[uploaded_file.file_id]
+
+        # Inference only runs on the click; later reruns redraw the stored result
         if st.button("Analyze Image"):
             with st.spinner("Analyzing image..."):
-                results = model(tmp_file_path)  # Remove save=True
-                
-                # Display the result
-                for r in results:
-                    boxes = r.boxes  # Bounding box objects
-                    im_array = r.plot()  # plot a BGR numpy array of predictions
-                    im = Image.fromarray(im_array[..., ::-1])  # RGB PIL image
-                    st.image(im, caption="Analyzed Image with Detections", use_column_width=True)
-                
-                # Display detection information
-                st.subheader("Detection Results:")
-                for box in boxes:
-                    conf = box.conf.item()
-                    cls = int(box.cls.item())
-                    class_name = model.names[cls]
-                    st.write(f"Detected: {class_name}, Confidence: {conf:.2f}")
-
-        # Clean up the temporary file
-        os.unlink(tmp_file_path)
+                try:
+                    analyze_image(file_hash, image_bytes)
+                    st.session_state["analyzed_hash"] = file_hash
+                except Exception as e:
+                    st.error(f"Analysis failed: {e}")
+
+        if st.session_state.get("analyzed_hash") == file_hash:
+            annotated, detections = analyze_image(file_hash, image_bytes)
+            st.image(annotated, caption="Analyzed Image with Detections", use_column_width=True)
+
+            # Display detection information
+            st.subheader("Detection Results:")
+            for class_name, conf in detections:
+                st.write(f"Detected: {class_name}, Confidence: {conf:.2f}")
 
     # Detection Results Section
     st.header("Sample Defect Detection Results")
-    detected_images = load_images_from_directory('detected_images')
-    
-    if detected_images:
-        display_images(detected_images)
-    else:
+    if not image_gallery(os.path.join(script_dir, 'detected_images'), 'detected_images'):
         st.info("No detected images found. Please add some images to the 'detected_images' folder.")
         st.write(f"Current working directory: {os.getcwd()}")
         st.write(f"Contents of current directory: {os.listdir('.')}")
 
 elif page == "Dashboard":
     st.title("Detection Dashboard")
+    defect_summary_panel()
     create_dashboard()
     
     # Statistics and Plots Section
     st.header("Statistics and Plots")
-    stat_images = load_images_from_directory('statistics_plots')
-    
-    if stat_images:
-        display_images(stat_images, columns=2)  # Using 2 columns for potentially larger plot images
-    else:
+    # Using 2 columns for potentially larger plot images
+    if not image_gallery(os.path.join(script_dir, 'statistics_plots'), 'statistics_plots', columns=2):
         st.info("No statistics or plot images found. Please add some images to the 'statistics_plots' folder.")
         st.write(f"Current working directory: {os.getcwd()}")
         st.write(f"Contents of current directory: {os.listdir('.')}")
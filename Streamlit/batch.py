@@ -0,0 +1,281 @@
+import os
+import json
+import glob
+import time
+import multiprocessing
+from pathlib import Path
+import cv2
+from shared import (
+    load_model, export_model, predict_tiled, INT8_CALIBRATION_DIR, EXPORT_DIR, TILE_SIZE, TILE_OVERLAP,
+    TILE_SKIP_THRESHOLD, TILE_MAX_BATCH_SIZE, TILE_NMS_IOU, TILE_INCLUDE_FULL
+)
+
+IMAGE_SUFFIXES = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+BATCH_SIZE = 8
+PARQUET_ROWS_PER_PART = 5000
+
+# Set once per worker process by _init_worker
+_model = None
+_options = None
+_init_error = None
+
+
+def expand_inputs(inputs: list, manifest: str = None) -> list:
+    """Turns directories, glob patterns, files and an optional manifest into a sorted list of images."""
+    patterns = list(inputs)
+    if manifest:
+        with open(manifest) as f:
+            patterns.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+
+    paths = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            candidates = (str(p) for p in Path(pattern).rglob('*'))
+        elif glob.has_magic(pattern):
+            candidates = glob.iglob(pattern, recursive=True)
+        else:
+            candidates = [pattern]
+        for candidate in candidates:
+            if Path(candidate).suffix.lower() in IMAGE_SUFFIXES and os.path.isfile(candidate):
+                paths.add(os.path.abspath(candidate))
+    return sorted(paths)
+
+
+def result_to_detections(result) -> list:
+    detections = []
+    for x1, y1, x2, y2, confidence, class_id in result.boxes.data.tolist():
+        detections.append({
+            'class_id': int(class_id),
+            'class_name': result.names[int(class_id)],
+            'confidence': float(confidence),
+            'bbox': [x1, y1, x2, y2],
+        })
+    return detections
+
+
+def _init_worker(model_path: str, options: dict) -> None:
+    global _model, _options, _init_error
+    _options = options
+    # Raising here would make the Pool respawn the worker forever; the first batch reports it instead
+    try:
+        _model = load_model(model_path, backend=options['backend'], threads=options['threads'],
+                            int8=options['int8'], calibration_dir=options['calibration_dir'],
+                            export_dir=EXPORT_DIR)
+    except Exception as e:
+        _init_error = f"Failed to load model from {model_path}: {e}"
+
+
+def _predict(images: list, paths: list) -> list:
+    if _options['tiled']:
+        return [predict_tiled(_model, image, tile_size=_options['tile_size'], overlap=_options['tile_overlap'],
+                              skip_threshold=_options['skip_threshold'], max_batch_size=TILE_MAX_BATCH_SIZE,
+                              nms_iou=TILE_NMS_IOU, include_full=TILE_INCLUDE_FULL, path=path)
+                for image, path in zip(images, paths)]
+    return _model(images, verbose=False)
+
+
+def output_path_for(path: str, options: dict) -> Path:
+    # Mirror the input tree under output_dir so same-named images from different folders stay apart
+    relative = Path(os.path.relpath(path, options['input_root']))
+    return Path(options['output_dir']) / relative.parent / f"{relative.stem}_pred{relative.suffix}"
+
+
+def _process_batch(paths: list) -> list:
+    if _init_error:
+        raise RuntimeError(_init_error)
+    rows, images, decoded = [], [], []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            rows.append({'image': path, 'error': "could not decode image"})
+        else:
+            images.append(image)
+            decoded.append(path)
+
+    if images:
+        try:
+            results = _predict(images, decoded)
+        except Exception as e:
+            return rows + [{'image': path, 'error': f"Prediction failed: {e}"} for path in decoded]
+
+        for path, image, result in zip(decoded, images, results):
+            row = {
+                'image': path,
+                'width': image.shape[1],
+                'height': image.shape[0],
+                'detections': result_to_detections(result),
+                'output': None,
+                'error': None,
+            }
+            if _options['render']:
+                output_path = output_path_for(path, _options)
+                try:
+                    output_path.parent.mkdir(parents=True, exist_ok=True)
+                    result.save(str(output_path))
+                    row['output'] = str(output_path)
+                except Exception as e:
+                    row['error'] = f"Failed to save prediction result to {output_path}: {e}"
+            rows.append(row)
+    return rows
+
+
+class JsonlWriter:
+    """Appends one JSON line per image and flushes, so an interrupted run loses nothing written."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def completed(self) -> set:
+        done = set()
+        if not os.path.exists(self.path):
+            return done
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # A torn last line from a killed run; that image is redone
+                    continue
+                if not row.get('error'):
+                    done.add(row['image'])
+        return done
+
+    def __enter__(self):
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'a')
+        return self
+
+    def write(self, row: dict) -> None:
+        self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+    def __exit__(self, *exc):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes rows as numbered part files in a directory.
+
+    Parquet files cannot be appended to, so each run adds new parts of at most
+    ``rows_per_part`` rows; resuming reads the ``image`` column of every part.
+    """
+
+    def __init__(self, path: str, rows_per_part: int = PARQUET_ROWS_PER_PART):
+        try:
+            import pandas as pd
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise RuntimeError("Parquet output requires pandas and pyarrow; use a .jsonl results path instead")
+        self._pd = pd
+        self.path = path
+        self.rows_per_part = rows_per_part
+        self._rows = []
+
+    def _parts(self) -> list:
+        return sorted(Path(self.path).glob('part-*.parquet'))
+
+    def completed(self) -> set:
+        done = set()
+        for part in self._parts():
+            frame = self._pd.read_parquet(part, columns=['image', 'error'])
+            done.update(frame.loc[frame['error'].isna(), 'image'])
+        return done
+
+    def __enter__(self):
+        Path(self.path).mkdir(parents=True, exist_ok=True)
+        self._next_part = len(self._parts())
+        return self
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        frame = self._pd.DataFrame(self._rows)
+        frame.to_parquet(Path(self.path) / f"part-{self._next_part:05d}.parquet", index=False)
+        self._next_part += 1
+        self._rows = []
+
+    def write(self, row: dict) -> None:
+        row = dict(row)
+        row.setdefault('detections', [])
+        self._rows.append(row)
+        if len(self._rows) >= self.rows_per_part:
+            self._flush()
+
+    def __exit__(self, *exc):
+        self._flush()
+
+
+def results_writer(path: str):
+    if path.endswith('.parquet'):
+        return ParquetWriter(path)
+    return JsonlWriter(path)
+
+
+def run_batch(inputs: list, results_path: str, model_path: str = 'best.pt', output_dir: str = 'output',
+              manifest: str = None, workers: int = 1, batch_size: int = BATCH_SIZE, render: bool = True,
+              resume: bool = True, tiled: bool = False, tile_size: int = TILE_SIZE,
+              tile_overlap: float = TILE_OVERLAP, skip_threshold: float = TILE_SKIP_THRESHOLD,
+              backend: str = 'pytorch', int8: bool = False, threads: int = 0,
+              calibration_dir: str = INT8_CALIBRATION_DIR) -> dict:
+    """Runs the model over every input image across ``workers`` processes.
+
+    Each worker loads the model once and takes ``batch_size`` images at a time;
+    the parent is the only writer of ``results_path``. Images already recorded
+    without an error are skipped when ``resume`` is set. Rendered outputs keep
+    their path relative to the inputs' common directory. A model that fails
+    to load in the workers raises RuntimeError here.
+    """
+    if not os.path.exists(model_path):
+        raise RuntimeError(f"Model file not found: {model_path}")
+    paths = expand_inputs(inputs, manifest)
+    # Taken before resume filtering, so a resumed run writes outputs to the same places
+    input_root = os.path.commonpath([os.path.dirname(path) for path in paths]) if paths else '.'
+    writer = results_writer(results_path)
+    skipped = 0
+    if resume:
+        done = writer.completed()
+        remaining = [path for path in paths if path not in done]
+        skipped = len(paths) - len(remaining)
+        paths = remaining
+
+    if render:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    options = {
+        'tiled': tiled,
+        'tile_size': tile_size,
+        'tile_overlap': tile_overlap,
+        'skip_threshold': skip_threshold,
+        'render': render,
+        'output_dir': output_dir,
+        'input_root': input_root,
+        'backend': backend,
+        'int8': int8,
+        'threads': threads,
+        'calibration_dir': calibration_dir,
+    }
+    if backend != 'pytorch' and paths:
+        # Export once up front rather than having every worker queue on the export lock
+        export_model(model_path, backend, int8=int8, calibration_dir=calibration_dir, export_dir=EXPORT_DIR)
+    batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)]
+
+    processed = failed = 0
+    start = time.perf_counter()
+    with writer:
+        if batches:
+            workers = max(1, min(workers, len(batches)))
+            with multiprocessing.get_context('spawn').Pool(workers, initializer=_init_worker,
+                                                           initargs=(model_path, options)) as pool:
+                for rows in pool.imap_unordered(_process_batch, batches):
+                    for row in rows:
+                        writer.write(row)
+                        processed += 1
+                        failed += bool(row.get('error'))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'processed': processed,
+        'failed': failed,
+        'skipped': skipped,
+        'seconds': elapsed,
+        'images_per_second': processed / elapsed if elapsed > 0 else 0.0,
+    }
@@ -1,73 +1,116 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 import os
+from metrics_loader import discover_runs, load_run, downsample
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+# Extra run directories to offer, separated by os.pathsep (e.g. a live runs/detect/train folder)
+DEFAULT_RUN_DIRS = [os.path.join(script_dir, 'statistics_plots')] + [
+    d for d in os.getenv('TRAINING_RUN_DIRS', '').split(os.pathsep) if d
+]
+RAW_ROWS = 100
+
+LOSS_COLUMNS = {
+    'train/box_loss': 'Train Box Loss',
+    'train/cls_loss': 'Train Class Loss',
+    'train/dfl_loss': 'Train DFL Loss',
+    'val/box_loss': 'Val Box Loss',
+    'val/cls_loss': 'Val Class Loss',
+    'val/dfl_loss': 'Val DFL Loss',
+}
+METRIC_COLUMNS = {
+    'metrics/precision(B)': 'Precision',
+    'metrics/recall(B)': 'Recall',
+    'metrics/mAP50(B)': 'mAP50',
+    'metrics/mAP50-95(B)': 'mAP50-95',
+}
+LR_COLUMNS = {'lr/pg0': 'lr/pg0', 'lr/pg1': 'lr/pg1', 'lr/pg2': 'lr/pg2'}
+
+
+@st.cache_resource
+def get_run(path):
+    # One incremental reader per file, shared across reruns and sessions
+    return load_run(path)
+
+
+def run_label(path):
+    return os.path.relpath(path, script_dir) if path.startswith(script_dir) else path
+
+
+def line_chart(runs, columns, title, yaxis_title):
+    fig = go.Figure()
+    for label, data in runs.items():
+        for column, name in columns.items():
+            if column not in data:
+                continue
+            x, y = downsample(data['epoch'], data[column])
+            fig.add_trace(go.Scatter(x=x, y=y, mode='lines', name=name if len(runs) == 1 else f"{label}: {name}"))
+    fig.update_layout(title=title, xaxis_title='Epoch', yaxis_title=yaxis_title)
+    st.plotly_chart(fig)
+
 
 def create_dashboard():
     st.title("Wind Turbine Defect Detection Model Training Dashboard")
 
-    # Load data from CSV file
-    @st.cache_data
-    def load_data():
-        file_path = 'statistics_plots/results.csv' 
-        if not os.path.exists(file_path):
-            st.error(f"File not found: {file_path}")
-            return None
-        try:
-            data = pd.read_csv(file_path)
-            return data
-        except Exception as e:
-            st.error(f"Error reading CSV file: {str(e)}")
-            return None
-
-    data = load_data()
-
-    if data is None:
+    run_dirs = st.text_area("Run directories (one per line)", "\n".join(DEFAULT_RUN_DIRS))
+    paths = discover_runs([d.strip() for d in run_dirs.splitlines() if d.strip()])
+    if not paths:
+        st.error("No results.csv or TensorBoard event files found in the given directories")
         st.stop()
 
-    # Display summary statistics
-    st.header("Training Summary")
-    col1, col2, col3, col4 = st.columns(4)
-    col1.metric("Total Epochs", data['epoch'].max())
-    col2.metric("Final mAP50-95", f"{data['metrics/mAP50-95(B)'].iloc[-1]:.4f}")
-    col3.metric("Best mAP50-95", f"{data['metrics/mAP50-95(B)'].max():.4f}")
-    col4.metric("Training Time", f"{data['time'].iloc[-1]/3600:.2f} hours")
-
-    # Create interactive charts
-    st.header("Training Progress")
-
-    # Loss curves
-    st.subheader("Loss Curves")
-    loss_fig = go.Figure()
-    loss_fig.add_trace(go.Scatter(x=data['epoch'], y=data['train/box_loss'], mode='lines', name='Train Box Loss'))
-    loss_fig.add_trace(go.Scatter(x=data['epoch'], y=data['train/cls_loss'], mode='lines', name='Train Class Loss'))
-    loss_fig.add_trace(go.Scatter(x=data['epoch'], y=data['train/dfl_loss'], mode='lines', name='Train DFL Loss'))
-    loss_fig.add_trace(go.Scatter(x=data['epoch'], y=data['val/box_loss'], mode='lines', name='Val Box Loss'))
-    loss_fig.add_trace(go.Scatter(x=data['epoch'], y=data['val/cls_loss'], mode='lines', name='Val Class Loss'))
-    loss_fig.add_trace(go.Scatter(x=data['epoch'], y=data['val/dfl_loss'], mode='lines', name='Val DFL Loss'))
-    loss_fig.update_layout(title='Training and Validation Losses', xaxis_title='Epoch', yaxis_title='Loss')
-    st.plotly_chart(loss_fig)
-
-    # Metrics
-    st.subheader("Performance Metrics")
-    metrics_fig = go.Figure()
-    metrics_fig.add_trace(go.Scatter(x=data['epoch'], y=data['metrics/precision(B)'], mode='lines', name='Precision'))
-    metrics_fig.add_trace(go.Scatter(x=data['epoch'], y=data['metrics/recall(B)'], mode='lines', name='Recall'))
-    metrics_fig.add_trace(go.Scatter(x=data['epoch'], y=data['metrics/mAP50(B)'], mode='lines', name='mAP50'))
-    metrics_fig.add_trace(go.Scatter(x=data['epoch'], y=data['metrics/mAP50-95(B)'], mode='lines', name='mAP50-95'))
-    metrics_fig.update_layout(title='Training Metrics', xaxis_title='Epoch', yaxis_title='Value')
-    st.plotly_chart(metrics_fig)
-
-    # Learning Rate
-    st.subheader("Learning Rate")
-    lr_fig = px.line(data, x='epoch', y=['lr/pg0', 'lr/pg1', 'lr/pg2'], title='Learning Rate Schedule')
-    lr_fig.update_layout(xaxis_title='Epoch', yaxis_title='Learning Rate')
-    st.plotly_chart(lr_fig)
-
-    # Display raw data
-    st.header("Raw Training Data")
-    st.dataframe(data)
+    selected = st.multiselect("Runs", paths, default=paths[:1], format_func=run_label)
+    live = st.checkbox("Follow live training (refresh every 10s)")
+    if not selected:
+        st.info("Select at least one run to compare.")
+        return
+
+    @st.fragment(run_every=10 if live else None)
+    def show_runs():
+        runs = {}
+        for path in selected:
+            try:
+                data = get_run(path).refresh()
+            except Exception as e:
+                st.error(f"Error reading {run_label(path)}: {str(e)}")
+                continue
+            if not data.empty and 'epoch' in data:
+                runs[run_label(path)] = data
+        if not runs:
+            st.warning("The selected runs have no epochs logged yet.")
+            return
+
+        # Display summary statistics
+        st.header("Training Summary")
+        for label, data in runs.items():
+            if len(runs) > 1:
+                st.subheader(label)
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Total Epochs", int(data['epoch'].max()))
+            if 'metrics/mAP50-95(B)' in data:
+                col2.metric("Final mAP50-95", f"{data['metrics/mAP50-95(B)'].iloc[-1]:.4f}")
+                col3.metric("Best mAP50-95", f"{data['metrics/mAP50-95(B)'].max():.4f}")
+            if 'time' in data:
+                col4.metric("Training Time", f"{data['time'].iloc[-1]/3600:.2f} hours")
+
+        # Create interactive charts
+        st.header("Training Progress")
+
+        st.subheader("Loss Curves")
+        line_chart(runs, LOSS_COLUMNS, 'Training and Validation Losses', 'Loss')
+
+        st.subheader("Performance Metrics")
+        line_chart(runs, METRIC_COLUMNS, 'Training Metrics', 'Value')
+
+        st.subheader("Learning Rate")
+        line_chart(runs, LR_COLUMNS, 'Learning Rate Schedule', 'Learning Rate')
+
+        # Only the latest epochs; the full series is already in the charts
+        with st.expander("Raw Training Data"):
+            for label, data in runs.items():
+                st.caption(f"{label}: last {min(RAW_ROWS, len(data))} of {len(data)} epochs")
+                st.dataframe(data.tail(RAW_ROWS))
+
+    show_runs()
 
 if __name__ == "__main__":
     create_dashboard()
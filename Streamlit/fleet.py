@@ -0,0 +1,79 @@
+# fleet.py
+import os
+import json
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+import plotly.graph_objects as go
+import streamlit as st
+
+# The React app's Flask backend, which serves the rollup-backed summary
+API_URL = os.getenv('WINDSIGHT_API_URL', 'http://localhost:5000')
+SUMMARY_TTL = 60
+DEFAULT_DAYS = 90
+
+
+@st.cache_data(ttl=SUMMARY_TTL, show_spinner=False)
+def fetch_summary(params):
+    # params is a tuple of (name, value) pairs so it can be part of the cache key
+    query = urllib.parse.urlencode([(name, value) for name, value in params if value not in (None, '')])
+    with urllib.request.urlopen(f"{API_URL}/api/defects/summary?{query}", timeout=10) as response:
+        return json.load(response)
+
+
+def defect_summary_panel():
+    """Defects per class per period from the backend's rollup tables, for one user or the whole fleet."""
+    st.header("Fleet Defect Summary")
+
+    col1, col2, col3 = st.columns(3)
+    period = col1.selectbox("Group by", ["week", "day"], key="fleet_period")
+    user_id = col2.text_input("User ID (blank for all users)", key="fleet_user")
+    dates = col3.date_input("Date range", (date.today() - timedelta(days=DEFAULT_DAYS), date.today()),
+                            key="fleet_dates")
+    if len(dates) != 2:
+        st.info("Pick a start and an end date.")
+        return
+    start, end = dates
+    user_id = user_id.strip()
+    if user_id and not user_id.isdigit():
+        # The API ignores a user_id it cannot parse and would quietly show fleet totals instead
+        st.error("User ID must be a number, or blank for all users.")
+        return
+
+    try:
+        summary = fetch_summary((
+            ('period', period),
+            ('user_id', user_id),
+            ('start_date', start.isoformat()),
+            # The API's end date is exclusive; the picker's is inclusive
+            ('end_date', (end + timedelta(days=1)).isoformat()),
+        ))
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        st.warning(f"Could not load the defect summary from {API_URL}: {e}")
+        return
+
+    analyses = summary['total_analyses']
+    with_detections = sum(entry['with_detections'] for entry in summary['analyses'])
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Detections", summary['total_detections'])
+    col2.metric("Images Analyzed", analyses)
+    col3.metric("Images With Defects", f"{with_detections / analyses:.1%}" if analyses else "–")
+    if not summary['series']:
+        st.info("No detections in this range.")
+        return
+
+    fig = go.Figure()
+    for class_name in summary['by_class']:
+        points = [entry for entry in summary['series'] if entry['class_name'] == class_name]
+        fig.add_trace(go.Bar(x=[entry['period_start'] for entry in points],
+                             y=[entry['detections'] for entry in points], name=class_name))
+    fig.update_layout(barmode='stack', title=f"Detections per {period} by class",
+                      xaxis_title=period.capitalize(), yaxis_title='Detections')
+    st.plotly_chart(fig)
+
+    buckets = summary['by_confidence']
+    fig = go.Figure(go.Bar(x=[f"{b['min_confidence']:.1f}–{b['max_confidence']:.1f}" for b in buckets],
+                           y=[b['detections'] for b in buckets]))
+    fig.update_layout(title='Detections by confidence', xaxis_title='Confidence', yaxis_title='Detections')
+    st.plotly_chart(fig)
@@ -0,0 +1,71 @@
+# gallery.py
+import io
+import os
+import streamlit as st
+from PIL import Image
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+THUMBNAIL_SIZE = 480
+PAGE_SIZE = 12
+
+
+@st.cache_data(show_spinner=False)
+def list_images(full_path, mtime):
+    # Adding or removing a file bumps the directory mtime, which is part of the cache key
+    entries = []
+    for entry in os.scandir(full_path):
+        if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS):
+            entries.append((entry.name, entry.stat().st_mtime))
+    return sorted(entries)
+
+
+@st.cache_data(show_spinner=False, max_entries=1024)
+def thumbnail(path, mtime, size=THUMBNAIL_SIZE):
+    # Built only for the page being shown; a rewritten file gets a new mtime and a new thumbnail
+    with Image.open(path) as img:
+        img.draft('RGB', (size, size))  # lets JPEG decode at a reduced scale
+        img = img.convert('RGB')
+        img.thumbnail((size, size))
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def image_gallery(directory, key, columns=3, page_size=PAGE_SIZE):
+    """Shows one page of thumbnails from ``directory``; returns False if it has no images.
+
+    The full-resolution file is only sent when the user picks it with "View".
+    """
+    if not os.path.exists(directory):
+        st.warning(f"Directory '{directory}' not found. Please check the path.")
+        return False
+
+    images = list_images(directory, os.stat(directory).st_mtime)
+    if not images:
+        return False
+
+    pages = (len(images) + page_size - 1) // page_size
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    page_images = images[(page - 1) * page_size:page * page_size]
+
+    selected = st.session_state.get(f"{key}_selected")
+    if selected in dict(images):
+        st.image(os.path.join(directory, selected), use_column_width=True, caption=selected)
+        if st.button("Close", key=f"{key}_close"):
+            st.session_state.pop(f"{key}_selected")
+            st.rerun()
+
+    cols = st.columns(columns)
+    for idx, (filename, mtime) in enumerate(page_images):
+        col = cols[idx % columns]
+        try:
+            col.image(thumbnail(os.path.join(directory, filename), mtime), use_column_width=True, caption=filename)
+        except Exception as e:
+            col.warning(f"Could not load {filename}: {e}")
+            continue
+        if col.button("View", key=f"{key}_view_{filename}"):
+            st.session_state[f"{key}_selected"] = filename
+            st.rerun()
+    return True
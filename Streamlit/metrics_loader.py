@@ -0,0 +1,223 @@
+# metrics_loader.py
+import os
+import csv
+import glob
+import struct
+import threading
+import numpy as np
+import pandas as pd
+
+EVENTS_PATTERN = 'events.out.tfevents.*'
+# Graph and image summaries can be hundreds of KB; scalar events are a few dozen bytes
+MAX_EVENT_RECORD = 64 * 1024
+MAX_PLOT_POINTS = 500
+
+
+class CsvTail:
+    """Reads an Ultralytics results.csv incrementally as training appends epochs.
+
+    Only bytes past the last read offset are read on each refresh; a trailing
+    line without a newline is held back until it is complete. If the file
+    shrinks or is replaced, it is read again from the start.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.columns = None
+        self._inode = None
+        self._partial = b''
+        self._frame = pd.DataFrame()
+
+    def refresh(self):
+        with self._lock:
+            stat = os.stat(self.path)
+            if stat.st_ino != self._inode or stat.st_size < self.offset:
+                self._reset()
+                self._inode = stat.st_ino
+            if stat.st_size == self.offset:
+                return self._frame
+
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                chunk = f.read(stat.st_size - self.offset)
+            self.offset += len(chunk)
+            lines = (self._partial + chunk).split(b'\n')
+            self._partial = lines.pop()
+
+            rows = []
+            for values in csv.reader(line.decode('utf-8', 'replace') for line in lines if line.strip()):
+                values = [value.strip() for value in values]
+                if self.columns is None:
+                    self.columns = values
+                    continue
+                rows.append([pd.to_numeric(value, errors='coerce') for value in values])
+            if rows:
+                new = pd.DataFrame(rows, columns=self.columns)
+                self._frame = new if self._frame.empty else pd.concat([self._frame, new], ignore_index=True)
+            return self._frame
+
+
+def _varint(buf, pos):
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _fields(buf):
+    # Minimal protobuf wire-format reader: yields (field number, wire type, raw value)
+    pos = 0
+    while pos < len(buf):
+        key, pos = _varint(buf, pos)
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _varint(buf, pos)
+        elif wire_type == 1:
+            value, pos = buf[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _varint(buf, pos)
+            value, pos = buf[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = buf[pos:pos + 4], pos + 4
+        else:
+            return
+        yield number, wire_type, value
+
+
+def _tensor_scalar(buf):
+    # TensorProto: float_val (5), double_val (6), or raw tensor_content (4) with dtype (1)
+    dtype = 1
+    for number, wire_type, value in _fields(buf):
+        if number == 1 and wire_type == 0:
+            dtype = value
+        elif number == 5:
+            return struct.unpack('<f', value[:4])[0]
+        elif number == 6:
+            return struct.unpack('<d', value[:8])[0]
+        elif number == 4 and value:
+            return struct.unpack('<d', value[:8])[0] if dtype == 2 else struct.unpack('<f', value[:4])[0]
+    return None
+
+
+def parse_scalar_event(record):
+    """Returns (wall_time, step, [(tag, value), ...]) for an Event record, without TensorFlow."""
+    wall_time, step, scalars = 0.0, 0, []
+    for number, wire_type, value in _fields(record):
+        if number == 1 and wire_type == 1:
+            wall_time = struct.unpack('<d', value)[0]
+        elif number == 2 and wire_type == 0:
+            step = value
+        elif number == 5 and wire_type == 2:
+            for summary_field, _, summary_value in _fields(value):
+                if summary_field != 1:
+                    continue
+                tag, scalar = None, None
+                for value_field, value_type, raw in _fields(summary_value):
+                    if value_field == 1:
+                        tag = raw.decode('utf-8', 'replace')
+                    elif value_field == 2 and value_type == 5:
+                        scalar = struct.unpack('<f', raw)[0]
+                    elif value_field == 8:
+                        scalar = _tensor_scalar(raw)
+                if tag is not None and scalar is not None:
+                    scalars.append((tag, scalar))
+    return wall_time, step, scalars
+
+
+class EventsTail:
+    """Streams scalar summaries out of a TensorBoard events file.
+
+    Records are read one at a time from the last complete offset, so a file
+    still being written is picked up where it left off. Records larger than
+    ``MAX_EVENT_RECORD`` (graphs, images) are skipped without being read.
+    The frame has one row per step with ``epoch`` (the step) and ``time``
+    (seconds since the first event), matching the results.csv layout.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self._start_time = None
+        self._rows = {}
+        self._frame = pd.DataFrame()
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        with self._lock:
+            size = os.path.getsize(self.path)
+            if size < self.offset:
+                self.offset, self._start_time, self._rows = 0, None, {}
+            if size == self.offset:
+                return self._frame
+
+            changed = False
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                while True:
+                    header = f.read(12)
+                    if len(header) < 12:
+                        break
+                    length = struct.unpack('<Q', header[:8])[0]
+                    if self.offset + 12 + length + 4 > size:
+                        break  # record still being written
+                    if length > MAX_EVENT_RECORD:
+                        f.seek(length + 4, os.SEEK_CUR)
+                    else:
+                        wall_time, step, scalars = parse_scalar_event(f.read(length))
+                        f.seek(4, os.SEEK_CUR)
+                        if self._start_time is None and wall_time:
+                            self._start_time = wall_time
+                        if scalars:
+                            row = self._rows.setdefault(step, {'epoch': step})
+                            row['time'] = wall_time - (self._start_time or wall_time)
+                            row.update(scalars)
+                            changed = True
+                    self.offset += 12 + length + 4
+
+            if changed:
+                self._frame = pd.DataFrame([self._rows[step] for step in sorted(self._rows)])
+            return self._frame
+
+
+def load_run(path):
+    return EventsTail(path) if os.path.basename(path).startswith('events.out.tfevents') else CsvTail(path)
+
+
+def discover_runs(directories):
+    """Finds results.csv and TensorBoard event files in each directory and one level below."""
+    runs = []
+    for directory in directories:
+        for pattern in ('results.csv', EVENTS_PATTERN, os.path.join('*', 'results.csv'),
+                        os.path.join('*', EVENTS_PATTERN)):
+            runs.extend(sorted(glob.glob(os.path.join(directory, pattern))))
+    return list(dict.fromkeys(runs))
+
+
+def downsample(x, y, max_points=MAX_PLOT_POINTS):
+    """Largest-Triangle-Three-Buckets: keeps the visual shape of a long series in ``max_points``."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    mask = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[mask], y[mask]
+    if len(x) <= max_points or max_points < 3:
+        return x, y
+
+    keep = [0]
+    edges = np.linspace(1, len(x) - 1, max_points - 1).astype(int)
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else len(x)
+        avg_x, avg_y = x[end:next_end].mean(), y[end:next_end].mean()
+        prev = keep[-1]
+        areas = np.abs((x[prev] - avg_x) * (y[start:end] - y[prev]) - (x[prev] - x[start:end]) * (avg_y - y[prev]))
+        keep.append(start + int(areas.argmax()))
+    keep.append(len(x) - 1)
+    return x[keep], y[keep]
@@ -1,22 +1,39 @@
 import argparse
-from ultralytics import YOLO
 import os
+import cv2
 from pathlib import Path
+from batch import run_batch, BATCH_SIZE
+from shared import (
+    load_model, predict_tiled, BACKENDS, INT8_CALIBRATION_DIR, EXPORT_DIR, TILE_SIZE, TILE_OVERLAP,
+    TILE_SKIP_THRESHOLD, TILE_MAX_BATCH_SIZE, TILE_NMS_IOU, TILE_INCLUDE_FULL
+)
 
-def predict_and_save(image_path: str, model_path: str = 'best.pt', output_dir: str = 'output') -> str:
+def predict_and_save(image_path: str, model_path: str = 'best.pt', output_dir: str = 'output',
+                     tiled: bool = False, tile_size: int = TILE_SIZE, tile_overlap: float = TILE_OVERLAP,
+                     skip_threshold: float = TILE_SKIP_THRESHOLD, backend: str = 'pytorch', int8: bool = False,
+                     threads: int = 0, calibration_dir: str = INT8_CALIBRATION_DIR) -> str:
     # Create output directory if it doesn't exist
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
 
     # Load the model
     try:
-        model = YOLO(model_path)
+        model = load_model(model_path, backend=backend, threads=threads, int8=int8,
+                           calibration_dir=calibration_dir, export_dir=EXPORT_DIR)
     except Exception as e:
         raise RuntimeError(f"Failed to load model from {model_path}: {e}")
 
     # Perform prediction
     try:
-        results = model(image_path)
+        if tiled:
+            image = cv2.imread(image_path)
+            if image is None:
+                raise ValueError("could not decode image")
+            results = [predict_tiled(model, image, tile_size=tile_size, overlap=tile_overlap,
+                                     skip_threshold=skip_threshold, max_batch_size=TILE_MAX_BATCH_SIZE,
+                                     nms_iou=TILE_NMS_IOU, include_full=TILE_INCLUDE_FULL, path=image_path)]
+        else:
+            results = model(image_path)
     except Exception as e:
         raise RuntimeError(f"Prediction failed for image {image_path}: {e}")
 
@@ -33,14 +50,55 @@ def predict_and_save(image_path: str, model_path: str = 'best.pt', output_dir: s
 
 def main():
     parser = argparse.ArgumentParser(description="YOLOv11 Prediction Script")
-    parser.add_argument("image_path", help="Path to the input image")
+    parser.add_argument("inputs", nargs="*",
+                        help="Path to the input image; with --results, any number of images, directories or globs")
     parser.add_argument("--model", default="best.pt", help="Path to the YOLO model file")
     parser.add_argument("--output", default="output", help="Output directory for predictions")
+    parser.add_argument("--tiled", action="store_true", help="Run on overlapping tiles for high-resolution images")
+    parser.add_argument("--tile-size", type=int, default=TILE_SIZE, help="Tile size in pixels")
+    parser.add_argument("--tile-overlap", type=float, default=TILE_OVERLAP, help="Fractional overlap between tiles")
+    parser.add_argument("--skip-threshold", type=float, default=TILE_SKIP_THRESHOLD,
+                        help="Texture score below which a tile is treated as background and skipped")
+    parser.add_argument("--backend", choices=BACKENDS, default="pytorch",
+                        help="Inference runtime; onnx and openvino export the model once and cache it")
+    parser.add_argument("--int8", action="store_true", help="Quantize the exported model to INT8")
+    parser.add_argument("--calibration-dir", default=INT8_CALIBRATION_DIR, help="Sample images for INT8 calibration")
+    parser.add_argument("--threads", type=int, default=0, help="Runtime thread count, 0 for the runtime default")
+    parser.add_argument("--results", help="Batch mode: write detections to this .jsonl file or .parquet directory")
+    parser.add_argument("--manifest", help="Batch mode: file listing one image, directory or glob per line")
+    parser.add_argument("--workers", type=int, default=1, help="Batch mode: number of worker processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Batch mode: images per model call")
+    parser.add_argument("--no-render", action="store_true", help="Batch mode: skip writing annotated images")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="Batch mode: reprocess images already present in the results")
     
     args = parser.parse_args()
+
+    if args.results:
+        try:
+            summary = run_batch(args.inputs, args.results, args.model, args.output, manifest=args.manifest,
+                                workers=args.workers, batch_size=args.batch_size, render=not args.no_render,
+                                resume=not args.no_resume, tiled=args.tiled, tile_size=args.tile_size,
+                                tile_overlap=args.tile_overlap, skip_threshold=args.skip_threshold,
+                                backend=args.backend, int8=args.int8, threads=args.threads,
+                                calibration_dir=args.calibration_dir)
+        except Exception as e:
+            print(f"Error: {e}")
+            exit(1)
+        print(f"Processed {summary['processed']} image(s) ({summary['failed']} failed, "
+              f"{summary['skipped']} already done) in {summary['seconds']:.1f}s: "
+              f"{summary['images_per_second']:.2f} images/sec")
+        print(f"Results written to: {args.results}")
+        return
+
+    if len(args.inputs) != 1:
+        parser.error("expected exactly one image path (use --results for batch mode)")
     
     try:
-        saved_path = predict_and_save(args.image_path, args.model, args.output)
+        saved_path = predict_and_save(args.inputs[0], args.model, args.output, tiled=args.tiled,
+                                      tile_size=args.tile_size, tile_overlap=args.tile_overlap,
+                                      skip_threshold=args.skip_threshold, backend=args.backend, int8=args.int8,
+                                      threads=args.threads, calibration_dir=args.calibration_dir)
         print(f"Prediction saved to: {saved_path}")
     except Exception as e:
         print(f"Error: {e}")
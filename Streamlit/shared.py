@@ -0,0 +1,27 @@
+# shared.py
+# The Streamlit tools run the React app backend's inference code rather than a copy of it, so batch
+# and single-image results match what the API produces. The backend's defaults come from its
+# settings.py (and environment); everything that differs here is passed in as an argument.
+import os
+import sys
+
+STREAMLIT_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.join(os.path.dirname(STREAMLIT_DIR), 'React', 'app', 'backend')
+# Appended, so a module in this directory always wins over a backend module of the same name
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from runtimes import load_model, export_model, BACKENDS  # noqa: E402
+from tiling import predict_tiled  # noqa: E402
+
+# Relative to this file, so the tools work from any working directory
+INT8_CALIBRATION_DIR = os.path.join(STREAMLIT_DIR, 'detected_images')
+EXPORT_DIR = os.path.join(STREAMLIT_DIR, 'exports')
+
+# Tiled inference defaults for the Streamlit tools, passed to predict_tiled instead of the backend's settings
+TILE_SIZE = 640
+TILE_OVERLAP = 0.2
+TILE_SKIP_THRESHOLD = 10.0
+TILE_MAX_BATCH_SIZE = 16
+TILE_NMS_IOU = 0.5
+TILE_INCLUDE_FULL = True